@@ -0,0 +1,2 @@
+# healthflow/__init__.py
+# Shared, Streamlit-free building blocks used by app.py and the scripts in pages/
@@ -0,0 +1,180 @@
+# alerts.py
+# Streaming toxicity alert rules — evaluates vitals, lab and symptom events per patient
+# State per patient is fixed-size (last infusion, per-rule cooldown and small ring buffers),
+# so memory stays constant no matter how long the event stream runs.
+
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+# ----------------- Events & alerts -----------------
+@dataclass(slots=True)
+class Event:
+    patient_id: str
+    ts: datetime
+    kind: str                 # "vital" | "lab" | "symptom" | "infusion"
+    name: str                 # e.g. "temperatura", "neutrofilos", "hemorragia"
+    value: float = 1.0
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Event":
+        ts = d["ts"]
+        if not isinstance(ts, datetime):
+            ts = datetime.fromisoformat(str(ts))
+        return cls(
+            patient_id=str(d["patient_id"]),
+            ts=ts,
+            kind=d["kind"],
+            name=d["name"],
+            value=float(d.get("value", 1.0)),
+        )
+
+@dataclass(slots=True)
+class Alert:
+    patient_id: str
+    ts: datetime
+    rule: str
+    severity: str             # "alta" | "critica"
+    message: str
+    value: float
+
+# ----------------- Rules -----------------
+@dataclass
+class Rule:
+    """Fires when `predicate(value)` holds for an event of (kind, name).
+
+    Optional refinements, all O(1) state per patient:
+      - window_days: only active between day +a and +b after the last infusion
+      - count/within: needs `count` matching events inside `within` (ring buffer)
+      - cooldown: suppress repeats for the same patient
+    """
+    id: str
+    kind: str
+    names: tuple
+    predicate: Callable[[float], bool]
+    severity: str
+    message: str
+    window_days: Optional[tuple] = None
+    count: int = 1
+    within: timedelta = timedelta(hours=1)
+    cooldown: timedelta = timedelta(hours=6)
+
+DEFAULT_RULES: List[Rule] = [
+    Rule(
+        id="febre_neutropenia",
+        kind="vital", names=("temperatura",), predicate=lambda v: v >= 38.0,
+        window_days=(7, 14), severity="critica",
+        message="Febre ≥ 38°C na janela de neutropenia prevista (Dias +7 a +14) — suspeita de neutropenia febril.",
+    ),
+    Rule(
+        id="febre",
+        kind="vital", names=("temperatura",), predicate=lambda v: v >= 38.0,
+        severity="alta", message="Febre ≥ 38°C — contactar imediatamente a equipa.",
+    ),
+    Rule(
+        id="neutropenia_g4",
+        kind="lab", names=("neutrofilos",), predicate=lambda v: v < 0.5,
+        severity="critica", message="Neutrófilos < 0,5 ×10⁹/L (neutropenia G4).",
+    ),
+    Rule(
+        id="hemorragia",
+        kind="symptom", names=("hemorragia",), predicate=lambda v: v > 0,
+        severity="critica", message="Hemorragia ativa reportada — contactar imediatamente a equipa.",
+        cooldown=timedelta(hours=1),
+    ),
+    Rule(
+        id="dor_nao_controlada",
+        kind="symptom", names=("dor",), predicate=lambda v: v >= 7,
+        count=2, within=timedelta(hours=4),
+        severity="alta", message="Dor não controlada (≥ 7/10 em 2 registos em 4h).",
+    ),
+    Rule(
+        id="dispneia",
+        kind="symptom", names=("dispneia",), predicate=lambda v: v > 0,
+        severity="alta", message="Falta de ar reportada — contactar a equipa.",
+    ),
+]
+
+# ----------------- Per-patient state -----------------
+class _PatientState:
+    __slots__ = ("last_infusion", "last_fired", "buffers")
+
+    def __init__(self):
+        self.last_infusion: Optional[datetime] = None
+        self.last_fired: Dict[str, datetime] = {}
+        self.buffers: Dict[str, Deque[datetime]] = {}
+
+# ----------------- Engine -----------------
+class AlertEngine:
+    """Incremental rules engine: feed events in timestamp order, get alerts back."""
+
+    def __init__(self, rules: Optional[List[Rule]] = None):
+        self.rules = list(rules or DEFAULT_RULES)
+        # Index rules by (kind, name) so each event only touches the rules that can match it
+        self._index: Dict[tuple, List[Rule]] = {}
+        for r in self.rules:
+            for n in r.names:
+                self._index.setdefault((r.kind, n), []).append(r)
+        self._state: Dict[str, _PatientState] = {}
+        self.events_seen = 0
+
+    def process(self, ev: Event) -> List[Alert]:
+        self.events_seen += 1
+        state = self._state.get(ev.patient_id)
+        if state is None:
+            state = self._state[ev.patient_id] = _PatientState()
+
+        if ev.kind == "infusion":
+            state.last_infusion = ev.ts
+            return []
+
+        out: List[Alert] = []
+        windowed_fired = False
+        for rule in self._index.get((ev.kind, ev.name), ()):
+            if not rule.predicate(ev.value):
+                continue
+            if rule.window_days is not None:
+                if state.last_infusion is None:
+                    continue
+                day = (ev.ts - state.last_infusion).total_seconds() / 86400
+                if not (rule.window_days[0] <= day <= rule.window_days[1]):
+                    continue
+            elif windowed_fired:
+                # A more specific windowed alert already covers this event
+                continue
+            if rule.count > 1:
+                buf = state.buffers.get(rule.id)
+                if buf is None:
+                    buf = state.buffers[rule.id] = deque(maxlen=rule.count)
+                buf.append(ev.ts)
+                if len(buf) < rule.count or ev.ts - buf[0] > rule.within:
+                    continue
+            last = state.last_fired.get(rule.id)
+            if last is not None and ev.ts - last < rule.cooldown:
+                continue
+            state.last_fired[rule.id] = ev.ts
+            windowed_fired = windowed_fired or rule.window_days is not None
+            out.append(Alert(ev.patient_id, ev.ts, rule.id, rule.severity, rule.message, ev.value))
+        return out
+
+    def run(self, events: Iterable[Event]) -> Iterator[Alert]:
+        """Consume a (possibly unbounded) event stream lazily."""
+        for ev in events:
+            yield from self.process(ev)
+
+    @property
+    def n_patients(self) -> int:
+        return len(self._state)
+
+
+def demo_events(patient_id: str, last_infusion: datetime) -> List[Event]:
+    """Illustrative stream for the dashboard placeholder patient."""
+    t0 = last_infusion
+    return [
+        Event(patient_id, t0, "infusion", "ddAC"),
+        Event(patient_id, t0 + timedelta(days=2, hours=8), "vital", "temperatura", 37.1),
+        Event(patient_id, t0 + timedelta(days=5), "symptom", "dor", 3),
+        Event(patient_id, t0 + timedelta(days=9, hours=20), "vital", "temperatura", 38.3),
+        Event(patient_id, t0 + timedelta(days=10), "lab", "neutrofilos", 0.9),
+    ]
@@ -0,0 +1,447 @@
+# analysis.py
+# Condition analysis with Gemini — response models, prompt and the ChatModel/ChatSession pair
+# used by pages/general.py. No Streamlit imports, so background workers can use it too.
+# google-genai is imported lazily, on the first real API call (see _LazyClient).
+
+import hashlib, os, json, re, threading, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError, create_model
+from dotenv import load_dotenv
+
+from healthflow.results import deep_sizeof
+from healthflow.routing import Cancelled, CircuitOpen, InvalidResponse, ModelRouter, cancellable, current_token
+from healthflow.tokens import MAX_OUTPUT_TOKENS, TOKEN_LEDGER
+
+if TYPE_CHECKING:   # annotations only; the real import stays lazy
+    from google.genai import types
+
+load_dotenv()
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+
+# Tiers: fast model first, a different model when it keeps failing validation
+FAST_MODEL = os.getenv("HEALTHFLOW_FAST_MODEL", "gemini-2.0-flash-exp")
+FALLBACK_MODEL = os.getenv("HEALTHFLOW_FALLBACK_MODEL", "gemini-2.5-flash")
+
+# Split each analysis into concurrent section requests (see SECTIONS)
+FAN_OUT = os.getenv("HEALTHFLOW_FAN_OUT", "0") == "1"
+
+class NonMedicalInput(Exception):
+    """The model classified the input as not being a medical condition."""
+
+# ----------------- Pydantic Models -----------------
+class RecommendedTreatment(BaseModel):
+    nome: str
+    quando_por_que: str
+    objetivos: List[str] = Field(min_items=3)
+    consideracoes_chave: List[str] = Field(min_items=3)
+    modalidades_tipicas: List[str] = Field(min_items=2)
+
+class Terapeuticas(BaseModel):
+    radioterapia: str = ""
+    cirurgia: str = ""
+    quimioterapia: str = ""
+
+class MedicalCards(BaseModel):
+    descricao_mecanismos: str
+    sintomas_comuns: List[str] = Field(min_items=5)
+    sintomas_incomuns: List[str] = Field(min_items=4)
+    causas_risco: List[str] = Field(min_items=6)
+    evolucao_natural: str
+    complicacoes: List[str] = Field(min_items=5)
+    recomendadas: List[RecommendedTreatment] = Field(min_items=3, max_items=3)
+    terapeuticas: Terapeuticas = Field(default_factory=Terapeuticas)
+
+# ----------------- Helpers -----------------
+def _normalize_gemini_text(resp) -> str:
+    """Extract text from various Gemini response formats."""
+    text = getattr(resp, "text", None) or getattr(resp, "output_text", None)
+    if not text and getattr(resp, "candidates", None):
+        parts = getattr(resp.candidates[0].content, "parts", []) or []
+        text = "".join(getattr(p, "text", "") for p in parts)
+    if not text:
+        return ""
+    
+    # Clean up markdown code blocks if present
+    text = text.strip()
+    if text.startswith("```json"):
+        text = text[7:]
+    if text.startswith("```"):
+        text = text[3:]
+    if text.endswith("```"):
+        text = text[:-3]
+    text = text.strip()
+    
+    # Extract JSON from response
+    m = re.search(r"\{[\s\S]*\}", text)
+    return m.group(0) if m else text
+
+def _ensure_min_list(lst: List[str], min_len: int, fillers: List[str]) -> List[str]:
+    """Ensure list has minimum number of items."""
+    out = [s for s in lst if s and s.strip()]
+    i = 0
+    while len(out) < min_len and i < len(fillers):
+        out.append(fillers[i]); i += 1
+    return out
+
+# ----------------- Prompt -----------------
+# Static instruction + schema: sent once as a cached context (or system instruction),
+# so each request carries only the condition.
+SYSTEM_INSTRUCTION = """
+You are a clinical assistant. Output ONLY valid JSON (no prose, no markdown, no backticks).
+If the input isn't clearly a medical condition, return: {"error":"non-medical"}
+
+GOALS
+- Fill EVERY field with substantive, safe, evidence-based content.
+- Portuguese (pt-PT). Patient-friendly but clinically accurate. No brand names, no URLs.
+- Use general medical knowledge when specifics are uncertain.
+
+MINIMA & LENGTH
+- descricao_mecanismos: 110–180 palavras (parágrafo coerente de fisiopatologia/mecanismos).
+- evolucao_natural: 70–120 palavras (trajetória temporal; estágios/agravantes/controlo).
+- sintomas_comuns: ≥ 5; sintomas_incomuns: ≥ 4; causas_risco: ≥ 6; complicacoes: ≥ 5.
+- recomendadas: exatamente 3 objetos, cada um com:
+  - nome (específico para a condição)
+  - quando_por_que (2–4 frases; elegibilidade e racional)
+  - objetivos (≥ 3)
+  - consideracoes_chave (≥ 3)
+  - modalidades_tipicas (≥ 2, genéricas) -> isto devem ser as terapêuticas hospitalares, tratamentos, mais frequentemente usados. Ex.: Cancro: Cirugia, Quimioterapia e Radioterapia.
+
+STRICT JSON SCHEMA:
+{
+  "descricao_mecanismos": "string 110–180 palavras",
+  "sintomas_comuns": ["...", "..."],
+  "sintomas_incomuns": ["...", "..."],
+  "causas_risco": ["...", "..."],
+  "evolucao_natural": "string 70–120 palavras",
+  "complicacoes": ["...", "..."],
+  "recomendadas": [
+    {
+      "nome": "string",
+      "quando_por_que": "2–4 frases",
+      "objetivos": ["...", "...", "..."],
+      "consideracoes_chave": ["...", "...", "..."],
+      "modalidades_tipicas": ["...", "..."]
+    },
+    { "nome": "...", "quando_por_que": "...", "objetivos": ["..."], "consideracoes_chave": ["..."], "modalidades_tipicas": ["..."] },
+    { "nome": "...", "quando_por_que": "...", "objetivos": ["..."], "consideracoes_chave": ["..."], "modalidades_tipicas": ["..."] }
+  ],
+  "terapeuticas": {
+    "radioterapia": "string",
+    "cirurgia": "string",
+    "quimioterapia": "string"
+  }
+}
+"""
+
+def build_prompt(condition: str) -> str:
+    """Per-request part of the prompt: just the condition."""
+    return f'User condition: "{condition}"'
+
+# ----------------- Sections (fan-out mode) -----------------
+# Independent groups of MedicalCards fields, generated concurrently and merged
+SECTIONS: Dict[str, Tuple[str, ...]] = {
+    "mecanismos": ("descricao_mecanismos", "evolucao_natural"),
+    "sintomas": ("sintomas_comuns", "sintomas_incomuns"),
+    "riscos": ("causas_risco", "complicacoes"),
+    "tratamentos": ("recomendadas", "terapeuticas"),
+}
+
+# One model per section, reusing the MedicalCards field definitions (and their minima)
+SECTION_MODELS = {
+    name: create_model(f"Section_{name}", **{f: (MedicalCards.model_fields[f].annotation, MedicalCards.model_fields[f]) for f in fields})
+    for name, fields in SECTIONS.items()
+}
+
+def build_section_prompt(condition: str, section: str) -> str:
+    return (f'User condition: "{condition}"\n'
+            f"Return ONLY these fields of the schema: {', '.join(SECTIONS[section])}.")
+
+# ----------------- Content versioning -----------------
+# Hash of everything that shapes an analysis besides the model: instruction, prompt
+# templates and response schema. Cached analyses are tagged "<prompt hash>:<model id>";
+# editing any of these (or switching models) makes them stale, see healthflow.revalidate.
+PROMPT_VERSION = hashlib.sha1("\n".join([
+    SYSTEM_INSTRUCTION,
+    build_prompt("{condition}"),
+    *(build_section_prompt("{condition}", s) for s in SECTIONS),
+    json.dumps(MedicalCards.model_json_schema(), sort_keys=True),
+]).encode("utf-8")).hexdigest()[:10]
+
+def content_version(model_id: str) -> str:
+    return f"{PROMPT_VERSION}:{model_id}"
+
+def _ledger_key(model: str, section: Optional[str]) -> str:
+    return f"{model}#{section}" if section else model
+
+_SECTION_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="section")
+
+class InstructionCache:
+    """SYSTEM_INSTRUCTION as an explicit cached context, one per model, refreshed before expiry.
+
+    Models/accounts that refuse caching (e.g. below the minimum context size) fall back to
+    a plain system instruction, which still benefits from implicit prefix caching.
+    Set HEALTHFLOW_CONTEXT_CACHE=0 to always use the system instruction.
+    """
+
+    def __init__(self, client: Any, ttl_s: int = 3600):
+        self.client = client
+        self.ttl_s = ttl_s
+        self.enabled = os.getenv("HEALTHFLOW_CONTEXT_CACHE", "1") != "0"
+        self._caches: Dict[str, Tuple[Optional[str], float]] = {}   # model -> (cache name | None, expires)
+        self._lock = threading.Lock()
+
+    def _cache_name(self, model: str) -> Optional[str]:
+        if not self.enabled or self.client is None:
+            return None
+        with self._lock:
+            name, expires = self._caches.get(model, (None, 0.0))
+            if time.time() < expires - 60:
+                return name
+            try:
+                from google.genai import types
+                cache = self.client.caches.create(model=model, config=types.CreateCachedContentConfig(
+                    system_instruction=SYSTEM_INSTRUCTION,
+                    display_name="healthflow-medicalcards",
+                    ttl=f"{self.ttl_s}s",
+                ))
+                self._caches[model] = (cache.name, time.time() + self.ttl_s)
+            except Exception:
+                # Not cacheable for this model; do not retry for a while
+                self._caches[model] = (None, time.time() + self.ttl_s)
+            return self._caches[model][0]
+
+    def config(self, model: str, max_output_tokens: int) -> "types.GenerateContentConfig":
+        from google.genai import types
+        common = dict(temperature=0.2, max_output_tokens=max_output_tokens, response_mime_type="application/json")
+        name = self._cache_name(model)
+        if name:
+            return types.GenerateContentConfig(cached_content=name, **common)
+        return types.GenerateContentConfig(system_instruction=SYSTEM_INSTRUCTION, **common)
+
+# ----------------- ChatModel & ChatSession -----------------
+class _LazyClient:
+    """genai.Client created — and google-genai imported — on first attribute access."""
+
+    def __init__(self, api_key: str):
+        self._api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    try:
+                        from google import genai
+                        self._client = genai.Client(api_key=self._api_key)
+                    except Exception as e:
+                        raise Exception(f"Erro ao inicializar cliente Gemini: {e}")
+        return getattr(self._client, name)
+
+class ChatModel:
+    """Wrapper around google-genai Client."""
+    def __init__(self, client: Any, model_id: str, fallback_ids: Optional[List[str]] = None):
+        self.client = client
+        self.model_id = model_id
+        self.init_error: Optional[str] = None
+        self.instructions = InstructionCache(client)
+        self.router = ModelRouter(client, [model_id] + [m for m in (fallback_ids or []) if m != model_id])
+
+    @property
+    def version(self) -> str:
+        """Version every cached analysis should have: current prompt on the primary model."""
+        return content_version(self.model_id)
+
+    @classmethod
+    def from_pretrained(cls, model_id: str = FAST_MODEL, fallback_ids: Optional[List[str]] = None):
+        """Initialize model with API key."""
+        fallback_ids = [FALLBACK_MODEL] if fallback_ids is None else fallback_ids
+        if not GEMINI_API_KEY:
+            return cls(client=None, model_id=model_id, fallback_ids=fallback_ids)
+        # The SDK is only imported when the first analysis runs
+        return cls(client=_LazyClient(GEMINI_API_KEY), model_id=model_id, fallback_ids=fallback_ids)
+
+class ChatSession:
+    """Manages conversation with Gemini API."""
+    def __init__(self, model: ChatModel, fan_out: bool = FAN_OUT):
+        self.model = model
+        self.fan_out = fan_out
+        self.last_raw_text: Optional[str] = None
+        self.last_object: Optional[MedicalCards] = None
+        self.last_route: Optional[dict] = None
+        self.last_usage: Optional[dict] = None
+        self.tokens_used = 0   # cumulative input + output tokens, for budget accounting
+        self._usage_lock = threading.Lock()   # fan-out sections parse concurrently
+        # Fan-out progress: called with (fields so far, sections done, sections total)
+        self.on_partial: Optional[Callable[[dict, int, int], None]] = None
+
+    def release_buffers(self) -> None:
+        """Drop per-session copies of the last response (called after inactivity)."""
+        self.last_raw_text = None
+        self.last_object = None
+
+    def buffer_bytes(self) -> int:
+        return deep_sizeof(self.last_raw_text) + deep_sizeof(self.last_object)
+
+    def _parse(self, resp, condition: str, schema=MedicalCards, section: Optional[str] = None):
+        """Validate one raw response; raises InvalidResponse so the router can try another."""
+        self.last_usage = TOKEN_LEDGER.record(resp, key=_ledger_key(resp.model, section))
+        with self._usage_lock:
+            self.tokens_used += self.last_usage["input"] + self.last_usage["output"]
+        text = _normalize_gemini_text(resp).strip()
+        self.last_raw_text = text
+        if self.last_usage["finish_reason"] == "MAX_TOKENS":
+            raise InvalidResponse("resposta truncada (limite de tokens de saída)", text, truncated=True,
+                                  model=getattr(resp, "model", ""))
+        if not text:
+            raise InvalidResponse("resposta vazia")
+        try:
+            return schema.model_validate_json(text)
+        except ValidationError:
+            try:
+                payload = json.loads(text)
+            except ValueError as e:
+                raise InvalidResponse(str(e), text)
+            # Check for error response
+            if isinstance(payload, dict) and payload.get("error") == "non-medical":
+                raise NonMedicalInput(f"'{condition}' não parece ser uma condição médica válida.")
+            try:
+                return schema.model_validate(payload)
+            except ValidationError as e:
+                raise InvalidResponse(str(e), text)
+
+    def analyze(self, condition: str) -> MedicalCards:
+        """Analyze medical condition using Gemini API."""
+        
+        # Check if API client is available
+        if not self.model.client:
+            raise Exception("API Key não configurada. Configure GEMINI_API_KEY no ficheiro .env")
+
+        if self.fan_out:
+            obj = self._analyze_sections(condition)
+        else:
+            obj, self.last_route = self._generate(build_prompt(condition), condition)
+
+        # Post-guards for minima
+        obj.sintomas_comuns = _ensure_min_list(
+            obj.sintomas_comuns, 5, 
+            ["Cansaço persistente", "Intolerância a esforços", "Mal-estar geral"]
+        )
+        obj.sintomas_incomuns = _ensure_min_list(
+            obj.sintomas_incomuns, 4, 
+            ["Sintomas atípicos inespecíficos", "Manifestações raras"]
+        )
+        obj.causas_risco = _ensure_min_list(
+            obj.causas_risco, 6, 
+            ["Exposição ocupacional", "Fatores hormonais", "Predisposição genética"]
+        )
+        obj.complicacoes = _ensure_min_list(
+            obj.complicacoes, 5, 
+            ["Comprometimento funcional prolongado", "Impacto na qualidade de vida"]
+        )
+        
+        # Ensure exactly 3 recommended treatments
+        while len(obj.recomendadas) < 3:
+            obj.recomendadas.append(
+                RecommendedTreatment(
+                    nome="Intervenção terapêutica recomendada",
+                    quando_por_que="Indicada para melhorar controlo sintomático e adesão terapêutica.",
+                    objetivos=["Reduzir sintomas", "Melhorar qualidade de vida", "Prevenir agudizações"],
+                    consideracoes_chave=["Adequar à função orgânica", "Educação do doente", "Seguimento regular"],
+                    modalidades_tipicas=["Plano de autocuidado estruturado", "Revisão farmacoterapêutica"],
+                )
+            )
+
+        self.last_object = obj
+        return obj
+
+    def _analyze_sections(self, condition: str) -> MedicalCards:
+        """Fan-out mode: one sub-request per section, run concurrently and merged.
+
+        Each section retries on its own; a non-medical verdict from any section cancels
+        the rest. Latency is that of the slowest section instead of one long generation.
+        """
+        token = current_token()
+
+        def generate(name: str):
+            with cancellable(token):   # sections run on the pool, under the caller's token
+                return self._generate(build_section_prompt(condition, name), condition, SECTION_MODELS[name], name)
+
+        futures = {_SECTION_POOL.submit(generate, name): name for name in SECTIONS}
+        merged: dict = {}
+        routes: Dict[str, dict] = {}
+        failed = None
+        try:
+            for fut in as_completed(futures):
+                failed = futures[fut]
+                part, routes[failed] = fut.result()
+                merged.update(part.model_dump())
+                if self.on_partial:
+                    self.on_partial(dict(merged), len(routes), len(SECTIONS))
+        except Exception as e:
+            for pending in futures:
+                pending.cancel()
+            if isinstance(e, (NonMedicalInput, Cancelled, CircuitOpen)):
+                raise
+            raise Exception(f"Erro na secção '{failed}': {str(e)}")
+        self.last_route = {
+            "model": ",".join(sorted({r["model"] for r in routes.values()})),
+            "winner": "fan-out",
+            "hedged": any(r["hedged"] for r in routes.values()),
+            "latency_s": max(r["latency_s"] for r in routes.values()),
+            "ttft_s": min((r["ttft_s"] for r in routes.values() if r["ttft_s"] is not None), default=None),
+            "sections": {name: r["latency_s"] for name, r in routes.items()},
+        }
+        return MedicalCards.model_validate(merged)
+
+    def _generate(self, prompt: str, condition: str, schema=MedicalCards, section: Optional[str] = None):
+        """One validated generation (with repair/truncation retries); returns (object, route)."""
+        attempts = 2
+        last_text: Optional[str] = None
+        truncated = False
+        min_tokens = 0  # raised after a truncated answer
+
+        def ceiling(model: str) -> int:
+            # Output ceiling follows observed usage per model (and per section)
+            return min(max(TOKEN_LEDGER.max_output_tokens(_ledger_key(model, section)), min_tokens), MAX_OUTPUT_TOKENS)
+
+        def cfg(model: str) -> "types.GenerateContentConfig":
+            return self.model.instructions.config(model, ceiling(model))
+
+        for attempt in range(attempts):
+            try:
+                # A truncated answer is re-asked as is (with more room); anything else is repaired
+                effective_prompt = prompt if attempt == 0 or truncated else (
+                    "Converte o texto abaixo em JSON VÁLIDO que cumpra EXACTAMENTE o SCHEMA, "
+                    "em pt-PT, sem markdown/backticks, garantindo mínimos de comprimento/contagem e sem campos vazios.\n"
+                    + (f"Inclui APENAS os campos: {', '.join(SECTIONS[section])}.\n" if section else "")
+                    + f"\nTEXTO:\n{last_text or ''}"
+                )
+
+                # Routed API call (fast tier, hedged past p95, next tier on retries)
+                try:
+                    return self.model.router.generate(
+                        effective_prompt, cfg,
+                        parse=lambda resp: self._parse(resp, condition, schema, section),
+                        attempt=0 if truncated else attempt,
+                    )
+                except InvalidResponse as invalid:
+                    last_text = invalid.text or "(resposta vazia)"
+                    truncated = invalid.truncated
+                    if truncated:
+                        min_tokens = 2 * ceiling(invalid.model or self.model.model_id)
+                    if attempt == attempts - 1:
+                        raise Exception(f"Erro ao processar resposta da API: {str(invalid)}")
+                    continue
+
+            except (NonMedicalInput, Cancelled, CircuitOpen):
+                raise
+            except Exception as e:
+                if attempt == attempts - 1:
+                    raise Exception(f"Erro na chamada API (tentativa {attempt + 1}/{attempts}): {str(e)}")
+                continue
+
+        raise Exception("Falha ao obter resposta válida da API após múltiplas tentativas")
@@ -0,0 +1,165 @@
+# api.py
+# Headless JSON API for condition analysis (tornado, async)
+#
+#   python -m healthflow.api --port 8600
+#
+#   GET /v1/analysis?condition=asma&lang=en    -> analysis JSON (ETag = content hash)
+#   GET /v1/suggest?q=canc                     -> catalog suggestions
+#   GET /healthz
+#
+# Same AnalysisPipeline as the Streamlit page: the cache lookup runs on the bounded
+# executor too (a shared backend may do network or disk I/O); misses then generate there
+# behind single-flight and the per-client rate limit. Clients are identified by X-API-Key,
+# else by IP; generations are charged to the key and to the tenant
+# (healthflow.governor.request_tenant). Keys are only accepted if listed in
+# HEALTHFLOW_API_KEYS ("key1,key2"; an unknown key is a 401), and X-Forwarded-For/X-Real-IP
+# and X-Healthflow-Tenant are only trusted with HEALTHFLOW_TRUSTED_PROXY=1 (the API runs
+# behind a proxy that sets them), so clients cannot pick a new identity per request. Past a
+# hard budget only cached analyses are served: misses get 429 with Retry-After. While the
+# model API is failing, earlier analyses are served with "degraded": true (and
+# X-Healthflow-Source: degraded, not cached downstream); with nothing to serve, 503 with
+# Retry-After as soon as the circuit breaker is open.
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import tornado.httpserver
+import tornado.web
+
+from healthflow.analysis import NonMedicalInput
+from healthflow.governor import TRUSTED_PROXY, Identity, OverBudget, request_tenant
+from healthflow.pipeline import AnalysisPipeline, AnalysisResult, RateLimited, RejectedInput
+from healthflow.results import thaw
+from healthflow.routing import BREAKERS, CircuitOpen
+from healthflow.translation import LANGUAGES, SOURCE_LANG
+
+API_KEYS = frozenset(k.strip() for k in os.getenv("HEALTHFLOW_API_KEYS", "").split(",") if k.strip())
+
+# Concurrent model calls per process; waiting connections cost only a coroutine
+_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("HEALTHFLOW_API_WORKERS", "32")),
+                               thread_name_prefix="api")
+
+class BaseHandler(tornado.web.RequestHandler):
+    def initialize(self, pipeline: AnalysisPipeline, api_keys: frozenset = API_KEYS):
+        self.pipeline = pipeline
+        self.api_keys = api_keys
+
+    def prepare(self):
+        key = self.request.headers.get("X-API-Key")
+        if key is not None and key not in self.api_keys:
+            self.send_json(401, {"error": "Chave de API inválida."})
+
+    def set_default_headers(self):
+        self.set_header("Content-Type", "application/json; charset=utf-8")
+
+    def client_id(self) -> str:
+        """The validated API key, else the client IP (from the proxy headers only when trusted)."""
+        return self.request.headers.get("X-API-Key") or self.request.remote_ip or "anon"
+
+    def identity(self) -> Identity:
+        return Identity(session=self.client_id(), tenant=request_tenant(self.request.headers))
+
+    def send_json(self, status: int, body: dict) -> None:
+        self.set_status(status)
+        self.finish(json.dumps(body, ensure_ascii=False))
+
+    def write_error(self, status_code: int, **kwargs):
+        self.finish(json.dumps({"error": self._reason}, ensure_ascii=False))
+
+class AnalysisHandler(BaseHandler):
+    async def get(self):
+        condition = (self.get_argument("condition", "") or "").strip()
+        lang = self.get_argument("lang", SOURCE_LANG)
+        if not condition:
+            return self.send_json(400, {"error": "Parâmetro 'condition' em falta."})
+        if lang not in LANGUAGES:
+            return self.send_json(400, {"error": f"Idioma não suportado: {lang}", "idiomas": list(LANGUAGES)})
+
+        # Fast path: cached (and translated) analysis, answered without leaving the loop
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        res = await loop.run_in_executor(_EXECUTOR, self.pipeline.lookup, condition, lang)   # cache/pack I/O
+        if res is not None:
+            self.pipeline.log_analysis(res.topic, lang, self.client_id(), started, "ok", result=res)
+        else:
+            try:
+                res = await loop.run_in_executor(
+                    _EXECUTOR, lambda: self.pipeline.analyze(condition, client_id=self.client_id(), lang=lang,
+                                                             identity=self.identity()))
+            except (RejectedInput, NonMedicalInput) as e:
+                return self.send_json(422, {"error": str(e)})
+            except RateLimited as e:
+                self.set_header("Retry-After", str(int(e.retry_after) + 1))
+                return self.send_json(429, {"error": str(e)})
+            except OverBudget as e:
+                self.set_header("Retry-After", str(int(e.retry_after) + 1))
+                return self.send_json(429, {"error": str(e), "mode": "cache-only", "scope": e.decision.scope})
+            except CircuitOpen as e:
+                self.set_header("Retry-After", str(int(e.retry_after) + 1))
+                return self.send_json(503, {"error": str(e)})
+            except Exception as e:
+                return self.send_json(502, {"error": str(e)})
+        self.send_result(res)
+
+    def send_result(self, res: AnalysisResult) -> None:
+        etag = f'"{res.key}"'
+        self.set_header("ETag", etag)
+        self.set_header("Cache-Control", "no-store" if res.source == "degraded" else "public, max-age=300")
+        self.set_header("X-Healthflow-Source", res.source)
+        if res.budget != "ok":
+            self.set_header("X-Healthflow-Budget", res.budget)
+        if etag in [t.strip() for t in self.request.headers.get("If-None-Match", "").split(",")]:
+            self.set_status(304)
+            return self.finish()
+        self.send_json(200, {
+            "condition": res.topic,
+            "lang": res.lang,
+            "version": res.key,
+            "degraded": res.source == "degraded",
+            "data": thaw(res.payload),
+        })
+
+    def compute_etag(self) -> Optional[str]:
+        return None   # ETag is the content hash, set explicitly
+
+class SuggestHandler(BaseHandler):
+    def get(self):
+        q = self.get_argument("q", "")
+        self.send_json(200, {"suggestions": [
+            {"code": c.code, "label": c.label} for c in self.pipeline.catalog.suggest(q, limit=10)
+        ]})
+
+class HealthHandler(BaseHandler):
+    def get(self):
+        self.send_json(200, {"ok": True, "results": self.pipeline.results.stats(), "cache": self.pipeline.topics.stats(),
+                             "rollout": self.pipeline.topics.rollout(), "circuit": BREAKERS.snapshot(),
+                             "circuit_open": self.pipeline.model.router.circuit_open()})
+
+def make_app(pipeline: Optional[AnalysisPipeline] = None) -> tornado.web.Application:
+    args = {"pipeline": pipeline or AnalysisPipeline.create()}
+    return tornado.web.Application([
+        (r"/v1/analysis", AnalysisHandler, args),
+        (r"/v1/suggest", SuggestHandler, args),
+        (r"/healthz", HealthHandler, args),
+    ])
+
+async def serve(port: int, address: str = "") -> None:
+    server = tornado.httpserver.HTTPServer(make_app(), xheaders=TRUSTED_PROXY, idle_connection_timeout=60)
+    server.listen(port, address)
+    print(f"Healthflow API em http://{address or '0.0.0.0'}:{port}")
+    await asyncio.Event().wait()
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="API JSON de análise de condições")
+    parser.add_argument("--port", type=int, default=int(os.getenv("HEALTHFLOW_API_PORT", "8600")))
+    parser.add_argument("--address", default="")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.port, args.address))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+# audit.py
+# Clinical-governance audit log: analyses run, patient dashboards opened, who answered, how fast
+#
+# log() only appends to an in-memory queue, so it never blocks a rerun. A background
+# thread drains the queue in batches and appends each batch to the current segment as one
+# gzip member (data/audit/audit-YYYYmmdd-HHMMSS-NNN-<host>-<pid>.jsonl.gz), then fsyncs: an
+# event counts as acknowledged once its batch is on disk. Every process (replica) writes
+# only its own segments, so replicas sharing the directory never touch each other's files.
+# A crash can only lose the batch being written; a process that finds its own segment
+# from before a restart (same host and pid, e.g. pid 1 in a container) cuts off the
+# truncated trailing member so it stays readable and appendable. Segments rotate by size
+# and by day and are never rewritten.
+#
+#   python -m healthflow.audit [--kind analysis] [--since 2026-01-01]   # dump events as JSON lines
+
+import argparse
+import atexit
+import gzip
+import hashlib
+import json
+import os
+import queue
+import re
+import socket
+import threading
+import time
+import zlib
+from typing import Iterator, List, Optional
+
+AUDIT_DIR = os.getenv("HEALTHFLOW_AUDIT_DIR", os.path.join(os.getenv("HEALTHFLOW_DATA", "data"), "audit"))
+
+def pseudonym(value: str) -> str:
+    """Stable, non-reversible id for sessions and API clients (as in the query log)."""
+    return hashlib.sha1(value.encode("utf-8")).hexdigest()[:12]
+
+# ----------------- Segments -----------------
+def writer_id() -> str:
+    """Segment-name suffix of this process: host and pid."""
+    return f"{re.sub(r'[^A-Za-z0-9_.]', '_', socket.gethostname())}-{os.getpid()}"
+
+def _complete_length(data: bytes) -> int:
+    """Length of the prefix of `data` made of complete gzip members."""
+    pos = 0
+    while pos < len(data):
+        d = zlib.decompressobj(wbits=31)
+        try:
+            d.decompress(data[pos:])
+        except zlib.error:
+            break
+        if not d.eof:
+            break
+        pos = len(data) - len(d.unused_data)
+    return pos
+
+def read_segment(path: str) -> Iterator[dict]:
+    """Events of one segment; a truncated trailing batch (never acknowledged) is skipped."""
+    with open(path, "rb") as f:
+        data = f.read()
+    data = data[:_complete_length(data)]
+    if data:
+        for line in gzip.decompress(data).splitlines():
+            yield json.loads(line)
+
+def segments(directory: str = AUDIT_DIR) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, n) for n in os.listdir(directory)
+                  if n.startswith("audit-") and n.endswith(".jsonl.gz"))
+
+def read_events(directory: str = AUDIT_DIR) -> Iterator[dict]:
+    for path in segments(directory):
+        yield from read_segment(path)
+
+# ----------------- Writer -----------------
+class AuditLog:
+    """Batched, append-only, compressed audit writer with a non-blocking log()."""
+
+    def __init__(self, directory: str = AUDIT_DIR, batch_size: int = 500, flush_interval_s: float = 1.0,
+                 max_bytes: int = 16 * 1024 * 1024, max_queue: int = 100_000):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.max_bytes = max_bytes
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_queue)
+        self._seq = 0
+        self._acked = 0
+        self._acked_cond = threading.Condition()
+        self._seq_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._segment: Optional[str] = None
+        self.dropped = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+
+    # ----------------- render path -----------------
+    def log(self, kind: str, **fields) -> int:
+        """Enqueue one event; returns its sequence number (0 if the queue was full)."""
+        self._ensure_started()
+        with self._seq_lock:
+            try:
+                self._queue.put_nowait({"seq": self._seq + 1, "ts": round(time.time(), 3), "kind": kind, **fields})
+            except queue.Full:
+                self.dropped += 1
+                return 0
+            self._seq += 1
+            return self._seq
+
+    # ----------------- durability -----------------
+    def flush(self, timeout: float = 10.0) -> bool:
+        """Wait until every event logged so far is on disk (for shutdown and tools, not pages)."""
+        target = self._seq
+        deadline = time.monotonic() + timeout
+        with self._acked_cond:
+            while self._acked < target and self._thread is not None:
+                left = deadline - time.monotonic()
+                if left <= 0 or not self._thread.is_alive():
+                    break
+                self._acked_cond.wait(left)
+            return self._acked >= target
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval_s
+            while len(batch) < self.batch_size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=left))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[dict]) -> None:
+        body = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in batch).encode("utf-8")
+        member = gzip.compress(body, compresslevel=6)
+        delay = 0.2
+        while True:   # retry the same batch (order preserved); log() keeps queueing meanwhile
+            try:
+                path = self._current_segment(len(member))
+                with open(path, "ab") as f:
+                    f.write(member)
+                    f.flush()
+                    os.fsync(f.fileno())
+                break
+            except OSError as e:
+                self.last_error = str(e)
+                self._segment = None
+                time.sleep(delay)
+                delay = min(delay * 2, 10.0)
+        self.last_error = None
+        self.batches += 1
+        with self._acked_cond:
+            self._acked = max(self._acked, max(e["seq"] for e in batch))
+            self._acked_cond.notify_all()
+
+    def _current_segment(self, incoming: int) -> str:
+        """Open segment, rotated when it would exceed max_bytes or the day changed."""
+        day = time.strftime("%Y%m%d")
+        path = self._segment
+        writer = writer_id()
+        if path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            own = [p for p in segments(self.directory) if p.endswith(f"-{writer}.jsonl.gz")]
+            path = own[-1] if own else None
+            if path:
+                self._repair(path)   # ours: no other live process writes to it
+        if (path is None or not os.path.basename(path).startswith(f"audit-{day}")
+                or os.path.getsize(path) + incoming > self.max_bytes):
+            stamp, n = time.strftime("%Y%m%d-%H%M%S"), 0
+            path = os.path.join(self.directory, f"audit-{stamp}-{n:03d}-{writer}.jsonl.gz")
+            while os.path.exists(path):   # several rotations within the same second
+                n += 1
+                path = os.path.join(self.directory, f"audit-{stamp}-{n:03d}-{writer}.jsonl.gz")
+        self._segment = path
+        return path
+
+    @staticmethod
+    def _repair(path: str) -> None:
+        """Cut a batch left half-written by a crash so later batches stay readable."""
+        with open(path, "rb") as f:
+            data = f.read()
+        good = _complete_length(data)
+        if good < len(data):
+            with open(path, "r+b") as f:
+                f.truncate(good)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def stats(self) -> dict:
+        return {"eventos": self._seq, "gravados": self._acked, "em fila": self._queue.qsize(),
+                "lotes": self.batches, "descartados": self.dropped, "segmento": self._segment,
+                "erro": self.last_error}
+
+AUDIT = AuditLog()
+
+# ----------------- CLI -----------------
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Exportar eventos de auditoria (JSON lines)")
+    parser.add_argument("--dir", default=AUDIT_DIR)
+    parser.add_argument("--kind", help="analysis | dashboard | …")
+    parser.add_argument("--since", help="data ISO (AAAA-MM-DD)")
+    args = parser.parse_args(argv)
+    since = time.mktime(time.strptime(args.since, "%Y-%m-%d")) if args.since else 0
+    for event in read_events(args.dir):
+        if (args.kind and event.get("kind") != args.kind) or event.get("ts", 0) < since:
+            continue
+        print(json.dumps(event, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# bench.py
+# Cold-start benchmark: import time and first render per page, in fresh processes
+#
+#   python -m healthflow.bench                  # all pages, 3 runs each
+#   python -m healthflow.bench --runs 5 pages/general.py
+#
+# For each page and run, a new interpreter:
+#   - imports  : executes only the page's top-level import statements
+#   - cold     : renders app.py (the router), then switches to the page (preload disabled)
+#   - preloaded: same, but waits for healthflow.preload to finish first
+#   - warm     : the same page for a second session in the same process (shared resources built)
+# Medians are printed and appended to data/bench/coldstart.jsonl (with the git commit),
+# so cold first-page latency is tracked across changes.
+
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+from healthflow.preload import PAGE_MODULES
+
+RECORD = os.path.join(os.getenv("HEALTHFLOW_DATA", "data"), "bench", "coldstart.jsonl")
+
+_IMPORTS_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+exec(compile(sys.argv[1], "<imports>", "exec"), {})
+print(json.dumps({"imports": time.perf_counter() - t0, "genai": "google.genai" in sys.modules}))
+"""
+
+_RENDER_CHILD = """
+import json, sys, time
+t0 = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+boot = time.perf_counter() - t0
+at = AppTest.from_file("app.py", default_timeout=120)
+t0 = time.perf_counter(); at.run(); landing = time.perf_counter() - t0
+if sys.argv[2] == "1":
+    for th in __import__("threading").enumerate():
+        if th.name == "preload":
+            th.join()
+t0 = time.perf_counter(); at.switch_page(sys.argv[1]).run(); first = time.perf_counter() - t0
+at2 = AppTest.from_file("app.py", default_timeout=120); at2.run()
+t0 = time.perf_counter(); at2.switch_page(sys.argv[1]).run(); warm = time.perf_counter() - t0
+print(json.dumps({"boot": boot, "landing": landing, "first": first, "warm": warm,
+                  "errors": [e.value for e in at.exception], "genai": "google.genai" in sys.modules}))
+"""
+
+def page_imports(page: str) -> str:
+    """Source of the page's top-level import statements only."""
+    with open(page, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(n) for n in tree.body if isinstance(n, (ast.Import, ast.ImportFrom)))
+
+def _child(code: str, *args: str, preload: bool = False) -> dict:
+    env = dict(os.environ, HEALTHFLOW_PRELOAD="1" if preload else "0", PYTHONPATH=os.getcwd())
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", code, *args], env=env,
+                         capture_output=True, text=True, timeout=600)
+    lines = [l for l in out.stdout.splitlines() if l.startswith("{")]
+    if out.returncode or not lines:
+        raise RuntimeError(out.stderr[-2000:])
+    return json.loads(lines[-1])
+
+def bench_page(page: str, runs: int) -> Dict[str, float]:
+    samples: Dict[str, List[float]] = {"imports": [], "cold": [], "preloaded": [], "warm": []}
+    genai_at_import = genai_at_render = False
+    for _ in range(runs):
+        imp = _child(_IMPORTS_CHILD, page_imports(page))
+        samples["imports"].append(imp["imports"])
+        genai_at_import |= imp["genai"]
+        cold = _child(_RENDER_CHILD, page, "0")
+        if cold["errors"]:
+            raise RuntimeError(f"{page}: {cold['errors']}")
+        samples["cold"].append(cold["first"])
+        samples["warm"].append(cold["warm"])
+        genai_at_render |= cold["genai"]
+        samples["preloaded"].append(_child(_RENDER_CHILD, page, "1", preload=True)["first"])
+    row = {k: round(statistics.median(v) * 1000) for k, v in samples.items()}
+    row.update({"genai_at_import": genai_at_import, "genai_at_render": genai_at_render})
+    return row
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de arranque a frio por página")
+    parser.add_argument("pages", nargs="*", default=list(PAGE_MODULES))
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--record", default=RECORD, help="ficheiro JSONL ('' para não gravar)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    print(f"{'página':<22}{'imports':>9}{'frio':>8}{'pré-carr.':>11}{'quente':>8}  (ms, mediana de {args.runs})")
+    for page in args.pages:
+        row = results[page] = bench_page(page, args.runs)
+        print(f"{page:<22}{row['imports']:>9}{row['cold']:>8}{row['preloaded']:>11}{row['warm']:>8}"
+              + ("  [google.genai carregado no 1.º render]" if row["genai_at_render"] else ""))
+
+    if args.record:
+        os.makedirs(os.path.dirname(args.record), exist_ok=True)
+        with open(args.record, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": _commit(),
+                                "python": sys.version.split()[0], "runs": args.runs, "pages": results}) + "\n")
+        print(f"registado em {args.record}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+# cache.py
+# Pluggable key/value backends for analysis results, shared across Streamlit replicas
+#
+#   HEALTHFLOW_CACHE_URL=memory://                    in-process LRU only (default)
+#   HEALTHFLOW_CACHE_URL=sqlite:////srv/shared/hf.db  SQLite in WAL mode on a shared disk
+#   HEALTHFLOW_CACHE_URL=redis://cache:6379/0         anything speaking RESP (Redis, Valkey, …)
+#
+# Shared backends are wrapped in TieredBackend: a small in-process LRU with a short TTL in
+# front of the shared store, so hot lookups stay local while a result generated by one
+# replica is visible to the others within seconds. Values are compact bytes (dumps/loads:
+# minified JSON, zlib-compressed when it pays off). A failing shared tier degrades to
+# local-only instead of failing requests.
+#
+#   python -m healthflow.cache serve --port 6390      # local RESP stand-in (dev / tests)
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+# ----------------- Serialization -----------------
+_RAW, _ZLIB = b"j", b"z"
+
+def dumps(obj: Any) -> bytes:
+    raw = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(raw) < 256:
+        return _RAW + raw
+    return _ZLIB + zlib.compress(raw, 6)
+
+def loads(data: bytes) -> Any:
+    tag, body = data[:1], data[1:]
+    if tag == _ZLIB:
+        body = zlib.decompress(body)
+    elif tag != _RAW:
+        raise ValueError("formato de cache desconhecido")
+    return json.loads(body.decode("utf-8"))
+
+# ----------------- Backends -----------------
+class Backend:
+    """bytes -> bytes store with optional per-key TTL (seconds)."""
+
+    shared = False   # visible to other processes
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def scan(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        """Live (key, value) pairs whose key starts with `prefix`."""
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+class LRUBackend(Backend):
+    """In-process LRU, bounded by item count."""
+
+    def __init__(self, max_items: int = 100_000):
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Tuple[bytes, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            if item[1] is not None and item[1] < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        with self._lock:
+            self._items[key] = (value, time.time() + ttl_s if ttl_s else None)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._items.pop(key, None)
+
+    def scan(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        now = time.time()
+        with self._lock:
+            items = [(k, v) for k, (v, exp) in self._items.items()
+                     if k.startswith(prefix) and (exp is None or exp >= now)]
+        return iter(items)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"itens": len(self._items), "bytes": sum(len(v) for v, _ in self._items.values())}
+
+class SQLiteBackend(Backend):
+    """Single SQLite file in WAL mode: concurrent readers, one writer, across processes."""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._writes = 0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                                      check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._conn().execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return bytes(row[0])
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)",
+                     (key, value, time.time() + ttl_s if ttl_s else None))
+        self._writes += 1
+        if self._writes % 500 == 0:
+            conn.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires < ?", (time.time(),))
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def scan(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        rows = self._conn().execute(
+            "SELECT key, value FROM cache WHERE key >= ? AND key < ? AND (expires IS NULL OR expires >= ?)",
+            (prefix, prefix + "\U0010ffff", time.time())).fetchall()
+        return ((k, bytes(v)) for k, v in rows)
+
+    def stats(self) -> dict:
+        n, size = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM cache").fetchone()
+        return {"itens": n, "bytes": size, "ficheiro": self.path}
+
+class RESPBackend(Backend):
+    """Minimal RESP2 client (GET / SET PX / DEL / SCAN) — no redis package needed.
+
+    One connection per thread; keys are namespaced with `namespace`.
+    """
+
+    shared = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 6379, db: int = 0,
+                 password: Optional[str] = None, namespace: str = "healthflow:", timeout_s: float = 0.5):
+        self.host, self.port, self.db, self.password = host, port, db, password
+        self.namespace = namespace
+        self.timeout_s = timeout_s
+        self._local = threading.local()
+
+    # ----------------- protocol -----------------
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout_s)
+        self._local.sock, self._local.file = sock, None
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.file = sock.makefile("rb")
+            if self.password:
+                self._call("AUTH", self.password)
+            if self.db:
+                self._call("SELECT", str(self.db))
+        except BaseException:
+            self._close()   # e.g. a wrong password: do not leak (or reuse) the half-set-up socket
+            raise
+
+    def _call(self, *args: Any) -> Any:
+        if getattr(self._local, "sock", None) is None:
+            self._connect()
+        parts = [a if isinstance(a, bytes) else str(a).encode("utf-8") for a in args]
+        msg = b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(p), p) for p in parts)
+        try:
+            self._local.sock.sendall(msg)
+            return self._read()
+        except (OSError, ConnectionError):
+            self._close()   # reconnect on next call
+            raise
+
+    def _close(self) -> None:
+        sock, f = getattr(self._local, "sock", None), getattr(self._local, "file", None)
+        self._local.sock = self._local.file = None
+        for res in (f, sock):
+            try:
+                if res is not None:
+                    res.close()
+            except OSError:
+                pass
+
+    def _read(self) -> Any:
+        line = self._local.file.readline()
+        if not line:
+            raise ConnectionError("ligação RESP fechada")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise Exception(f"Erro RESP: {rest.decode()}")
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            if n < 0:
+                return None
+            data = self._local.file.read(n + 2)
+            return data[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read() for _ in range(n)]
+        raise ConnectionError(f"resposta RESP inválida: {line[:20]!r}")
+
+    # ----------------- Backend -----------------
+    def get(self, key: str) -> Optional[bytes]:
+        return self._call("GET", self.namespace + key)
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        if ttl_s:
+            self._call("SET", self.namespace + key, value, "PX", int(ttl_s * 1000))
+        else:
+            self._call("SET", self.namespace + key, value)
+
+    def delete(self, key: str) -> None:
+        self._call("DEL", self.namespace + key)
+
+    def scan(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        """Two round trips per SCAN page: the keys, then their values in one MGET."""
+        cursor = b"0"
+        while True:
+            cursor, keys = self._call("SCAN", cursor, "MATCH", self.namespace + prefix + "*", "COUNT", 500)
+            if keys:
+                for k, v in zip(keys, self._call("MGET", *keys)):
+                    if v is not None:   # expired between SCAN and MGET
+                        yield k.decode("utf-8")[len(self.namespace):], v
+            if cursor in (b"0", "0"):
+                break
+
+    def stats(self) -> dict:
+        return {"servidor": f"{self.host}:{self.port}/{self.db}", "itens": self._call("DBSIZE")}
+
+class TieredBackend(Backend):
+    """Local LRU (short TTL) in front of a shared backend; shared-tier errors degrade to local."""
+
+    shared = True
+
+    def __init__(self, shared: Backend, local: Optional[Backend] = None, local_ttl_s: float = 15,
+                 retry_after_s: float = 5):
+        self.remote = shared
+        self.local = local or LRUBackend(max_items=2_000)
+        self.local_ttl_s = local_ttl_s
+        self.retry_after_s = retry_after_s
+        self._down_until = 0.0
+        self.local_hits = self.remote_hits = self.misses = self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def _failed(self, e: Exception) -> None:
+        # Skip the shared tier for a while instead of paying a timeout on every lookup
+        self._down_until = time.monotonic() + self.retry_after_s
+        self.errors += 1
+        self.last_error = str(e)[:200]
+
+    def _remote_up(self) -> bool:
+        return time.monotonic() >= self._down_until
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is not None:
+            self.local_hits += 1
+            return value
+        if not self._remote_up():
+            return None
+        try:
+            value = self.remote.get(key)
+        except Exception as e:
+            self._failed(e)
+            return None
+        if value is None:
+            self.misses += 1
+            return None
+        self.remote_hits += 1
+        self.local.set(key, value, self.local_ttl_s)
+        return value
+
+    def set(self, key: str, value: bytes, ttl_s: Optional[float] = None) -> None:
+        self.local.set(key, value, min(ttl_s, self.local_ttl_s) if ttl_s else self.local_ttl_s)
+        if not self._remote_up():
+            return
+        try:
+            self.remote.set(key, value, ttl_s)
+        except Exception as e:
+            self._failed(e)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if not self._remote_up():
+            return
+        try:
+            self.remote.delete(key)
+        except Exception as e:
+            self._failed(e)
+
+    def scan(self, prefix: str) -> Iterator[Tuple[str, bytes]]:
+        if not self._remote_up():
+            return self.local.scan(prefix)
+        try:
+            return iter(list(self.remote.scan(prefix)))
+        except Exception as e:
+            self._failed(e)
+            return self.local.scan(prefix)
+
+    def stats(self) -> dict:
+        remote = {}
+        if self._remote_up():
+            try:
+                remote = self.remote.stats()
+            except Exception as e:
+                self._failed(e)
+        return {"local": self.local.stats(), "partilhada": remote, "acertos locais": self.local_hits,
+                "acertos partilhados": self.remote_hits, "falhas": self.misses, "erros": self.errors,
+                "último erro": self.last_error}
+
+def from_url(url: Optional[str], local_ttl_s: float = 15) -> Backend:
+    """Backend for HEALTHFLOW_CACHE_URL; shared backends come wrapped in TieredBackend."""
+    if not url or url.startswith("memory:"):
+        return LRUBackend()
+    parsed = urlparse(url)
+    if parsed.scheme == "sqlite":
+        # sqlite:///relative/path.db or sqlite:////absolute/path.db (as in SQLAlchemy)
+        path = parsed.netloc + parsed.path if parsed.netloc else parsed.path[1:]
+        return TieredBackend(SQLiteBackend(path), local_ttl_s=local_ttl_s)
+    if parsed.scheme in ("redis", "resp"):
+        db = int(parsed.path.strip("/") or 0)
+        return TieredBackend(RESPBackend(parsed.hostname or "127.0.0.1", parsed.port or 6379, db,
+                                         password=parsed.password), local_ttl_s=local_ttl_s)
+    raise Exception(f"URL de cache não suportado: {url}")
+
+# ----------------- Local RESP stand-in -----------------
+class _RESPHandler(socketserver.StreamRequestHandler):
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.split()   # inline command (e.g. redis-cli / telnet)
+        args = []
+        for _ in range(int(line[1:-2])):
+            n = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(n + 2)[:-2])
+        return args
+
+    def _reply(self, value: Any) -> None:
+        if value is None:
+            data = b"$-1\r\n"
+        elif isinstance(value, int):
+            data = b":%d\r\n" % value
+        elif isinstance(value, str):
+            data = b"+" + value.encode() + b"\r\n"
+        elif isinstance(value, bytes):
+            data = b"$%d\r\n%s\r\n" % (len(value), value)
+        else:
+            data = b"*%d\r\n" % len(value)
+            for v in value:
+                data += b"$-1\r\n" if v is None else b"$%d\r\n%s\r\n" % (len(v), v)
+        self.wfile.write(data)
+
+    def handle(self) -> None:
+        store: LRUBackend = self.server.store
+        while True:
+            args = self._read_command()
+            if not args:
+                return
+            cmd = args[0].upper()
+            if cmd == b"PING":
+                self._reply("PONG")
+            elif cmd in (b"SELECT", b"AUTH"):
+                self._reply("OK")
+            elif cmd == b"GET":
+                self._reply(store.get(args[1].decode()))
+            elif cmd == b"MGET":
+                self._reply([store.get(k.decode()) for k in args[1:]])
+            elif cmd == b"SET":
+                ttl = None
+                if len(args) >= 5 and args[3].upper() in (b"PX", b"EX"):
+                    ttl = int(args[4]) / (1000 if args[3].upper() == b"PX" else 1)
+                store.set(args[1].decode(), args[2], ttl)
+                self._reply("OK")
+            elif cmd == b"DEL":
+                for k in args[1:]:
+                    store.delete(k.decode())
+                self._reply(len(args) - 1)
+            elif cmd == b"SCAN":
+                pattern = args[args.index(b"MATCH") + 1].decode() if b"MATCH" in args else "*"
+                keys = [k.encode() for k, _ in store.scan(pattern.rstrip("*"))]
+                self.wfile.write(b"*2\r\n$1\r\n0\r\n")
+                self._reply(keys)
+            elif cmd == b"DBSIZE":
+                self._reply(store.stats()["itens"])
+            elif cmd == b"FLUSHDB":
+                store._items.clear()
+                self._reply("OK")
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+class RESPServer(socketserver.ThreadingTCPServer):
+    """In-memory RESP server for local multi-replica runs and tests (not for production)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 6390), max_items: int = 100_000):
+        super().__init__(address, _RESPHandler)
+        self.store = LRUBackend(max_items=max_items)
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Cache partilhada de análises")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    s = sub.add_parser("serve", help="servidor RESP local em memória")
+    s.add_argument("--host", default="127.0.0.1")
+    s.add_argument("--port", type=int, default=6390)
+    st = sub.add_parser("stats", help="estado do backend configurado")
+    st.add_argument("--url", default=os.getenv("HEALTHFLOW_CACHE_URL"))
+    args = parser.parse_args(argv)
+    if args.cmd == "serve":
+        server = RESPServer((args.host, args.port))
+        print(f"RESP em {args.host}:{args.port} (em memória)")
+        server.serve_forever()
+    else:
+        print(json.dumps(from_url(args.url).stats(), ensure_ascii=False, indent=1))
+
+if __name__ == "__main__":
+    main()
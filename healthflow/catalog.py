@@ -0,0 +1,249 @@
+# catalog.py
+# Local condition catalog (ICD-10, pt-PT labels + synonyms) behind a prefix trie,
+# plus a cheap rule-based filter that rejects obviously non-medical input before any API call.
+#
+# The built-in list covers common conditions; a full export can be loaded from a CSV
+# (code;label;synonym|synonym|...) via HEALTHFLOW_ICD10_CSV.
+
+import csv
+import os
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+@dataclass(frozen=True)
+class Condition:
+    code: str
+    label: str
+    synonyms: Tuple[str, ...] = ()
+
+BUILTIN: List[Condition] = [
+    Condition("J45", "Asma", ("asma brônquica", "bronquite asmática")),
+    Condition("J44", "Doença pulmonar obstrutiva crónica", ("DPOC", "enfisema", "bronquite crónica")),
+    Condition("J18", "Pneumonia", ("pneumonia adquirida na comunidade",)),
+    Condition("J06", "Infeção respiratória alta", ("constipação", "resfriado", "IVAS")),
+    Condition("J11", "Gripe", ("influenza",)),
+    Condition("U07.1", "COVID-19", ("covid", "SARS-CoV-2")),
+    Condition("J30", "Rinite alérgica", ("febre dos fenos",)),
+    Condition("J32", "Sinusite crónica", ("sinusite",)),
+    Condition("I10", "Hipertensão arterial", ("hipertensão", "HTA", "tensão alta")),
+    Condition("I50", "Insuficiência cardíaca", ("IC", "insuficiência cardíaca congestiva")),
+    Condition("I21", "Enfarte agudo do miocárdio", ("enfarte", "ataque cardíaco", "EAM")),
+    Condition("I20", "Angina de peito", ("angina",)),
+    Condition("I48", "Fibrilhação auricular", ("FA", "fibrilação atrial")),
+    Condition("I63", "Acidente vascular cerebral isquémico", ("AVC", "trombose cerebral")),
+    Condition("I26", "Embolia pulmonar", ("tromboembolismo pulmonar", "TEP")),
+    Condition("I80", "Trombose venosa profunda", ("TVP", "flebotrombose")),
+    Condition("I83", "Varizes dos membros inferiores", ("varizes",)),
+    Condition("E78", "Dislipidemia", ("colesterol alto", "hipercolesterolemia")),
+    Condition("E11", "Diabetes mellitus tipo 2", ("diabetes", "diabetes tipo 2", "DM2")),
+    Condition("E10", "Diabetes mellitus tipo 1", ("diabetes tipo 1", "DM1")),
+    Condition("E66", "Obesidade", ()),
+    Condition("E03", "Hipotiroidismo", ("tiroide lenta",)),
+    Condition("E05", "Hipertiroidismo", ("doença de Graves", "tireotoxicose")),
+    Condition("E55", "Défice de vitamina D", ("carência de vitamina D",)),
+    Condition("D50", "Anemia ferropénica", ("anemia", "falta de ferro")),
+    Condition("D57", "Drepanocitose", ("anemia falciforme",)),
+    Condition("D70", "Neutropenia", ("neutropenia febril",)),
+    Condition("C50", "Cancro da mama", ("carcinoma da mama", "tumor da mama", "neoplasia da mama")),
+    Condition("C34", "Cancro do pulmão", ("carcinoma do pulmão", "neoplasia do pulmão")),
+    Condition("C18", "Cancro do cólon", ("cancro colorretal", "carcinoma do cólon")),
+    Condition("C20", "Cancro do reto", ("carcinoma do reto",)),
+    Condition("C61", "Cancro da próstata", ("carcinoma da próstata",)),
+    Condition("C16", "Cancro do estômago", ("cancro gástrico",)),
+    Condition("C25", "Cancro do pâncreas", ("adenocarcinoma do pâncreas",)),
+    Condition("C22", "Cancro do fígado", ("carcinoma hepatocelular", "hepatocarcinoma")),
+    Condition("C53", "Cancro do colo do útero", ("cancro do colo uterino",)),
+    Condition("C56", "Cancro do ovário", ()),
+    Condition("C67", "Cancro da bexiga", ()),
+    Condition("C64", "Cancro do rim", ("carcinoma de células renais",)),
+    Condition("C73", "Cancro da tiroide", ()),
+    Condition("C43", "Melanoma", ("melanoma maligno",)),
+    Condition("C91", "Leucemia linfoblástica", ("leucemia",)),
+    Condition("C81", "Linfoma de Hodgkin", ("linfoma",)),
+    Condition("C90", "Mieloma múltiplo", ("mieloma",)),
+    Condition("K21", "Doença de refluxo gastroesofágico", ("refluxo", "DRGE", "azia")),
+    Condition("K25", "Úlcera gástrica", ("úlcera péptica", "úlcera do estômago")),
+    Condition("K29", "Gastrite", ()),
+    Condition("K35", "Apendicite aguda", ("apendicite",)),
+    Condition("K50", "Doença de Crohn", ("Crohn",)),
+    Condition("K51", "Colite ulcerosa", ("retocolite ulcerativa",)),
+    Condition("K58", "Síndrome do intestino irritável", ("cólon irritável", "SII")),
+    Condition("K70", "Doença hepática alcoólica", ("cirrose alcoólica",)),
+    Condition("K74", "Cirrose hepática", ("cirrose",)),
+    Condition("K76.0", "Esteatose hepática", ("fígado gordo",)),
+    Condition("K80", "Litíase biliar", ("pedra na vesícula", "cálculos biliares", "colelitíase")),
+    Condition("K85", "Pancreatite aguda", ("pancreatite",)),
+    Condition("K90.0", "Doença celíaca", ("celíaca", "intolerância ao glúten")),
+    Condition("B18", "Hepatite viral crónica", ("hepatite B", "hepatite C", "hepatite")),
+    Condition("B20", "Infeção por VIH", ("VIH", "HIV", "SIDA")),
+    Condition("A15", "Tuberculose pulmonar", ("tuberculose", "TB")),
+    Condition("N18", "Doença renal crónica", ("insuficiência renal crónica", "DRC")),
+    Condition("N20", "Litíase renal", ("pedra no rim", "cálculo renal", "cólica renal")),
+    Condition("N39.0", "Infeção urinária", ("cistite", "ITU")),
+    Condition("N40", "Hiperplasia benigna da próstata", ("HBP", "próstata aumentada")),
+    Condition("N80", "Endometriose", ()),
+    Condition("E28.2", "Síndrome do ovário poliquístico", ("SOP", "ovário poliquístico")),
+    Condition("M81", "Osteoporose", ()),
+    Condition("M17", "Artrose do joelho", ("gonartrose", "osteoartrose")),
+    Condition("M06", "Artrite reumatoide", ("AR",)),
+    Condition("M10", "Gota", ("ácido úrico alto",)),
+    Condition("M32", "Lúpus eritematoso sistémico", ("lúpus", "LES")),
+    Condition("M54.5", "Lombalgia", ("dor lombar", "dor nas costas")),
+    Condition("M79.7", "Fibromialgia", ()),
+    Condition("M45", "Espondilite anquilosante", ()),
+    Condition("G43", "Enxaqueca", ("migrânea", "dor de cabeça")),
+    Condition("G40", "Epilepsia", ("convulsões",)),
+    Condition("G20", "Doença de Parkinson", ("Parkinson",)),
+    Condition("G30", "Doença de Alzheimer", ("Alzheimer",)),
+    Condition("G35", "Esclerose múltipla", ("EM",)),
+    Condition("G12.2", "Esclerose lateral amiotrófica", ("ELA",)),
+    Condition("G47.3", "Apneia do sono", ("apneia obstrutiva do sono", "SAOS")),
+    Condition("G62", "Neuropatia periférica", ("polineuropatia",)),
+    Condition("F32", "Depressão", ("episódio depressivo", "depressão major")),
+    Condition("F41", "Perturbação de ansiedade", ("ansiedade", "ansiedade generalizada")),
+    Condition("F31", "Perturbação bipolar", ("bipolar", "doença bipolar")),
+    Condition("F20", "Esquizofrenia", ()),
+    Condition("F90", "Perturbação de hiperatividade e défice de atenção", ("PHDA", "hiperatividade")),
+    Condition("F84.0", "Autismo", ("perturbação do espectro do autismo", "PEA")),
+    Condition("L40", "Psoríase", ()),
+    Condition("L20", "Dermatite atópica", ("eczema atópico", "eczema")),
+    Condition("L70", "Acne", ()),
+    Condition("H40", "Glaucoma", ()),
+    Condition("H25", "Catarata", ()),
+    Condition("H35.3", "Degenerescência macular", ("DMI",)),
+    Condition("H66", "Otite média", ("otite",)),
+    Condition("O24", "Diabetes gestacional", ()),
+    Condition("O14", "Pré-eclâmpsia", ()),
+    Condition("T78.2", "Anafilaxia", ("choque anafilático",)),
+    Condition("A41", "Sépsis", ("septicemia",)),
+]
+
+# ----------------- Normalization -----------------
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and collapse whitespace ('Úlcera  Gástrica' -> 'ulcera gastrica')."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+# ----------------- Trie -----------------
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.top: List[int] = []   # best entries under this prefix, capped
+
+class ConditionCatalog:
+    """Prefix trie over labels and synonyms; every word start is indexed.
+
+    Each node caches its top-k entries, so a lookup costs O(len(prefix)) regardless of
+    catalog size.
+    """
+
+    def __init__(self, conditions: List[Condition], top_k: int = 10):
+        self.conditions = conditions
+        self.top_k = top_k
+        self.root = _Node()
+        self._exact: Dict[str, int] = {}
+        self._mention_re: Optional[re.Pattern] = None
+        for idx, cond in enumerate(conditions):
+            for name in (cond.label,) + cond.synonyms:
+                norm = normalize(name)
+                self._exact.setdefault(norm, idx)
+                words = norm.split(" ")
+                for w in range(len(words)):
+                    self._insert(" ".join(words[w:]), idx)
+
+    def _insert(self, key: str, idx: int) -> None:
+        node = self.root
+        for ch in key:
+            node = node.children.setdefault(ch, _Node())
+            if idx not in node.top and len(node.top) < self.top_k:
+                node.top.append(idx)
+
+    def suggest(self, prefix: str, limit: int = 6) -> List[Condition]:
+        node = self.root
+        for ch in normalize(prefix):
+            node = node.children.get(ch)
+            if node is None:
+                return []
+        return [self.conditions[i] for i in node.top[:limit]]
+
+    def canonical(self, text: str) -> Optional[Condition]:
+        """Exact label/synonym match (accent- and case-insensitive)."""
+        idx = self._exact.get(normalize(text))
+        return self.conditions[idx] if idx is not None else None
+
+    def mentions(self, text: str) -> List[Condition]:
+        """Catalog conditions named anywhere in free text (e.g. a listed complication)."""
+        if self._mention_re is None:
+            # Abbreviations (IC, FA, AVC…) are too ambiguous inside sentences
+            names = sorted((k for k in self._exact if len(k) >= 4), key=len, reverse=True)
+            self._mention_re = re.compile(r"\b(" + "|".join(map(re.escape, names)) + r")\b")
+        found: List[Condition] = []
+        for m in self._mention_re.finditer(normalize(text)):
+            cond = self.conditions[self._exact[m.group(1)]]
+            if cond not in found:
+                found.append(cond)
+        return found
+
+    # ----------------- Pre-filter -----------------
+    def classify(self, text: str) -> Tuple[bool, str]:
+        """(is_plausibly_medical, reason). Only rejects input that is obviously not a condition."""
+        norm = normalize(text)
+        if len(norm) < 2:
+            return False, "Introduza o nome de uma condição médica."
+        if _URL_RE.search(norm):
+            return False, "Endereços web ou emails não são condições médicas."
+        if not re.search(r"[a-z]", norm):
+            return False, "A pesquisa deve conter o nome de uma condição médica."
+        if len(norm.split()) > 12:
+            return False, "Texto demasiado longo — escreva apenas o nome da condição."
+        if self.canonical(norm) or self.suggest(norm, limit=1):
+            return True, "catálogo"
+        if self.mentions(norm):
+            return True, "catálogo"
+        if _MEDICAL_WORD_RE.search(norm) or any(w not in _SUFFIX_STOP for w in _MEDICAL_SUFFIX_RE.findall(norm)):
+            return True, "terminologia médica"
+        # Only clearly off-topic text is rejected; "asma no tempo frio" has a condition in it
+        if _NON_MEDICAL_RE.search(norm):
+            return False, f"'{text.strip()}' não parece ser uma condição médica."
+        # Unknown words: let the model decide (rare diseases are not in the catalog)
+        return True, "desconhecido"
+
+
+_URL_RE = re.compile(r"https?://|www\.|\S+@\S+\.\S+")
+# Whole medical words, and words built on a medical suffix (a stem of 3+ letters, so
+# "roma" or "dose" do not count); _SUFFIX_STOP lists common words that merely end that way.
+_MEDICAL_WORD_RE = re.compile(
+    r"\b(sindrome|doenca|cancro|tumor|carcinoma|infecao|insuficiencia|deficiencia|"
+    r"disturbio|perturbacao|dor(es)?|lesao|fratura|virus|bacteria|alergia|intolerancia|"
+    r"coagulacao|hemorragia|febre|sintomas?|tensao arterial)\b"
+)
+_MEDICAL_SUFFIX_RE = re.compile(
+    r"\b\w{3,}(?:ite|oma|ose|emia|patia|algia|plasia|trofia|penia|cele|ectasia|espasmo)\b"
+)
+_SUFFIX_STOP = frozenset((
+    "academia", "boemia", "blasfemia", "nostalgia", "diploma", "idioma", "aroma", "axioma",
+    "convite", "limite", "palpite", "elite", "azeite", "satelite", "dinamite", "quite",
+))
+_NON_MEDICAL_RE = re.compile(
+    r"\b(ola|bom dia|boa tarde|obrigad[oa]|receita|futebol|benfica|porto|sporting|tempo|"
+    r"meteorologia|filme|musica|jogo|comprar|preco|bitcoin|restaurante|hotel|viagem|"
+    r"programa|codigo|python|piada|quem e|o que e o|capital de|noticias)\b"
+)
+
+
+def load_catalog(path: Optional[str] = None) -> ConditionCatalog:
+    """Built-in entries, extended with a CSV export when one is configured."""
+    conditions = list(BUILTIN)
+    path = path or os.getenv("HEALTHFLOW_ICD10_CSV")
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for row in csv.reader(f, delimiter=";"):
+                if len(row) >= 2 and row[0] and not row[0].startswith("#"):
+                    syns = tuple(s for s in (row[2].split("|") if len(row) > 2 else []) if s)
+                    conditions.append(Condition(row[0].strip(), row[1].strip(), syns))
+    return ConditionCatalog(conditions)
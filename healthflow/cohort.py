@@ -0,0 +1,182 @@
+# cohort.py
+# Cohort aggregates — summary tables maintained incrementally on ingest
+# The cohort page only reads these tables; it never scans raw patient records on rerun.
+
+from bisect import bisect_left, insort
+from itertools import islice
+from datetime import date
+from typing import Dict, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+
+PHASES = [
+    "ddAC (q14d)",
+    "Paclitaxel (semanal)",
+    "TC (q21d)",
+    "EC (q21d)",
+    "Docetaxel (q21d)",
+    "AC (q21d)",
+    "Vigilância",
+]
+
+# Side-effect columns carried on each patient record (CTCAE grade 0–4)
+EFFECTS = {
+    "nausea": "Náuseas e vómitos",
+    "alopecia": "Alopecia",
+    "neutropenia": "Neutropenia",
+    "neuropathy": "Neuropatia periférica",
+}
+GRADES = [0, 1, 2, 3, 4]
+
+RECORD_COLUMNS = ["patient_id", "name", "phase", "next_infusion", "last_review"] + list(EFFECTS)
+
+
+class CohortAggregates:
+    """Pre-aggregated cohort tables, updated with vectorized group-bys on every ingest.
+
+    Each batch retracts the previous contribution of the patients it touches and adds the
+    new one, so the cost of an ingest is proportional to the batch, not to the cohort
+    (review due dates are bucketed per day, and there are only a few hundred days).
+    """
+
+    def __init__(self, review_interval_days: int = 42):
+        self.review_interval = pd.Timedelta(days=review_interval_days)
+        # Latest record per patient — needed to retract contributions on update
+        self._records: Dict[str, tuple] = {}
+        self.by_phase = pd.Series(0, index=pd.Index(PHASES, name="phase"), dtype="int64")
+        self.infusions_by_day = pd.Series(dtype="int64", index=pd.DatetimeIndex([], name="day"))
+        self.grades = pd.DataFrame(
+            0, index=pd.Index(list(EFFECTS), name="effect"), columns=GRADES, dtype="int64"
+        )
+        # Review due day (ns) -> patient ids, with the days kept sorted so "overdue" is a bisect
+        self._reviews: Dict[int, Set[str]] = {}
+        self._review_days: List[int] = []
+        self.version = 0
+
+    @property
+    def n_patients(self) -> int:
+        return len(self._records)
+
+    # ----------------- Ingest -----------------
+    def ingest(self, batch: pd.DataFrame) -> None:
+        """Upsert a batch of patient records and update every summary table."""
+        if batch.empty:
+            return
+        batch = _coerce(batch).drop_duplicates("patient_id", keep="last").set_index("patient_id")
+
+        previous = {pid: self._records[pid] for pid in batch.index if pid in self._records}
+        if previous:
+            old = pd.DataFrame.from_dict(previous, orient="index", columns=RECORD_COLUMNS[1:])
+            self._apply(old, sign=-1)
+            for pid, due in zip(old.index, (old["last_review"] + self.review_interval).array.asi8):
+                patients = self._reviews[due]
+                patients.discard(pid)
+                if not patients:
+                    del self._reviews[due]
+                    del self._review_days[bisect_left(self._review_days, due)]
+        self._apply(batch, sign=1)
+
+        self._records.update(zip(batch.index, batch.itertuples(index=False, name=None)))
+        for pid, due in zip(batch.index, (batch["last_review"] + self.review_interval).array.asi8):
+            if due not in self._reviews:
+                self._reviews[due] = set()
+                insort(self._review_days, due)
+            self._reviews[due].add(pid)
+        self.version += 1
+
+    def _apply(self, rows: pd.DataFrame, sign: int) -> None:
+        phase_counts = rows.groupby("phase", observed=True).size() * sign
+        merged = self.by_phase.add(phase_counts, fill_value=0).astype("int64")
+        # Keep the regimen order (Series.add sorts the index union alphabetically)
+        order = PHASES + [p for p in merged.index if p not in PHASES]
+        self.by_phase = merged.reindex(order)
+
+        day_counts = rows.groupby("next_infusion").size() * sign
+        merged = self.infusions_by_day.add(day_counts, fill_value=0).astype("int64")
+        self.infusions_by_day = merged[merged != 0].sort_index()
+
+        for col in EFFECTS:
+            counts = rows[col].value_counts().reindex(GRADES, fill_value=0) * sign
+            self.grades.loc[col] = self.grades.loc[col] + counts.values
+
+    # ----------------- Read API (what the page calls) -----------------
+    def phase_table(self) -> pd.DataFrame:
+        return self.by_phase.rename("Doentes").rename_axis("Fase").reset_index()
+
+    def upcoming_infusions(self, today: Optional[date] = None, days: int = 14) -> pd.DataFrame:
+        start = pd.Timestamp(today or date.today())
+        window = self.infusions_by_day.loc[start:start + pd.Timedelta(days=days - 1)]
+        full = pd.date_range(start, periods=days, freq="D")
+        return (
+            window.reindex(full, fill_value=0)
+            .rename("Infusões").rename_axis("Dia").reset_index()
+        )
+
+    def grade_table(self) -> pd.DataFrame:
+        long = (
+            self.grades.rename(index=EFFECTS).rename_axis("Efeito secundário").reset_index()
+            .melt(id_vars="Efeito secundário", var_name="Grau (CTCAE)", value_name="Doentes")
+        )
+        long["Grau (CTCAE)"] = "G" + long["Grau (CTCAE)"].astype(str)
+        return long
+
+    def overdue_reviews(self, today: Optional[date] = None, limit: int = 200) -> pd.DataFrame:
+        """Patients whose review is past due, oldest first."""
+        cut = bisect_left(self._review_days, pd.Timestamp(today or date.today()).value)
+        rows = list(islice(((due, pid) for due in self._review_days[:cut] for pid in sorted(self._reviews[due])), limit))
+        return pd.DataFrame({
+            "ID": [pid for _, pid in rows],
+            "Revisão prevista": pd.to_datetime([due for due, _ in rows]),
+            "Nome": [self._records[pid][0] for _, pid in rows],
+            "Fase": [self._records[pid][1] for _, pid in rows],
+        })
+
+    def overdue_count(self, today: Optional[date] = None) -> int:
+        cut = bisect_left(self._review_days, pd.Timestamp(today or date.today()).value)
+        return sum(len(self._reviews[due]) for due in self._review_days[:cut])
+
+
+def _coerce(batch: pd.DataFrame) -> pd.DataFrame:
+    missing = [c for c in RECORD_COLUMNS if c not in batch.columns]
+    if missing:
+        raise ValueError(f"Colunas em falta no lote da coorte: {', '.join(missing)}")
+    out = batch[RECORD_COLUMNS].copy()
+    out["next_infusion"] = pd.to_datetime(out["next_infusion"]).dt.normalize()
+    out["last_review"] = pd.to_datetime(out["last_review"]).dt.normalize()
+    for col in EFFECTS:
+        out[col] = out[col].astype("int8").clip(0, 4)
+    return out
+
+
+# ----------------- Demo data -----------------
+def demo_cohort(n: int = 50_000, seed: int = 7, today: Optional[date] = None) -> pd.DataFrame:
+    """Synthetic cohort (placeholders, like the single-patient dashboard)."""
+    rng = np.random.default_rng(seed)
+    today = pd.Timestamp(today or date.today())
+    df = pd.DataFrame({
+        "patient_id": [f"P-{i:06d}" for i in range(1, n + 1)],
+        "name": [f"Doente {i}" for i in range(1, n + 1)],
+        "phase": rng.choice(PHASES, size=n, p=[.22, .2, .12, .1, .08, .1, .18]),
+        "next_infusion": today + pd.to_timedelta(rng.integers(0, 21, size=n), unit="D"),
+        "last_review": today - pd.to_timedelta(rng.integers(0, 70, size=n), unit="D"),
+    })
+    for col, p in {
+        "nausea": [.35, .4, .18, .06, .01],
+        "alopecia": [.2, .3, .5, 0, 0],
+        "neutropenia": [.45, .25, .17, .1, .03],
+        "neuropathy": [.6, .28, .1, .02, 0],
+    }.items():
+        df[col] = rng.choice(GRADES, size=n, p=p)
+    return df
+
+
+def iter_chunks(df: pd.DataFrame, size: int = 10_000) -> List[pd.DataFrame]:
+    return [df.iloc[i:i + size] for i in range(0, len(df), size)]
+
+
+def build_demo_aggregates(n: int = 50_000) -> CohortAggregates:
+    agg = CohortAggregates()
+    for chunk in iter_chunks(demo_cohort(n)):
+        agg.ingest(chunk)
+    return agg
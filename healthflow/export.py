@@ -0,0 +1,196 @@
+# export.py
+# Static export of precomputed condition pages
+#
+#   python -m healthflow.export build --out data/site --top 50 --langs pt-PT,en
+#   python -m http.server -d data/site       # or any static file server / CDN
+#
+# The most searched conditions (data/queries.jsonl, topped up from the catalog) are
+# rendered with healthflow.render into <out>/<lang>/<slug>.html plus one index per
+# language. Each page's payload is kept next to it (<slug>.json) and reused by the next
+# build unless --refresh or its content version (prompt hash + model, see
+# analysis.content_version) is outdated, so re-exporting costs no API calls until the
+# prompt or model changes. Missing pages are taken from the app's caches before anything
+# is generated: the topic cache (when HEALTHFLOW_CACHE_URL points at a shared backend)
+# and the knowledge pack. Content of the current prompt counts as current whichever
+# configured model tier produced it. manifest.json lists the pages and their versions; the live
+# app reads it to link cache hits to their static version.
+
+import argparse
+import html
+import json
+import os
+import re
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from healthflow.catalog import BUILTIN, normalize
+from healthflow.prefetch import QUERY_LOG
+from healthflow.render import condition_page_html, page_html
+from healthflow.translation import LANGUAGES, SOURCE_LANG
+
+DEFAULT_OUT = os.path.join(os.getenv("HEALTHFLOW_DATA", "data"), "site")
+
+def slugify(topic: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", normalize(topic)).strip("-") or "condicao"
+
+# ----------------- Topic selection -----------------
+def popular_topics(n: int, log_path: str = QUERY_LOG) -> List[str]:
+    """Most searched conditions first, then catalog entries, up to n."""
+    counts: Counter = Counter()
+    labels: Dict[str, str] = {}
+    if os.path.exists(log_path):
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    q = json.loads(line)["q"]
+                except (ValueError, KeyError):
+                    continue
+                counts[normalize(q)] += 1
+                labels.setdefault(normalize(q), q)
+    topics = [labels[k] for k, _ in counts.most_common(n)]
+    seen = {normalize(t) for t in topics}
+    for cond in BUILTIN:
+        if len(topics) >= n:
+            break
+        if normalize(cond.label) not in seen:
+            topics.append(cond.label)
+            seen.add(normalize(cond.label))
+    return topics
+
+# ----------------- Files -----------------
+def _write(path: str, text: str) -> None:
+    """Atomic write, so a server never sees a half-written page."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def load_manifest(out_dir: str = DEFAULT_OUT) -> dict:
+    path = os.path.join(out_dir, "manifest.json")
+    if not os.path.exists(path):
+        return {"pages": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def load_payload(out_dir: str, slug: str, lang: str = SOURCE_LANG) -> Optional[dict]:
+    path = os.path.join(out_dir, lang, f"{slug}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def static_path(manifest: Mapping, topic: str, lang: str = SOURCE_LANG) -> Optional[str]:
+    """Relative URL of a topic's static page, if it was exported in that language."""
+    page = manifest.get("pages", {}).get(slugify(topic))
+    if page and lang in page.get("langs", ()):
+        return f"{lang}/{slugify(topic)}.html"
+    return None
+
+def export_pages(entries: Iterable[tuple], out_dir: str = DEFAULT_OUT, live_url: Optional[str] = None,
+                 versions: Optional[Mapping[str, str]] = None) -> dict:
+    """Write (topic, lang, payload) entries as pages, then the indexes and manifest.
+
+    `versions` maps topics to the content version of their payloads.
+    """
+    manifest = load_manifest(out_dir)
+    pages = manifest.setdefault("pages", {})
+    for topic, lang, payload in entries:
+        slug = slugify(topic)
+        live = f"{live_url.rstrip('/')}/general" if live_url else None
+        _write(os.path.join(out_dir, lang, f"{slug}.json"), json.dumps(payload, ensure_ascii=False))
+        _write(os.path.join(out_dir, lang, f"{slug}.html"), condition_page_html(topic, payload, lang, live_url=live))
+        page = pages.setdefault(slug, {"topic": topic, "langs": []})
+        if lang not in page["langs"]:
+            page["langs"].append(lang)
+        page["updated"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        if versions and topic in versions:
+            page["version"] = versions[topic]
+
+    for lang in {l for p in pages.values() for l in p["langs"]}:
+        items = sorted((p["topic"], slug) for slug, p in pages.items() if lang in p["langs"])
+        links = "".join(f'<li><a href="{slug}.html">{html.escape(t)}</a></li>' for t, slug in items)
+        other = " · ".join(f'<a href="../{l}/index.html">{LANGUAGES.get(l, l)}</a>' for l in sorted(LANGUAGES) if l != lang)
+        body = f"<p class='kicker'>{other}</p><div class='card'><ul class='clean'>{links}</ul></div>"
+        _write(os.path.join(out_dir, lang, "index.html"), page_html("Condições", body, lang))
+    _write(os.path.join(out_dir, "index.html"), page_html("Condições", (
+        f'<meta http-equiv="refresh" content="0; url={SOURCE_LANG}/index.html">'
+        f'<p class="kicker"><a href="{SOURCE_LANG}/index.html">Condições</a></p>'), SOURCE_LANG))
+    _write(os.path.join(out_dir, "manifest.json"), json.dumps(manifest, ensure_ascii=False, indent=1))
+    return manifest
+
+# ----------------- Build -----------------
+def build(out_dir: str, top: int, langs: List[str], refresh: bool = False, live_url: Optional[str] = None) -> dict:
+    """Analyze (or reuse) the top conditions and export them in every requested language.
+
+    Pages of an older content version are regenerated, most popular first.
+    """
+    from healthflow import cache
+    from healthflow.analysis import ChatModel, ChatSession, content_version
+    from healthflow.pack import KnowledgePack
+    from healthflow.results import ResultStore, TopicCache, content_key, thaw
+    from healthflow.translation import Translator
+
+    model = ChatModel.from_pretrained()
+    session = ChatSession(model)
+    translator = Translator(model.router)
+    current = {content_version(m) for m in model.router.tiers}
+    topics = TopicCache(ResultStore(), version=model.version, backend=cache.from_url(os.getenv("HEALTHFLOW_CACHE_URL")))
+    pack = KnowledgePack.open()
+
+    def cached(topic: str, lang: str = SOURCE_LANG, source: Optional[dict] = None) -> Optional[tuple]:
+        """(payload, version) from the topic cache or the pack; translations must be of `source`."""
+        hit = topics.peek(topic if source is None else f"{lang}:{content_key(source)}")
+        if hit and (source is not None or hit[1] in current):
+            return thaw(topics.store.get(hit[0])), hit[1]
+        packed = pack.get(topic, lang) if pack else None
+        if packed and source is not None:
+            original = pack.get(topic)
+            return packed if original and content_key(original[0]) == content_key(source) else None
+        return packed if packed and packed[1] in current else None
+
+    pages = load_manifest(out_dir)["pages"]
+    entries, versions = [], {}
+    for topic in popular_topics(top):
+        slug = slugify(topic)
+        version = pages.get(slug, {}).get("version")
+        source = load_payload(out_dir, slug) if not refresh and version in current else None
+        origin = "reutilizado" if source is not None else "ok"
+        try:
+            if source is None and not refresh:
+                source, version = cached(topic) or (None, None)
+                origin = "cache" if source is not None else origin
+            if source is None:
+                source = session.analyze(topic).model_dump()
+                version = content_version(session.last_route["model"])
+            for lang in langs:
+                previous = load_payload(out_dir, slug, lang) if origin == "reutilizado" and lang != SOURCE_LANG else None
+                if previous is None and lang != SOURCE_LANG and not refresh:
+                    previous = (cached(topic, lang, source) or (None,))[0]
+                entries.append((topic, lang, previous or translator.translate(source, lang)))
+        except Exception as e:
+            print(f"  {topic}: ignorado ({e})")
+            continue
+        versions[topic] = version
+        print(f"  {topic}: {origin}")
+    return export_pages(entries, out_dir, live_url=live_url, versions=versions)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Exportação estática das páginas de condições")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--out", default=DEFAULT_OUT)
+    b.add_argument("--top", type=int, default=50)
+    b.add_argument("--langs", default=SOURCE_LANG, help="ex.: pt-PT,en,es")
+    b.add_argument("--refresh", action="store_true", help="regenerar mesmo com payload guardado")
+    b.add_argument("--live-url", default=os.getenv("HEALTHFLOW_LIVE_URL"))
+    args = parser.parse_args(argv)
+
+    langs = [l.strip() for l in args.langs.split(",") if l.strip()]
+    t0 = time.perf_counter()
+    manifest = build(args.out, args.top, langs, refresh=args.refresh, live_url=args.live_url)
+    print(f"{len(manifest['pages'])} páginas em {args.out} ({time.perf_counter() - t0:.1f}s)")
+
+if __name__ == "__main__":
+    main()
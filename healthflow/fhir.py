@@ -0,0 +1,276 @@
+# fhir.py
+# FHIR Bulk Data (NDJSON) importer — streams exports line by line into Parquet,
+# one partition per resource type, skipping resources that have not changed.
+#
+#   python -m healthflow.fhir import exports/2025-10-01/ --store data/fhir --workers 4
+#
+# Layout:
+#   data/fhir/<ResourceType>/part-<run>-<n>.parquet   rows mapped to the dashboard model
+#   data/fhir/<ResourceType>/_manifest.sqlite         resource id -> content hash
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+RESOURCE_TYPES = ["Patient", "Condition", "AllergyIntolerance", "Encounter", "MedicationRequest"]
+
+# ----------------- Field helpers -----------------
+def _ref_id(ref: Optional[dict]) -> str:
+    """'Patient/123' -> '123'."""
+    return ((ref or {}).get("reference") or "").rsplit("/", 1)[-1]
+
+def _concept_text(cc: Optional[dict]) -> str:
+    cc = cc or {}
+    if cc.get("text"):
+        return cc["text"]
+    for c in cc.get("coding") or []:
+        if c.get("display"):
+            return c["display"]
+    return ""
+
+def _first(items: Optional[list]) -> dict:
+    return (items or [{}])[0] or {}
+
+# ----------------- Resource -> row mappers -----------------
+def _map_patient(r: dict) -> dict:
+    name = _first(r.get("name"))
+    full = name.get("text") or " ".join((name.get("given") or []) + [name.get("family") or ""]).strip()
+    return {"patient_id": r.get("id", ""), "name": full, "dob": r.get("birthDate", ""), "gender": r.get("gender", "")}
+
+def _map_condition(r: dict) -> dict:
+    category = _concept_text(_first(r.get("category")))
+    codes = [c.get("code") for c in _first(r.get("category")).get("coding") or []]
+    return {
+        "patient_id": _ref_id(r.get("subject")),
+        "condition": _concept_text(r.get("code")),
+        # encounter-diagnosis → main diagnosis, problem-list-item → comorbidity
+        "is_diagnosis": "encounter-diagnosis" in codes or category.lower().startswith("diagn"),
+        "clinical_status": _concept_text(r.get("clinicalStatus")),
+        "onset": r.get("onsetDateTime", "") or r.get("recordedDate", ""),
+    }
+
+def _map_allergy(r: dict) -> dict:
+    return {
+        "patient_id": _ref_id(r.get("patient")),
+        "substance": _concept_text(r.get("code")),
+        "criticality": r.get("criticality", ""),
+    }
+
+def _map_encounter(r: dict) -> dict:
+    return {
+        "patient_id": _ref_id(r.get("subject")),
+        "date": (r.get("period") or {}).get("start", "")[:10],
+        "type": _concept_text(_first(r.get("type"))) or _concept_text(r.get("serviceType")),
+        "summary": "; ".join(filter(None, (_concept_text(c) for c in r.get("reasonCode") or []))),
+    }
+
+def _map_medication(r: dict) -> dict:
+    return {
+        "patient_id": _ref_id(r.get("subject")),
+        "medication": _concept_text(r.get("medicationCodeableConcept")) or _ref_id(r.get("medicationReference")),
+        "dosage": _first(r.get("dosageInstruction")).get("text", ""),
+        "status": r.get("status", ""),
+        "authored_on": r.get("authoredOn", ""),
+    }
+
+MAPPERS: Dict[str, Callable[[dict], dict]] = {
+    "Patient": _map_patient,
+    "Condition": _map_condition,
+    "AllergyIntolerance": _map_allergy,
+    "Encounter": _map_encounter,
+    "MedicationRequest": _map_medication,
+}
+
+# ----------------- Streaming reader -----------------
+def iter_ndjson(path: str) -> Iterator[Tuple[bytes, dict]]:
+    """Yield (raw line, resource) one line at a time; memory does not grow with file size."""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line, json.loads(line)
+
+def resource_type_of(path: str) -> Optional[str]:
+    """Bulk Data file names start with the resource type (e.g. Condition.003.ndjson)."""
+    head = Path(path).name.split(".", 1)[0]
+    return head if head in MAPPERS else None
+
+# ----------------- Manifest (incremental re-import) -----------------
+class _Manifest:
+    """id -> content hash on disk, so memory stays bounded however many resources exist."""
+
+    def __init__(self, path: Path):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS manifest (id TEXT PRIMARY KEY, hash TEXT NOT NULL)")
+
+    def changed(self, items: List[Tuple[str, str]]) -> List[int]:
+        """Positions in `items` whose (id, hash) differs from what was imported before."""
+        known: Dict[str, str] = {}
+        ids = [i for i, _ in items]
+        for k in range(0, len(ids), 900):  # stay under SQLite's bound-parameter limit
+            chunk = ids[k:k + 900]
+            q = f"SELECT id, hash FROM manifest WHERE id IN ({','.join('?' * len(chunk))})"
+            known.update(self.db.execute(q, chunk).fetchall())
+        return [n for n, (i, h) in enumerate(items) if known.get(i) != h]
+
+    def commit(self, items: List[Tuple[str, str]]) -> None:
+        self.db.executemany("INSERT OR REPLACE INTO manifest (id, hash) VALUES (?, ?)", items)
+        self.db.commit()
+
+    def close(self) -> None:
+        self.db.close()
+
+# ----------------- Import one file -----------------
+def import_file(path: str, store: str, batch_rows: int = 50_000) -> Dict[str, int]:
+    """Stream one NDJSON file into its resource-type partition. Safe to run in a worker process."""
+    import pandas as pd
+
+    rtype = resource_type_of(path)
+    if rtype is None:
+        raise ValueError(f"Tipo de recurso FHIR não suportado: {Path(path).name}")
+    out_dir = Path(store) / rtype
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = _Manifest(out_dir / "_manifest.sqlite")
+    run = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f") + f"-{os.getpid()}"
+    mapper = MAPPERS[rtype]
+    stats = {"read": 0, "written": 0, "skipped": 0}
+    rows: List[dict] = []
+    keys: List[Tuple[str, str]] = []
+    part = 0
+
+    def flush():
+        nonlocal part
+        if not rows:
+            return
+        fresh = manifest.changed(keys)
+        stats["skipped"] += len(rows) - len(fresh)
+        if fresh:
+            df = pd.DataFrame([rows[n] for n in fresh]).sort_values("patient_id", kind="stable")
+            # Plain string columns keep part schemas compatible across runs
+            df = df.astype({c: str for c in df.columns if c != "is_diagnosis"})
+            tmp = out_dir / f".part-{run}-{part:05d}.parquet"
+            df.to_parquet(tmp, index=False, compression="zstd")
+            tmp.rename(out_dir / tmp.name[1:])
+            part += 1
+            manifest.commit([keys[n] for n in fresh])
+            stats["written"] += len(fresh)
+        rows.clear()
+        keys.clear()
+
+    try:
+        for line, res in iter_ndjson(path):
+            if res.get("resourceType") != rtype:
+                continue
+            stats["read"] += 1
+            digest = hashlib.sha1(line).hexdigest()
+            row = mapper(res)
+            row.update({"resource_id": res.get("id", ""), "_hash": digest, "_run": run})
+            rows.append(row)
+            keys.append((row["resource_id"], digest))
+            if len(rows) >= batch_rows:
+                flush()
+        flush()
+    finally:
+        manifest.close()
+    return stats
+
+def import_export(paths: List[str], store: str, workers: int = 4) -> Dict[str, Dict[str, int]]:
+    """Import a bulk export (files or directories) with one worker per file.
+
+    Files of the same resource type are imported sequentially so their manifest has a
+    single writer; different types run in parallel.
+    """
+    files: List[str] = []
+    for p in paths:
+        files += sorted(str(f) for f in Path(p).glob("*.ndjson*")) if Path(p).is_dir() else [p]
+    by_type: Dict[str, List[str]] = {}
+    for f in files:
+        rtype = resource_type_of(f)
+        if rtype:
+            by_type.setdefault(rtype, []).append(f)
+
+    results: Dict[str, Dict[str, int]] = {}
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {t: pool.submit(_import_many, fs, store) for t, fs in by_type.items()}
+        for t, fut in futures.items():
+            results[t] = fut.result()
+    return results
+
+def _import_many(files: List[str], store: str) -> Dict[str, int]:
+    total = {"read": 0, "written": 0, "skipped": 0}
+    for f in files:
+        for k, v in import_file(f, store).items():
+            total[k] += v
+    return total
+
+# ----------------- Read side (dashboard model) -----------------
+def _read_type(store: str, rtype: str, patient_id: str):
+    import pandas as pd
+
+    part_dir = Path(store) / rtype
+    parts = sorted(part_dir.glob("part-*.parquet")) if part_dir.exists() else []
+    if not parts:
+        return pd.DataFrame()
+    df = pd.read_parquet(parts, filters=[("patient_id", "==", patient_id)])
+    # Re-imported resources appear in newer parts; the latest run wins
+    return df.sort_values("_run", kind="stable").drop_duplicates("resource_id", keep="last")
+
+def has_patient(store: str, patient_id: str) -> bool:
+    """True if a Patient resource with this id was imported."""
+    return not _read_type(store, "Patient", patient_id).empty
+
+def load_patient(store: str, patient_id: str) -> Optional[dict]:
+    """Patient record in the dashboard's shape, or None if the patient was never imported."""
+    pat = _read_type(store, "Patient", patient_id)
+    if pat.empty:
+        return None
+    p = pat.iloc[-1]
+    cond = _read_type(store, "Condition", patient_id)
+    allergies = _read_type(store, "AllergyIntolerance", patient_id)
+    enc = _read_type(store, "Encounter", patient_id)
+    meds = _read_type(store, "MedicationRequest", patient_id)
+
+    diagnoses = cond[cond["is_diagnosis"]]["condition"].tolist() if not cond.empty else []
+    comorbid = cond[~cond["is_diagnosis"]]["condition"].tolist() if not cond.empty else []
+    return {
+        "id": p["patient_id"],
+        "name": p["name"],
+        "dob": p["dob"],
+        "diagnosis": diagnoses[0] if diagnoses else "—",
+        "comorbidities": comorbid,
+        "allergies": allergies["substance"].tolist() if not allergies.empty else [],
+        "consults": [
+            {"Data": r["date"], "Tipo": r["type"], "Sumário detalhado": r["summary"], "Documento": f"FHIR Encounter/{r['resource_id']}"}
+            for _, r in enc.sort_values("date", ascending=False).iterrows()
+        ] if not enc.empty else [],
+        "medications": [
+            {"Medicamento": r["medication"], "Posologia": r["dosage"], "Estado": r["status"]}
+            for _, r in meds.iterrows()
+        ] if not meds.empty else [],
+    }
+
+
+def main(argv: Optional[list] = None) -> None:
+    ap = argparse.ArgumentParser(description="Importador FHIR Bulk Data (NDJSON) para Parquet.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    imp = sub.add_parser("import")
+    imp.add_argument("paths", nargs="+", help="ficheiros .ndjson(.gz) ou diretórios de exportação")
+    imp.add_argument("--store", default=os.getenv("HEALTHFLOW_PATIENT_STORE", "data/fhir"))
+    imp.add_argument("--workers", type=int, default=len(RESOURCE_TYPES))
+    args = ap.parse_args(argv)
+
+    for rtype, s in import_export(args.paths, args.store, args.workers).items():
+        print(f"{rtype}: {s['read']} lidos, {s['written']} escritos, {s['skipped']} sem alterações")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+# governor.py
+# Per-session, per-user and per-tenant budgets for model generations
+#
+# Every generation is charged (1 request + its tokens) to the session, the user and the
+# tenant that triggered it, in sliding windows. Past a soft limit the requester is warned
+# and gets no speculative prefetches; past a hard limit the pipeline runs cache-only for
+# them (cached and stale analyses are still served, nothing new is generated) until the
+# window frees up. Usage lives in memory and is saved every `save_every_s` to
+# data/governor.json, so a restart does not hand out fresh budgets. check(reserve=True)
+# books the request atomically with the decision, so concurrent requests cannot all pass
+# the check before any is charged; charge() then settles its tokens.
+#
+# Identities must not be client-chosen: the tenant comes from the proxy-set
+# X-Healthflow-Tenant header only with HEALTHFLOW_TRUSTED_PROXY=1 (else HEALTHFLOW_TENANT),
+# and anonymous users are keyed on their client IP rather than on a per-session id.
+#
+# Limits: DEFAULT_LIMITS, overridden by the JSON file in HEALTHFLOW_BUDGETS (same shape;
+# "tenants" holds per-tenant overrides of the "tenant" limits).
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+STATE_PATH = os.path.join(os.getenv("HEALTHFLOW_DATA", "data"), "governor.json")
+TRUSTED_PROXY = os.getenv("HEALTHFLOW_TRUSTED_PROXY", "0") == "1"
+DEFAULT_TENANT = os.getenv("HEALTHFLOW_TENANT", "default")
+
+SCOPES = ("session", "user", "tenant")
+SCOPE_LABELS = {"session": "Sessão", "user": "Utilizador", "tenant": "Instituição"}
+
+DEFAULT_LIMITS = {
+    "window_s": 3600,
+    "session": {"soft": {"requests": 15, "tokens": 60_000}, "hard": {"requests": 30, "tokens": 120_000}},
+    "user": {"soft": {"requests": 30, "tokens": 120_000}, "hard": {"requests": 60, "tokens": 240_000}},
+    "tenant": {"soft": {"requests": 400, "tokens": 1_600_000}, "hard": {"requests": 800, "tokens": 3_200_000}},
+    "tenants": {},
+}
+
+def load_limits(path: Optional[str] = None) -> dict:
+    limits = json.loads(json.dumps(DEFAULT_LIMITS))
+    path = path or os.getenv("HEALTHFLOW_BUDGETS")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            custom = json.load(f)
+        for k, v in custom.items():
+            if isinstance(v, dict) and k in SCOPES:
+                limits[k].update(v)
+            else:
+                limits[k] = v
+    return limits
+
+def _fmt(limits: dict) -> str:
+    return " · ".join(f"{v} {'pedidos' if k == 'requests' else k}" for k, v in limits.items())
+
+@dataclass(frozen=True)
+class Identity:
+    """Who a generation is charged to; the user defaults to the session."""
+    session: str
+    user: Optional[str] = None
+    tenant: str = "default"
+
+    def ids(self) -> Dict[str, str]:
+        return {"session": self.session, "user": self.user or self.session, "tenant": self.tenant}
+
+def request_tenant(headers) -> str:
+    """Tenant of a request: the proxy's X-Healthflow-Tenant header if the proxy is trusted."""
+    return (headers.get("X-Healthflow-Tenant") if TRUSTED_PROXY else None) or DEFAULT_TENANT
+
+def client_ip(headers, remote_ip: Optional[str]) -> Optional[str]:
+    """Client address: the first X-Forwarded-For hop if the proxy is trusted, else the peer."""
+    forwarded = headers.get("X-Forwarded-For") if TRUSTED_PROXY else None
+    return forwarded.split(",")[0].strip() if forwarded else remote_ip
+
+@dataclass
+class Decision:
+    level: str                          # "ok" | "soft" | "hard"
+    scope: Optional[str] = None         # the scope that decided it
+    usage: Dict[str, int] = field(default_factory=dict)
+    retry_after_s: float = 0.0
+    reservation: Optional[list] = None  # booked (scope key, event) pairs, see check(reserve=True)
+
+    @property
+    def message(self) -> str:
+        who = SCOPE_LABELS.get(self.scope or "", "").lower()
+        if self.level == "hard":
+            return (f"Limite de utilização atingido ({who}). Só são mostradas análises já existentes; "
+                    f"novas análises dentro de {int(self.retry_after_s // 60) + 1} min.")
+        if self.level == "soft":
+            return f"Está perto do limite de utilização ({who}): {self.usage.get('requests', 0)} análises na última hora."
+        return ""
+
+class OverBudget(Exception):
+    """A hard budget is exhausted: only cached content can be served."""
+
+    def __init__(self, decision: Decision):
+        super().__init__(decision.message)
+        self.decision = decision
+        self.retry_after = decision.retry_after_s
+
+# ----------------- Governor -----------------
+class Governor:
+    """Sliding-window request/token accounting with soft and hard limits per scope."""
+
+    def __init__(self, limits: Optional[dict] = None, path: Optional[str] = STATE_PATH,
+                 save_every_s: float = 30):
+        self.limits = limits or load_limits()
+        self.window_s = float(self.limits.get("window_s", 3600))
+        self.path = path
+        self.save_every_s = save_every_s
+        self._events: Dict[Tuple[str, str], Deque[Tuple[float, int]]] = {}   # (scope, id) -> (ts, tokens)
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._saver: Optional[threading.Thread] = None
+        self._load()
+
+    def limits_for(self, scope: str, ident: str) -> dict:
+        if scope == "tenant" and ident in self.limits.get("tenants", {}):
+            return {**self.limits["tenant"], **self.limits["tenants"][ident]}
+        return self.limits[scope]
+
+    def _window(self, scope: str, ident: str, now: float, create: bool = False) -> Deque[Tuple[float, int]]:
+        events = self._events.setdefault((scope, ident), deque()) if create else self._events.get((scope, ident), deque())
+        while events and now - events[0][0] > self.window_s:
+            events.popleft()
+        return events
+
+    def usage(self, scope: str, ident: str) -> Dict[str, int]:
+        with self._lock:
+            events = self._window(scope, ident, time.time())
+            return {"requests": len(events), "tokens": sum(t for _, t in events)}
+
+    def check(self, identity: Identity, reserve: bool = False) -> Decision:
+        """Budget state of `identity` before a new generation (the strictest scope wins).
+
+        With `reserve`, a request that is not over the hard limit is booked in the same
+        critical section; settle it with charge(decision=...) or undo it with release().
+        """
+        now = time.time()
+        decision = Decision("ok")
+        with self._lock:
+            for scope, ident in identity.ids().items():
+                events = self._window(scope, ident, now)
+                usage = {"requests": len(events), "tokens": sum(t for _, t in events)}
+                limits = self.limits_for(scope, ident)
+                for level in ("hard", "soft"):
+                    if any(usage[k] >= v for k, v in limits.get(level, {}).items()):
+                        if level == "hard":
+                            retry = self.window_s - (now - events[0][0]) if events else 0.0
+                            return Decision("hard", scope, usage, max(1.0, retry))
+                        if decision.level == "ok":
+                            decision = Decision("soft", scope, usage)
+                        break
+            if reserve:
+                decision.reservation = []
+                for scope, ident in identity.ids().items():
+                    event = [now, 0]
+                    self._window(scope, ident, now, create=True).append(event)
+                    decision.reservation.append(((scope, ident), event))
+                self._dirty = True
+        return decision
+
+    def charge(self, identity: Identity, tokens: int, requests: int = 1,
+               decision: Optional[Decision] = None) -> None:
+        """Record a generation; with a reserving `decision`, settle its booked request instead."""
+        now = time.time()
+        with self._lock:
+            if decision is not None and decision.reservation:
+                for _, event in decision.reservation:
+                    event[1] = tokens
+                decision.reservation = None
+            else:
+                for scope, ident in identity.ids().items():
+                    events = self._window(scope, ident, now, create=True)
+                    for i in range(requests):
+                        events.append((now, tokens if i == 0 else 0))
+            self._dirty = True
+        self._ensure_saver()
+
+    def release(self, decision: Optional[Decision]) -> None:
+        """Undo an unsettled reservation (the request generated nothing)."""
+        if decision is None or not decision.reservation:
+            return
+        with self._lock:
+            for key, event in decision.reservation:
+                events = self._events.get(key)
+                if events is not None and event in events:
+                    events.remove(event)
+            decision.reservation = None
+            self._dirty = True
+
+    def reset(self, scope: str, ident: str) -> None:
+        with self._lock:
+            self._events.pop((scope, ident), None)
+            self._dirty = True
+
+    def report(self, scope: Optional[str] = None) -> List[dict]:
+        """Current consumption per (scope, id), heaviest first — for the admin page."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for (sc, ident), events in list(self._events.items()):
+                if scope and sc != scope:
+                    continue
+                self._window(sc, ident, now)
+                if not events:
+                    del self._events[(sc, ident)]
+                    continue
+                usage = {"requests": len(events), "tokens": sum(t for _, t in events)}
+                limits = self.limits_for(sc, ident)
+                state = "normal"
+                for level, label in (("hard", "só cache"), ("soft", "aviso")):
+                    if any(usage[k] >= v for k, v in limits.get(level, {}).items()):
+                        state = label
+                        break
+                rows.append({
+                    "âmbito": SCOPE_LABELS[sc],
+                    "id": ident,
+                    "pedidos": usage["requests"],
+                    "tokens": usage["tokens"],
+                    "limite suave": _fmt(limits.get("soft", {})),
+                    "limite rígido": _fmt(limits.get("hard", {})),
+                    "estado": state,
+                    "último (s)": int(now - events[-1][0]),
+                })
+        rows.sort(key=lambda r: (r["tokens"], r["pedidos"]), reverse=True)
+        return rows
+
+    # ----------------- persistence -----------------
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for row in saved.get("events", []):
+            events = [(ts, tok) for ts, tok in row["e"] if now - ts <= self.window_s]
+            if events:
+                self._events[(row["scope"], row["id"])] = deque(events)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            now = time.time()
+            rows = [{"scope": s, "id": i, "e": [[round(ts, 1), tok] for ts, tok in self._window(s, i, now)]}
+                    for (s, i) in list(self._events)]
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"saved_at": now, "events": [r for r in rows if r["e"]]}, f)
+        os.replace(tmp, self.path)
+
+    def _ensure_saver(self) -> None:
+        if self._saver is not None or not self.path:
+            return
+        with self._lock:
+            if self._saver is not None:
+                return
+            self._saver = threading.Thread(target=self._save_loop, name="governor", daemon=True)
+            self._saver.start()
+        atexit.register(self.save)
+
+    def _save_loop(self) -> None:
+        while True:
+            time.sleep(self.save_every_s)
+            try:
+                self.save()
+            except OSError:
+                pass
@@ -0,0 +1,182 @@
+# jobs.py
+# Background analysis jobs: bounded worker pool, progress, hard timeout and cancellation
+#
+# The page submits an analysis and returns immediately; a fragment polls the job and
+# renders partial (fan-out sections as they arrive) or final results. Every job runs under
+# a routing.CancelToken with a deadline: cancelling it, or passing the deadline, stops the
+# model stream between chunks and frees the worker at once instead of after the model
+# answers. Cache hits never need a job (AnalysisPipeline.lookup answers them inline).
+
+import itertools
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from healthflow.analysis import ChatSession
+from healthflow.governor import Identity
+from healthflow.pipeline import AnalysisPipeline, AnalysisResult
+from healthflow.routing import ROUTE_STATS, CancelToken, Cancelled, cancellable
+from healthflow.translation import SOURCE_LANG
+
+FINAL = ("done", "error", "cancelled", "timeout")
+STATUS_LABELS = {
+    "queued": "Em fila", "running": "A gerar", "done": "Concluída", "error": "Erro",
+    "cancelled": "Cancelada", "timeout": "Tempo limite excedido",
+}
+
+class QueueFull(Exception):
+    def __init__(self):
+        super().__init__("Demasiadas análises em curso. Tente novamente dentro de alguns segundos.")
+
+class Job:
+    """One submitted analysis; fields are written by the worker and read by the page."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, topic: str, lang: str, client_id: str, timeout_s: float):
+        self.id = f"j{next(self._ids)}"
+        self.topic = topic
+        self.lang = lang
+        self.client_id = client_id
+        self.status = "queued"
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.timeout_s = timeout_s
+        self.token = CancelToken(deadline=self.submitted + timeout_s)
+        self.result: Optional[AnalysisResult] = None
+        self.error: Optional[str] = None
+        self.exception: Optional[Exception] = None     # e.g. OverBudget, for the page to handle
+        self.partial: Optional[dict] = None           # fan-out: fields received so far
+        self.sections = (0, 0)                        # fan-out: (done, total)
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINAL
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.submitted
+
+    @property
+    def label(self) -> str:
+        return STATUS_LABELS[self.status]
+
+    def progress(self, expected_s: float) -> float:
+        """0..1 for a progress bar: sections done in fan-out mode, else elapsed/expected."""
+        if self.done:
+            return 1.0
+        done, total = self.sections
+        if total:
+            return min(0.95, 0.05 + 0.9 * done / total)
+        if self.started is None:
+            return 0.0
+        return min(0.95, (time.monotonic() - self.started) / max(1.0, expected_s))
+
+class JobRunner:
+    """Bounded pool of analysis workers shared by every session of the process."""
+
+    def __init__(self, pipeline: AnalysisPipeline, workers: int = 4, timeout_s: float = 90,
+                 max_pending: int = 64, keep: int = 1000):
+        self.pipeline = pipeline
+        self.timeout_s = timeout_s
+        self.max_pending = max_pending
+        self.keep = keep
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters: Counter = Counter()
+
+    @classmethod
+    def create(cls, pipeline: AnalysisPipeline) -> "JobRunner":
+        return cls(pipeline,
+                   workers=int(os.getenv("HEALTHFLOW_JOB_WORKERS", "4")),
+                   timeout_s=float(os.getenv("HEALTHFLOW_JOB_TIMEOUT_S", "90")))
+
+    def submit(self, topic: str, client_id: str, lang: str = SOURCE_LANG,
+               identity: Optional[Identity] = None) -> Job:
+        """Queue an analysis; raises QueueFull when too many jobs are waiting or running.
+        Each job gets its own ChatSession: a cancelled worker may still be running, and
+        must not share session state (usage, route, progress callback) with its successor."""
+        with self._lock:
+            active = sum(not j.done for j in self._jobs.values())
+            if active >= self.max_pending:
+                self._counters["recusados"] += 1
+                raise QueueFull()
+            job = Job(topic, lang, client_id, self.timeout_s)
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.keep:
+                oldest = next(iter(self._jobs))
+                if not self._jobs[oldest].done:
+                    break
+                del self._jobs[oldest]
+        self._counters["submetidos"] += 1
+        self._pool.submit(self._run, job, identity)
+        return job
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        """The job, marked as timed out as soon as its deadline passes (the worker follows)."""
+        job = self._jobs.get(job_id) if job_id else None
+        if job is not None and not job.done and job.token.cancelled:
+            self._finish(job, job.token.reason or "cancelled", None)
+        return job
+
+    def cancel(self, job_id: Optional[str]) -> bool:
+        """Cancel a queued or running job. It is reported cancelled right away; a running
+        model stream stops at its next chunk and the worker moves on."""
+        job = self.get(job_id)
+        if job is None or job.done:
+            return False
+        job.token.cancel("cancelled")
+        self._finish(job, "cancelled")
+        return True
+
+    def expected_s(self) -> float:
+        """Typical generation time, for progress bars: p50 of the fast tier, else 15 s."""
+        tiers = self.pipeline.model.router.tiers
+        return ROUTE_STATS.tracker(tiers[0]).percentile(50, 15.0) if tiers else 15.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            states = Counter(j.status for j in self._jobs.values())
+        return {**self._counters, **{STATUS_LABELS[s]: n for s, n in states.items() if s not in FINAL}}
+
+    # ----------------- worker -----------------
+    def _finish(self, job: Job, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            if job.done:
+                return
+            job.error = error
+            job.finished = time.monotonic()
+            job.status = status
+            self._counters[STATUS_LABELS[status].lower()] += 1
+
+    def _run(self, job: Job, identity: Optional[Identity]) -> None:
+        if job.token.cancelled:   # cancelled, or timed out, while queued
+            return self._finish(job, job.token.reason or "cancelled")
+        with self._lock:
+            if job.done:
+                return
+            job.started = time.monotonic()
+            job.status = "running"
+        session = ChatSession(model=self.pipeline.model)
+
+        def on_partial(fields: dict, done: int, total: int) -> None:
+            job.partial, job.sections = fields, (done, total)
+
+        session.on_partial = on_partial
+        try:
+            with cancellable(job.token):
+                job.result = self.pipeline.analyze(job.topic, client_id=job.client_id, lang=job.lang,
+                                                   session=session, identity=identity)
+            self._finish(job, "done")   # no-op if it was cancelled meanwhile
+        except Cancelled as e:
+            self._finish(job, e.reason, str(e))
+        except Exception as e:
+            job.exception = e
+            self._finish(job, "timeout" if job.token.reason == "timeout" else "error", str(e))
+        finally:
+            session.on_partial = None
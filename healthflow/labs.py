@@ -0,0 +1,201 @@
+# labs.py
+# Lab results — streaming ingest of blood-count exports, vectorized CTCAE grading,
+# append-only Parquet store and LTTB downsampling for plotting long series.
+#
+#   python -m healthflow.labs ingest exports/hemogramas.ndjson --store data/labs
+
+import argparse
+import os
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+LAB_COLUMNS = ["patient_id", "ts", "test", "value"]
+
+# Canonical test names and the aliases seen in hospital exports
+TEST_ALIASES = {
+    "neutrofilos": "neutrofilos", "anc": "neutrofilos", "neut": "neutrofilos",
+    "plaquetas": "plaquetas", "plt": "plaquetas",
+    "hemoglobina": "hemoglobina", "hb": "hemoglobina", "hgb": "hemoglobina",
+    "leucocitos": "leucocitos", "wbc": "leucocitos",
+}
+
+# CTCAE v5 lower bounds per grade (G1..G4); value < bound → at least that grade.
+# Units: ×10⁹/L for counts, g/dL for hemoglobin (LLN assumed for adult female).
+CTCAE_BOUNDS = {
+    "neutrofilos": (2.0, 1.5, 1.0, 0.5),
+    "plaquetas": (150.0, 75.0, 50.0, 25.0),
+    "hemoglobina": (12.0, 10.0, 8.0, -np.inf),   # no lab-defined G4
+    "leucocitos": (4.0, 3.0, 2.0, 1.0),
+}
+
+TEST_LABELS = {
+    "neutrofilos": "Neutrófilos (×10⁹/L)",
+    "plaquetas": "Plaquetas (×10⁹/L)",
+    "hemoglobina": "Hemoglobina (g/dL)",
+    "leucocitos": "Leucócitos (×10⁹/L)",
+}
+
+N_BUCKETS = 32
+
+# ----------------- Grading -----------------
+def grade_ctcae(df: pd.DataFrame) -> pd.Series:
+    """CTCAE grade (0–4) for every row, computed per test with array comparisons."""
+    grade = np.zeros(len(df), dtype="int8")
+    values = df["value"].to_numpy(dtype="float64")
+    tests = df["test"].to_numpy()
+    for test, bounds in CTCAE_BOUNDS.items():
+        mask = tests == test
+        if not mask.any():
+            continue
+        v = values[mask]
+        # Each bound crossed adds one grade: sum of (v < bound_k)
+        grade[mask] = (v[:, None] < np.asarray(bounds)[None, :]).sum(axis=1)
+    return pd.Series(grade, index=df.index, name="grade")
+
+# ----------------- Streaming readers -----------------
+def iter_lab_chunks(path: str, chunksize: int = 100_000) -> Iterator[pd.DataFrame]:
+    """Yield normalized, graded chunks from a CSV or NDJSON export without loading it whole."""
+    if path.endswith((".ndjson", ".jsonl", ".json")):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype=False)
+    else:
+        reader = pd.read_csv(path, chunksize=chunksize)
+    for chunk in reader:
+        yield normalize(chunk)
+
+def normalize(chunk: pd.DataFrame) -> pd.DataFrame:
+    missing = [c for c in LAB_COLUMNS if c not in chunk.columns]
+    if missing:
+        raise ValueError(f"Colunas em falta na exportação de análises: {', '.join(missing)}")
+    out = chunk[LAB_COLUMNS].copy()
+    out["patient_id"] = out["patient_id"].astype(str)
+    out["ts"] = pd.to_datetime(out["ts"], utc=True).dt.tz_localize(None)
+    out["test"] = out["test"].astype(str).str.strip().str.lower().map(TEST_ALIASES)
+    out["value"] = pd.to_numeric(out["value"], errors="coerce")
+    out = out.dropna(subset=["test", "value", "ts"])
+    out["grade"] = grade_ctcae(out)
+    return out
+
+# ----------------- Append-only store -----------------
+def _bucket(patient_id: str) -> int:
+    return zlib.crc32(patient_id.encode()) % N_BUCKETS
+
+class LabStore:
+    """Append-only Parquet store, hive-partitioned by patient hash bucket.
+
+    Each ingest writes new part files; nothing is rewritten. Reading one patient only
+    touches the files of its bucket.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def append(self, df: pd.DataFrame) -> int:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if df.empty:
+            return 0
+        buckets = df["patient_id"].map({p: _bucket(p) for p in df["patient_id"].unique()})
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        for b, part in df.groupby(buckets):
+            out_dir = self.root / f"bucket={b:02d}"
+            out_dir.mkdir(parents=True, exist_ok=True)
+            table = pa.Table.from_pandas(part.sort_values(["patient_id", "ts"]), preserve_index=False)
+            tmp = out_dir / f".part-{stamp}-{os.getpid()}.parquet"
+            pq.write_table(table, tmp, compression="zstd")
+            tmp.rename(out_dir / tmp.name[1:])  # atomic publish
+        return len(df)
+
+    def ingest(self, path: str, chunksize: int = 100_000) -> int:
+        return sum(self.append(chunk) for chunk in iter_lab_chunks(path, chunksize))
+
+    def read_patient(self, patient_id: str) -> pd.DataFrame:
+        import pyarrow.parquet as pq
+
+        bucket_dir = self.root / f"bucket={_bucket(patient_id):02d}"
+        if not bucket_dir.exists():
+            return pd.DataFrame(columns=LAB_COLUMNS + ["grade"])
+        table = pq.read_table(bucket_dir, filters=[("patient_id", "=", patient_id)])
+        return table.to_pandas().sort_values("ts", kind="stable").reset_index(drop=True)
+
+# ----------------- Downsampling -----------------
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of `n_out` points preserving the visual shape."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        xs, ys = x[lo:hi], y[lo:hi]
+        area = np.abs((x[a] - avg_x) * (ys - y[a]) - (x[a] - xs) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return idx
+
+def downsample(df: pd.DataFrame, n_out: int = 400) -> pd.DataFrame:
+    """Downsample each test's series independently (server-side, before plotting)."""
+    parts = []
+    for _, g in df.groupby("test", sort=False):
+        x = g["ts"].to_numpy(dtype="datetime64[ns]").astype("int64").astype("float64")
+        parts.append(g.iloc[lttb(x, g["value"].to_numpy(dtype="float64"), n_out)])
+    return pd.concat(parts) if parts else df
+
+def latest_grades(df: pd.DataFrame) -> pd.Series:
+    """Most recent grade per test (index: test)."""
+    if df.empty:
+        return pd.Series(dtype="int8")
+    return df.sort_values("ts").groupby("test")["grade"].last()
+
+# ----------------- Demo data -----------------
+def demo_labs(patient_id: str, start: datetime, days: int = 900, per_day: int = 4, seed: int = 3) -> pd.DataFrame:
+    """Synthetic long-running series with a nadir ~10 days after each 14-day cycle."""
+    rng = np.random.default_rng(seed)
+    n = days * per_day
+    ts = pd.date_range(start, periods=n, freq=timedelta(hours=24 / per_day))
+    day_in_cycle = (np.arange(n) / per_day) % 14
+    nadir = np.exp(-((day_in_cycle - 10) ** 2) / 6)
+    base = {
+        "neutrofilos": 3.2 - 2.4 * nadir,
+        "plaquetas": 230 - 120 * nadir,
+        "hemoglobina": 12.6 - 1.8 * nadir,
+        "leucocitos": 6.0 - 3.8 * nadir,
+    }
+    frames = [
+        pd.DataFrame({
+            "patient_id": patient_id, "ts": ts, "test": t,
+            "value": np.maximum(v * rng.normal(1, 0.06, n), 0.05),
+        })
+        for t, v in base.items()
+    ]
+    df = pd.concat(frames, ignore_index=True)
+    df["grade"] = grade_ctcae(df)
+    return df
+
+
+def main(argv: Optional[list] = None) -> None:
+    ap = argparse.ArgumentParser(description="Ingestão de análises (CSV/NDJSON) para o arquivo colunar.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ing = sub.add_parser("ingest")
+    ing.add_argument("paths", nargs="+")
+    ing.add_argument("--store", default=os.getenv("HEALTHFLOW_LAB_STORE", "data/labs"))
+    ing.add_argument("--chunksize", type=int, default=100_000)
+    args = ap.parse_args(argv)
+
+    store = LabStore(args.store)
+    for p in args.paths:
+        print(f"{p}: {store.ingest(p, args.chunksize)} resultados")
+
+
+if __name__ == "__main__":
+    main()
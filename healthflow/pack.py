@@ -0,0 +1,239 @@
+# pack.py
+# Knowledge pack: validated analyses in one memory-mapped Arrow IPC file
+#
+#   python -m healthflow.pack build --out data/knowledge.arrow --top 2000 --langs pt-PT,en
+#   python -m healthflow.pack info data/knowledge.arrow
+#
+# One row per (language, condition), sorted by "lang|normalized topic" so a lookup is a
+# binary search over the key column. The file is written uncompressed and opened with
+# pyarrow.memory_map: every process maps the same pages (zero copy, shared through the OS
+# page cache) and opening costs only reading the footer, whatever the pack size.
+#
+# The pipeline consults the pack right after its topic cache, so it works as a preloaded
+# first tier; entries keep the content version they were generated with and are refreshed
+# by healthflow.revalidate when a model is available. Without GEMINI_API_KEY (offline mode)
+# the pack is the only source of new analyses.
+#
+# Build sources, cheapest first: the previous pack, the static export's payloads
+# (healthflow.export), then the model for whatever is still missing. Every payload is
+# validated against MedicalCards before it is packed.
+
+import argparse
+import json
+import os
+import time
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from healthflow.catalog import normalize
+from healthflow.translation import LANGUAGES, SOURCE_LANG
+
+PACK_PATH = os.getenv("HEALTHFLOW_PACK", os.path.join(os.getenv("HEALTHFLOW_DATA", "data"), "knowledge.arrow"))
+FORMAT = "1"
+
+def pack_key(topic: str, lang: str = SOURCE_LANG) -> str:
+    return f"{lang}|{normalize(topic)}"
+
+# ----------------- Reader -----------------
+class KnowledgePack:
+    """Read-only view of a pack file; safe to share between threads."""
+
+    last_error: Optional[str] = None   # why the last open() returned None for an existing file
+
+    def __init__(self, path: str):
+        import pyarrow as pa  # lazy: keeps pyarrow out of page imports until a pack exists
+
+        t0 = time.perf_counter()
+        self.path = path
+        self._source = pa.memory_map(path, "r")
+        table = pa.ipc.open_file(self._source).read_all()
+        if table.num_rows and table.column("key").num_chunks != 1:
+            raise Exception(f"Pacote inválido (mais de um bloco): {path}")
+        meta = {k.decode(): v.decode() for k, v in (table.schema.metadata or {}).items()}
+        if meta.get("healthflow.pack") != FORMAT:
+            raise Exception(f"Formato de pacote não suportado: {path}")
+        self.meta = meta
+        self._table = table
+        self._keys = table.column("key").chunk(0) if table.num_rows else None
+        self._topics: Dict[str, List[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.open_ms = round((time.perf_counter() - t0) * 1000, 2)
+
+    @classmethod
+    def open(cls, path: Optional[str] = PACK_PATH) -> Optional["KnowledgePack"]:
+        """The pack at `path`, or None when there is none (or it cannot be read, see last_error)."""
+        cls.last_error = None
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except Exception as e:
+            cls.last_error = f"Pacote de conhecimento ignorado ({path}): {e}"
+            return None
+
+    def __len__(self) -> int:
+        return self._table.num_rows
+
+    def _find(self, key: str) -> Optional[int]:
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._keys[mid].as_py() < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._keys[lo].as_py() == key else None
+
+    def get(self, topic: str, lang: str = SOURCE_LANG) -> Optional[Tuple[dict, str]]:
+        """(payload, content version) of `topic` in `lang`, or None."""
+        row = self._find(pack_key(topic, lang))
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        payload = json.loads(self._table.column("payload")[row].as_py())
+        return payload, self._table.column("version")[row].as_py()
+
+    def contains(self, topic: str, lang: str = SOURCE_LANG) -> bool:
+        return self._find(pack_key(topic, lang)) is not None
+
+    def topics(self, lang: str = SOURCE_LANG) -> List[str]:
+        """Conditions packed in `lang` (computed once per language)."""
+        if lang not in self._topics:
+            prefix = f"{lang}|"
+            self._topics[lang] = [t for k, t in zip(self._keys.to_pylist(), self._table.column("topic").to_pylist())
+                                  if k.startswith(prefix)] if len(self) else []
+        return self._topics[lang]
+
+    def rows(self) -> Iterator[dict]:
+        for batch in self._table.to_batches():
+            yield from batch.to_pylist()
+
+    def stats(self) -> dict:
+        return {
+            "entradas": len(self), "MB": round(os.path.getsize(self.path) / 2**20, 1),
+            "criado": self.meta.get("built_at"), "abertura (ms)": self.open_ms,
+            "acertos": self.hits, "falhas": self.misses,
+        }
+
+# ----------------- Writer -----------------
+def write_pack(path: str, entries: Mapping[str, dict], meta: Optional[Mapping[str, str]] = None) -> int:
+    """Write `entries` (pack key -> {topic, lang, version, payload}) atomically; returns the row count."""
+    import pyarrow as pa
+
+    keys = sorted(entries)
+    schema = pa.schema(
+        [("key", pa.string()), ("topic", pa.string()), ("lang", pa.string()),
+         ("version", pa.string()), ("payload", pa.string())],
+        metadata={"healthflow.pack": FORMAT, "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **(meta or {})},
+    )
+    table = pa.table({
+        "key": keys,
+        "topic": [entries[k]["topic"] for k in keys],
+        "lang": [entries[k]["lang"] for k in keys],
+        "version": [entries[k]["version"] or "" for k in keys],
+        "payload": [json.dumps(entries[k]["payload"], ensure_ascii=False, separators=(",", ":")) for k in keys],
+    }, schema=schema)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        writer.write_table(table, max_chunksize=max(1, len(keys)))   # one batch: one contiguous key column
+    os.replace(tmp, path)   # readers that mapped the old file keep their pages
+    return len(keys)
+
+def _valid(payload: Mapping) -> bool:
+    from healthflow.analysis import MedicalCards
+    try:
+        MedicalCards.model_validate(payload)
+        return True
+    except Exception:
+        return False
+
+# ----------------- Build -----------------
+def build(out: str, top: int, langs: List[str], export_dir: Optional[str] = None,
+          refresh: bool = False, offline: bool = False) -> int:
+    """Pack the top conditions in every language, reusing what is already validated.
+
+    Entries of an older content version are regenerated unless `offline`.
+    """
+    from healthflow.analysis import ChatModel, ChatSession, content_version
+    from healthflow.export import DEFAULT_OUT, load_manifest, load_payload, popular_topics, slugify
+    from healthflow.translation import Translator
+
+    model = ChatModel.from_pretrained()
+    offline = offline or model.client is None
+    session = ChatSession(model)
+    translator = Translator(model.router)
+    export_dir = export_dir or DEFAULT_OUT
+    exported = load_manifest(export_dir)["pages"]
+    previous = KnowledgePack.open(out) if not refresh else None
+    counts: Dict[str, int] = {"pacote": 0, "exportação": 0, "gerados": 0, "ignorados": 0}
+    entries: Dict[str, dict] = {}
+
+    for topic in popular_topics(top):
+        found: Dict[str, Tuple[dict, str]] = {}
+        for lang in langs:
+            hit, origin = (previous.get(topic, lang) if previous else None), "pacote"
+            if hit is None and not refresh:
+                page = exported.get(slugify(topic), {})
+                payload = load_payload(export_dir, slugify(topic), lang) if lang in page.get("langs", ()) else None
+                hit, origin = ((payload, page.get("version") or "") if payload else None), "exportação"
+            if hit and _valid(hit[0]) and (offline or hit[1] == model.version):
+                found[lang] = hit
+                counts[origin] += 1
+        try:
+            if SOURCE_LANG not in found and not offline:
+                payload = session.analyze(topic).model_dump()
+                found[SOURCE_LANG] = (payload, content_version(session.last_route["model"]))
+                counts["gerados"] += 1
+            if SOURCE_LANG not in found:
+                raise Exception("sem análise disponível (modo offline)")
+        except Exception as e:
+            counts["ignorados"] += 1
+            print(f"  {topic}: ignorado ({e})")
+            continue
+        source, version = found[SOURCE_LANG]
+        for lang in langs:
+            if lang in found or offline:
+                continue
+            try:
+                found[lang] = (translator.translate(source, lang), version)
+            except Exception as e:
+                print(f"  {topic} ({lang}): tradução ignorada ({e})")
+        for lang, (payload, version) in found.items():
+            entries[pack_key(topic, lang)] = {"topic": topic, "lang": lang, "version": version, "payload": payload}
+
+    n = write_pack(out, entries, meta={"langs": ",".join(langs)})
+    print("  " + " · ".join(f"{k}: {v}" for k, v in counts.items()))
+    return n
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Pacote de conhecimento (Arrow IPC, mapeado em memória)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("build")
+    b.add_argument("--out", default=PACK_PATH)
+    b.add_argument("--top", type=int, default=2000)
+    b.add_argument("--langs", default=SOURCE_LANG, help="ex.: pt-PT,en,es")
+    b.add_argument("--export-dir", default=None, help="reutilizar payloads da exportação estática")
+    b.add_argument("--refresh", action="store_true", help="ignorar o pacote e a exportação existentes")
+    b.add_argument("--offline", action="store_true", help="só reutilizar, sem chamadas ao modelo")
+    i = sub.add_parser("info")
+    i.add_argument("path", nargs="?", default=PACK_PATH)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "info":
+        pack = KnowledgePack.open(args.path)
+        if pack is None:
+            raise SystemExit(KnowledgePack.last_error or f"Pacote não encontrado: {args.path}")
+        print(json.dumps({**pack.stats(), **pack.meta}, ensure_ascii=False, indent=1))
+        return
+    langs = [l.strip() for l in args.langs.split(",") if l.strip()]
+    unknown = [l for l in langs if l not in LANGUAGES]
+    if unknown:
+        raise SystemExit(f"Idioma não suportado: {', '.join(unknown)}")
+    t0 = time.perf_counter()
+    n = build(args.out, args.top, langs, export_dir=args.export_dir, refresh=args.refresh, offline=args.offline)
+    print(f"{n} entradas em {args.out} ({time.perf_counter() - t0:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,401 @@
+# pipeline.py
+# The analysis pipeline shared by the Streamlit page and the JSON API
+#
+# condition -> catalog check -> cache (TopicCache/ResultStore) -> in-flight prefetch ->
+# single-flight -> rate limit -> Gemini (ChatSession) -> cache -> prefetch follow-ups.
+# Translation to other languages goes through the same cache. Only requests that would
+# call the model are rate limited; cache hits are free. Every outcome is audited
+# (healthflow.audit), off the request path. Entries from an older prompt/model version
+# are served as "stale" while healthflow.revalidate regenerates them in the background.
+# Generations are charged to the requester's session, user and tenant
+# (healthflow.governor): past a soft limit they get no speculative prefetches, past a
+# hard limit they are served from the cache only (OverBudget on a miss). A knowledge pack
+# (healthflow.pack, memory-mapped) sits right behind the topic cache as a preloaded tier
+# and is the only source of new analyses when there is no API key (offline mode).
+# When the model API fails, or its circuit breaker (healthflow.routing) is open, the last
+# known analysis is served as "degraded": an expired cache entry still in its grace period,
+# or the static export; with nothing to fall back on, the error (CircuitOpen: immediately).
+
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Dict, Mapping, Optional
+
+from healthflow import cache
+from healthflow.analysis import ChatModel, ChatSession, NonMedicalInput, content_version
+from healthflow.audit import AUDIT, AuditLog, pseudonym
+from healthflow.catalog import ConditionCatalog, load_catalog, normalize
+from healthflow.governor import Decision, Governor, Identity, OverBudget
+from healthflow.pack import KnowledgePack
+from healthflow.prefetch import CoQueryLog, Prefetcher, SpendBudget
+from healthflow.results import ResultStore, TopicCache, content_key
+from healthflow.revalidate import Revalidator
+from healthflow.routing import CancelToken, Cancelled, CircuitOpen, current_token
+from healthflow.translation import LANGUAGES, SOURCE_LANG, Translator
+
+class RejectedInput(Exception):
+    """The input is not a medical condition (decided locally, no API call)."""
+
+class RateLimited(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Limite de pedidos atingido. Tente novamente dentro de {int(retry_after) + 1} s.")
+        self.retry_after = retry_after
+
+@dataclass
+class AnalysisResult:
+    topic: str
+    lang: str
+    key: str               # content hash of the payload (also used as ETag)
+    payload: Mapping       # frozen
+    source: str            # "cache" | "stale" | "pack" | "prefetch" | "shared" | "api" | "degraded"
+    budget: str = "ok"     # governor level of the requester: "ok" | "soft" | "hard"
+    budget_message: str = ""
+
+# ----------------- Rate limiting -----------------
+class RateLimiter:
+    """Token bucket per client: `per_minute` sustained, bursts up to `burst`."""
+
+    def __init__(self, per_minute: float = 10, burst: int = 5, max_clients: int = 100_000):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: Dict[str, list] = {}   # client -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str) -> None:
+        """Take one token or raise RateLimited."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._buckets.clear()
+                bucket = self._buckets[client] = [float(self.burst), now]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                raise RateLimited((1 - bucket[0]) / self.rate)
+            bucket[0] -= 1
+
+# ----------------- Pipeline -----------------
+class AnalysisPipeline:
+    """One per process; every entry point (page, API, exporter) goes through it."""
+
+    def __init__(self, results: ResultStore, topics: TopicCache, catalog: ConditionCatalog,
+                 model: ChatModel, prefetcher: Optional[Prefetcher] = None,
+                 translator: Optional[Translator] = None, limiter: Optional[RateLimiter] = None,
+                 audit: Optional[AuditLog] = None, revalidator: Optional[Revalidator] = None,
+                 governor: Optional[Governor] = None, pack: Optional[KnowledgePack] = None):
+        self.results = results
+        self.topics = topics
+        self.catalog = catalog
+        self.model = model
+        self.prefetcher = prefetcher
+        self.translator = translator or Translator(model.router)
+        self.limiter = limiter or RateLimiter()
+        self.audit = audit or AUDIT
+        self.revalidator = revalidator
+        self.governor = governor
+        self.pack = pack
+        self.pack_error: Optional[str] = None   # set by create() when the pack file is unreadable
+        self.topics.version = model.version
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def create(cls) -> "AnalysisPipeline":
+        """Default wiring: shared store, catalog, model router, and an unhedged prefetcher
+        and revalidator."""
+        results = ResultStore(max_unpinned=int(os.getenv("HEALTHFLOW_RESULTS_MAX", "256")))
+        catalog = load_catalog()
+        model = ChatModel.from_pretrained()
+        topics = TopicCache(results, ttl_seconds=24 * 3600, version=model.version,
+                            backend=cache.from_url(os.getenv("HEALTHFLOW_CACHE_URL")))
+
+        prefetch_model = ChatModel.from_pretrained()
+        prefetch_model.router.max_hedge_ratio = 0.0
+        prefetch_session = ChatSession(model=prefetch_model)
+
+        def prefetch(topic: str):
+            payload = prefetch_session.analyze(topic).model_dump()
+            return payload, content_version(prefetch_session.last_route["model"])
+
+        budget = SpendBudget(max_calls=int(os.getenv("HEALTHFLOW_PREFETCH_PER_HOUR", "30")))
+        prefetcher = Prefetcher(prefetch if prefetch_model.client else None, results, topics, CoQueryLog(),
+                                catalog, budget=budget)
+
+        refresh_session = ChatSession(model=prefetch_model)
+
+        def refresh(topic: str):
+            payload = refresh_session.analyze(topic).model_dump()
+            return payload, content_version(refresh_session.last_route["model"])
+
+        revalidator = Revalidator(
+            refresh if prefetch_model.client else None, results, topics,
+            budget=SpendBudget(max_calls=int(os.getenv("HEALTHFLOW_REFRESH_PER_HOUR", "60"))),
+            wait_idle=prefetcher.wait_idle,
+        )
+
+        limiter = RateLimiter(per_minute=float(os.getenv("HEALTHFLOW_RATE_PER_MIN", "10")),
+                              burst=int(os.getenv("HEALTHFLOW_RATE_BURST", "5")))
+        pipeline = cls(results, topics, catalog, model, prefetcher, limiter=limiter, revalidator=revalidator,
+                       governor=Governor(), pack=KnowledgePack.open())
+        pipeline.pack_error = KnowledgePack.last_error
+        return pipeline
+
+    @property
+    def offline(self) -> bool:
+        """No model client: only cached and packed analyses can be served."""
+        return self.model.client is None
+
+    # ----------------- lookups (never call the model) -----------------
+    def canonical(self, topic: str) -> str:
+        known = self.catalog.canonical(topic)
+        return known.label if known else topic.strip()
+
+    def lookup(self, topic: str, lang: str = SOURCE_LANG) -> Optional[AnalysisResult]:
+        """Cached analysis (already translated, for other languages), or None."""
+        topic = self.canonical(topic)
+        key = self.topics.get(topic) or self._from_pack(topic, lang)
+        stale = bool(key) and self._check_stale(topic)
+        if key and lang != SOURCE_LANG:
+            key = self.topics.get(f"{lang}:{key}")
+        payload = self.results.get(key)
+        return AnalysisResult(topic, lang, key, payload, "stale" if stale else "cache") if payload is not None else None
+
+    def has_cached(self, topic: str) -> bool:
+        """Would analyze() answer `topic` from the cache or the pack? Counts no hit or miss."""
+        topic = self.canonical(topic)
+        return self.topics.contains(topic) or (self.pack is not None and self.pack.contains(topic))
+
+    def _check_stale(self, topic: str) -> bool:
+        """True if the cached entry predates the current version (and wake the revalidator)."""
+        if not self.topics.is_stale(topic):
+            return False
+        if self.revalidator:
+            self.revalidator.notify()
+        return True
+
+    def _from_pack(self, topic: str, lang: str = SOURCE_LANG) -> Optional[str]:
+        """Seed the caches from the knowledge pack (with the pack's content version, so
+        outdated entries get revalidated); returns the source-language key or None."""
+        hit = self.pack.get(topic) if self.pack else None
+        if hit is None:
+            return None
+        payload, version = hit
+        key = self.results.put(payload)
+        self.topics.put(topic, key, source="pack", version=version or None)
+        if lang != SOURCE_LANG:
+            self._pack_translation(topic, key, lang)
+        return key
+
+    def _pack_translation(self, topic: str, key: str, lang: str) -> Optional[str]:
+        """Packed `lang` version of `topic`, if it translates the content stored under `key`."""
+        source = self.pack.get(topic) if self.pack else None
+        translated = self.pack.get(topic, lang) if source else None
+        if translated is None or content_key(source[0]) != key:
+            return None
+        cached = self.results.put(translated[0])
+        self.topics.put(f"{lang}:{key}", cached, source="translation")
+        return cached
+
+    def _fallback(self, topic: str, lang: str) -> Optional[str]:
+        """Last known `lang` analysis of `topic` for when the model cannot be used: an
+        expired topic-cache entry (grace period), else the static export."""
+        hit = self.topics.last_good(topic)
+        if hit and lang != SOURCE_LANG:
+            hit = self.topics.last_good(f"{lang}:{hit[0]}")
+        if hit:
+            return hit[0]
+        from healthflow.export import DEFAULT_OUT, load_payload, slugify  # lazy: rarely needed
+        payload = load_payload(DEFAULT_OUT, slugify(topic), lang)
+        return self.results.put(payload) if payload else None
+
+    # ----------------- analysis -----------------
+    def analyze(self, topic: str, client_id: str = "local", lang: str = SOURCE_LANG,
+                session: Optional[ChatSession] = None,
+                identity: Optional[Identity] = None) -> AnalysisResult:
+        """Analysis of `topic` in `lang`, generating it only when nothing can be reused.
+
+        `identity` is who pays for a generation (defaults to the client as its own session).
+        Raises RejectedInput, RateLimited, OverBudget, Cancelled (under a cancel token, see
+        healthflow.jobs), CircuitOpen, or the model/validation error — the last two only
+        when there is no earlier analysis to serve as "degraded".
+        """
+        if lang not in LANGUAGES:
+            raise ValueError(f"Idioma não suportado: {lang}")
+        started = time.perf_counter()
+        topic = self.canonical(topic)
+        identity = identity or Identity(session=client_id)
+        model = degraded = None
+        try:
+            plausible, reason = self.catalog.classify(topic)
+            if not plausible:
+                raise RejectedInput(reason)
+
+            key = self.topics.get(topic)
+            source = "stale" if key and self._check_stale(topic) else "cache"
+            if key is None:
+                key = self._from_pack(topic, lang)
+                source = "stale" if key and self._check_stale(topic) else "pack"
+            if key is None and self.prefetcher:
+                key = self.prefetcher.wait_for(topic)
+                source = "prefetch"
+            decision = self.governor.check(identity) if self.governor else None
+            if key is None:
+                if self.offline and self.pack is not None:
+                    raise Exception(f"Modo offline: '{topic}' não está no pacote de conhecimento.")
+                if self.governor:   # book the request now, so concurrent ones see it
+                    decision = self.governor.check(identity, reserve=True)
+                if decision and decision.level == "hard":
+                    raise OverBudget(decision)
+                try:
+                    if self.model.router.circuit_open():
+                        raise CircuitOpen(self.model.router.retry_after())
+                    key, source, model = self._single_flight(topic, client_id, session, identity, decision)
+                except (RateLimited, Cancelled, NonMedicalInput):
+                    raise
+                except Exception as e:
+                    key, source, degraded = self._fallback(topic, lang), "degraded", e
+                    if key is None:
+                        raise
+                finally:
+                    if self.governor:
+                        self.governor.release(decision)   # nothing generated (shared, rate limited, ...)
+
+            if self.prefetcher:
+                self.prefetcher.after_analysis(client_id, topic, self.results.get(key),
+                                               speculate=degraded is None and (not decision or decision.level == "ok"))
+            if lang != SOURCE_LANG and degraded is None:
+                try:
+                    key = self.translate(key, lang, identity, topic=topic)
+                except CircuitOpen as e:
+                    hit = self.topics.last_good(f"{lang}:{key}")
+                    if hit is None:
+                        raise
+                    key, source, degraded = hit[0], "degraded", e
+            result = AnalysisResult(topic, lang, key, self.results.get(key), source)
+            if decision and decision.level != "ok":
+                result.budget, result.budget_message = decision.level, decision.message
+        except (RejectedInput, NonMedicalInput) as e:
+            self.log_analysis(topic, lang, client_id, started, "rejected", error=str(e))
+            raise
+        except RateLimited:
+            self.log_analysis(topic, lang, client_id, started, "rate_limited")
+            raise
+        except OverBudget as e:
+            self.log_analysis(topic, lang, client_id, started, "over_budget",
+                              error=f"{e.decision.scope}: {e.decision.usage}")
+            raise
+        except Cancelled as e:
+            self.log_analysis(topic, lang, client_id, started, e.reason, model=model)
+            raise
+        except CircuitOpen:
+            self.log_analysis(topic, lang, client_id, started, "circuit_open")
+            raise
+        except Exception as e:
+            self.log_analysis(topic, lang, client_id, started, "error", model=model, error=str(e)[:300])
+            raise
+        self.log_analysis(topic, lang, client_id, started, "degraded" if degraded else "ok", result=result,
+                          model=model, error=str(degraded)[:300] if degraded else None)
+        return result
+
+    def log_analysis(self, topic: str, lang: str, client_id: str, started: float, outcome: str,
+                     result: Optional[AnalysisResult] = None, model: Optional[str] = None,
+                     error: Optional[str] = None) -> None:
+        """Audit event for one analysis request. `model` is set only when this request
+        generated the content; cached answers carry the content key of the original one."""
+        self.audit.log(
+            "analysis", topic=topic, lang=lang, client=pseudonym(client_id), outcome=outcome,
+            source=result.source if result else None, key=result.key if result else None,
+            model=model, latency_ms=round((time.perf_counter() - started) * 1000), error=error,
+        )
+
+    def _single_flight(self, topic: str, client_id: str, session: Optional[ChatSession],
+                       identity: Optional[Identity] = None, decision: Optional[Decision] = None):
+        """Concurrent requests for the same topic share one generation (charged to the leader,
+        settling the request booked in `decision`).
+
+        Waiting honours the caller's cancel token; if the leader was cancelled or rate-limited
+        (its client's limit, not the waiter's), a waiting request takes over instead of failing
+        with it.
+        """
+        norm = normalize(topic)
+        token = current_token()
+        while True:
+            with self._lock:
+                fut = self._inflight.get(norm)
+                leader = fut is None
+                if leader:
+                    fut = self._inflight[norm] = Future()
+            if leader:
+                break
+            try:
+                return self._await(fut, token), "shared", None
+            except Cancelled:
+                if token is not None and token.cancelled:
+                    raise
+            except RateLimited:
+                pass   # retry as leader, under this request's own client_id
+
+        try:
+            self.limiter.acquire(client_id)
+            session = session or ChatSession(model=self.model)
+            spent = session.tokens_used
+            try:
+                with self.prefetcher.interactive() if self.prefetcher else nullcontext():
+                    key = self.results.put(session.analyze(topic).model_dump())
+            finally:
+                if self.governor and identity:
+                    self.governor.charge(identity, session.tokens_used - spent, decision=decision)
+            model = (session.last_route or {}).get("model")
+            self.topics.put(topic, key, version=content_version(model) if model else None)
+            fut.set_result(key)
+            return key, "api", model
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(norm, None)
+
+    @staticmethod
+    def _await(fut: Future, token: Optional[CancelToken]):
+        if token is None:
+            return fut.result()
+        while True:
+            token.check()
+            try:
+                return fut.result(timeout=0.2)
+            except FutureTimeout:
+                continue
+
+    def translate(self, key: str, lang: str, identity: Optional[Identity] = None,
+                  topic: Optional[str] = None) -> str:
+        """ResultStore key of the `lang` version of the analysis stored under `key`.
+
+        Packed translations of `topic` are reused; a missing translation is charged to
+        `identity` and raises OverBudget past its hard limit.
+        """
+        if lang == SOURCE_LANG:
+            return key
+        cached = self.topics.get(f"{lang}:{key}") or (self._pack_translation(topic, key, lang) if topic else None)
+        if cached:
+            return cached
+        if self.offline:
+            raise Exception(f"Modo offline: tradução para {LANGUAGES[lang]} não disponível no pacote.")
+        decision = None
+        if self.governor and identity:
+            decision = self.governor.check(identity, reserve=True)
+            if decision.level == "hard":
+                raise OverBudget(decision)
+        try:
+            translated = self.results.put(self.translator.translate(self.results.get(key), lang))
+        finally:
+            if self.governor and identity:
+                self.governor.charge(identity, self.translator.last_tokens(), decision=decision)
+        self.topics.put(f"{lang}:{key}", translated, source="translation")
+        return translated
@@ -0,0 +1,323 @@
+# prefetch.py
+# Speculative prefetch of the conditions a user is likely to look up next
+#
+# - CoQueryLog keeps per-session query sequences (data/queries.jsonl) and turns them
+#   into P(next | current) statistics.
+# - candidates() ranks follow-ups: co-query statistics first, then catalog conditions
+#   named in the finished analysis (complicações, causas & fatores de risco).
+# - Prefetcher runs a single low-priority worker that stays paused while any interactive
+#   analysis is in flight and stops spending once the rolling budget is used up.
+#   Results land in the shared ResultStore + TopicCache, so the follow-up search is warm.
+
+import atexit
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+from healthflow.catalog import ConditionCatalog, normalize
+from healthflow.results import ResultStore, TopicCache
+
+DATA_DIR = os.getenv("HEALTHFLOW_DATA", "data")
+QUERY_LOG = os.path.join(DATA_DIR, "queries.jsonl")
+
+# Weight of each source when ranking follow-ups (co-query probability counts fully)
+FIELD_WEIGHTS = {"complicacoes": 0.3, "causas_risco": 0.15}
+
+# ----------------- Co-query statistics -----------------
+class CoQueryLog:
+    """Counts which condition a session asks for right after another one.
+
+    Only consecutive queries less than `window_s` apart count as a pair, so only sessions
+    seen within the window (at most `max_sessions`) are remembered. Session ids are hashed
+    before they are written; record() only queues the line and a background thread appends
+    the queued lines to the file (like healthflow.audit).
+    """
+
+    def __init__(self, path: Optional[str] = QUERY_LOG, window_s: float = 30 * 60,
+                 max_sessions: int = 50_000, max_queue: int = 10_000):
+        self.path = path
+        self.window_s = window_s
+        self.max_sessions = max_sessions
+        self._last: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()   # oldest query first
+        self._writes: "queue.Queue[str]" = queue.Queue(maxsize=max_queue)
+        self._writer: Optional[threading.Thread] = None
+        self.dropped = 0
+        self._pairs: Dict[str, Counter] = {}
+        self._totals: Counter = Counter()
+        self._labels: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                        self._count(row["s"], row["q"], row["t"])
+                    except (ValueError, KeyError):
+                        continue
+
+    def _count(self, session: str, topic: str, ts: float) -> None:
+        norm = normalize(topic)
+        self._labels.setdefault(norm, topic)
+        prev = self._last.get(session)
+        if prev and prev[0] != norm and ts - prev[1] < self.window_s:
+            self._pairs.setdefault(prev[0], Counter())[norm] += 1
+            self._totals[prev[0]] += 1
+        self._last[session] = (norm, ts)
+        self._last.move_to_end(session)
+        while self._last:
+            oldest = next(iter(self._last.values()))
+            if len(self._last) <= self.max_sessions and ts - oldest[1] < self.window_s:
+                break
+            self._last.popitem(last=False)
+
+    def record(self, session_id: str, topic: str, ts: Optional[float] = None) -> None:
+        ts = ts or time.time()
+        session = hashlib.sha1(session_id.encode("utf-8")).hexdigest()[:12]
+        with self._lock:
+            self._count(session, topic, ts)
+        if self.path:
+            self._ensure_writer()
+            try:
+                self._writes.put_nowait(json.dumps({"s": session, "q": topic, "t": round(ts, 1)}, ensure_ascii=False) + "\n")
+            except queue.Full:
+                self.dropped += 1   # statistics only: losing a line is harmless
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until queued lines are written (shutdown and tools)."""
+        deadline = time.monotonic() + timeout
+        while self._writer is not None and self._writes.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.02)
+
+    def _ensure_writer(self) -> None:
+        if self._writer is not None:
+            return
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="query-log", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _write_loop(self) -> None:
+        while True:
+            lines = [self._writes.get()]
+            while len(lines) < 500:
+                try:
+                    lines.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write("".join(lines))
+            except OSError:
+                self.dropped += len(lines)
+            finally:
+                for _ in lines:
+                    self._writes.task_done()
+
+    def next_likely(self, topic: str, k: int = 5, min_support: int = 2) -> List[Tuple[str, float]]:
+        """[(label, P(next | topic))] for follow-ups seen at least `min_support` times."""
+        norm = normalize(topic)
+        with self._lock:
+            total = self._totals.get(norm, 0)
+            if not total:
+                return []
+            return [(self._labels[n], c / total)
+                    for n, c in self._pairs[norm].most_common(k) if c >= min_support]
+
+def candidates(topic: str, payload: Mapping, log: CoQueryLog, catalog: ConditionCatalog,
+               limit: int = 3) -> List[Tuple[str, float]]:
+    """Most likely next conditions after `topic`, best first."""
+    scores: Dict[str, float] = {}
+    labels: Dict[str, str] = {}
+
+    def add(label: str, score: float) -> None:
+        norm = normalize(label)
+        labels.setdefault(norm, label)
+        scores[norm] = scores.get(norm, 0.0) + score
+
+    for label, p in log.next_likely(topic):
+        known = catalog.canonical(label)
+        add(known.label if known else label, p)
+    for field, weight in FIELD_WEIGHTS.items():
+        for item in payload.get(field, ()) or ():
+            for cond in catalog.mentions(item):
+                add(cond.label, weight)
+
+    scores.pop(normalize(topic), None)
+    known = catalog.canonical(topic)
+    if known:
+        scores.pop(normalize(known.label), None)
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+    return [(labels[n], round(s, 3)) for n, s in ranked]
+
+# ----------------- Budget -----------------
+class SpendBudget:
+    """At most `max_calls` prefetch generations per rolling `per_seconds` window."""
+
+    def __init__(self, max_calls: int = 30, per_seconds: float = 3600):
+        self.max_calls = max_calls
+        self.per_seconds = per_seconds
+        self._spent: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def try_spend(self) -> bool:
+        now = time.time()
+        with self._lock:
+            while self._spent and now - self._spent[0] > self.per_seconds:
+                self._spent.popleft()
+            if len(self._spent) >= self.max_calls:
+                return False
+            self._spent.append(now)
+            return True
+
+    def remaining(self) -> int:
+        now = time.time()
+        with self._lock:
+            return self.max_calls - sum(1 for t in self._spent if now - t <= self.per_seconds)
+
+# ----------------- Prefetcher -----------------
+class Prefetcher:
+    """Background generations for likely follow-up conditions.
+
+    `analyze(topic) -> (payload, version)` performs one generation; pass None to disable prefetching
+    (e.g. no API key). Interactive requests wrap their call in `interactive()`; the worker
+    only starts a job after `idle_gap_s` without interactive activity.
+    """
+
+    def __init__(self, analyze: Optional[Callable[[str], Tuple[dict, str]]], store: ResultStore,
+                 cache: TopicCache, log: CoQueryLog, catalog: ConditionCatalog,
+                 budget: Optional[SpendBudget] = None, per_query: int = 3,
+                 max_queue: int = 20, idle_gap_s: float = 1.0):
+        self.analyze = analyze
+        self.store = store
+        self.cache = cache
+        self.log = log
+        self.catalog = catalog
+        self.budget = budget or SpendBudget()
+        self.per_query = per_query
+        self.idle_gap_s = idle_gap_s
+        self._queue: "queue.PriorityQueue[Tuple[float, int, str]]" = queue.PriorityQueue(max_queue)
+        self._queued: set = set()
+        self._in_flight: Dict[str, threading.Event] = {}
+        self._seq = 0
+        self._active = 0
+        self._last_interactive = 0.0
+        self._idle = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._counters: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def interactive(self):
+        """Mark an interactive analysis; the prefetch worker waits until it is done."""
+        with self._idle:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._idle:
+                self._active -= 1
+                self._last_interactive = time.time()
+                self._idle.notify_all()
+
+    def after_analysis(self, session_id: str, topic: str, payload: Optional[Mapping],
+                       speculate: bool = True) -> List[Tuple[str, float]]:
+        """Log the query and queue its most likely follow-ups; returns what was queued.
+
+        `speculate=False` (requester over its soft budget) only logs the query.
+        """
+        self.log.record(session_id, topic)
+        if self.analyze is None or payload is None or not speculate:
+            return []
+        queued = []
+        for label, score in candidates(topic, payload, self.log, self.catalog, self.per_query):
+            if self._enqueue(label, score):
+                queued.append((label, score))
+        return queued
+
+    def wait_for(self, topic: str, timeout: float = 30.0) -> Optional[str]:
+        """If `topic` is being prefetched right now, wait for it instead of calling twice."""
+        with self._lock:
+            event = self._in_flight.get(normalize(topic))
+        if event is None or not event.wait(timeout):
+            return None
+        return self.cache.get(topic)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self._counters,
+                "em fila": self._queue.qsize(),
+                "em curso": len(self._in_flight),
+                "orçamento restante": self.budget.remaining(),
+            }
+
+    # ----------------- worker -----------------
+    def _enqueue(self, label: str, score: float) -> bool:
+        norm = normalize(label)
+        with self._lock:
+            if norm in self._queued or norm in self._in_flight:
+                return False
+        if self.cache.contains(label):   # backend I/O (shared cache): not under the lock
+            return False
+        with self._lock:
+            if norm in self._queued or norm in self._in_flight:
+                return False
+            self._seq += 1
+            try:
+                self._queue.put_nowait((-score, self._seq, label))
+            except queue.Full:
+                self._counters["descartados (fila)"] += 1
+                return False
+            self._queued.add(norm)
+            self._counters["enfileirados"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+                self._thread.start()
+        return True
+
+    def wait_idle(self) -> None:
+        """Block until no interactive analysis has run for `idle_gap_s`."""
+        with self._idle:
+            while True:
+                if self._active:
+                    self._idle.wait()
+                    continue
+                gap = self.idle_gap_s - (time.time() - self._last_interactive)
+                if gap <= 0:
+                    return
+                self._idle.wait(gap)
+
+    def _run(self) -> None:
+        while True:
+            _, _, label = self._queue.get()
+            norm = normalize(label)
+            self.wait_idle()
+            with self._lock:
+                self._queued.discard(norm)
+            if self.cache.contains(label):
+                continue
+            with self._lock:
+                if not self.budget.try_spend():
+                    self._counters["sem orçamento"] += 1
+                    continue
+                event = self._in_flight[norm] = threading.Event()
+            outcome = "erros"
+            try:
+                payload, version = self.analyze(label)
+                self.cache.put(label, self.store.put(payload), source="prefetch", version=version)
+                outcome = "gerados"
+            except Exception:
+                pass
+            finally:
+                with self._lock:
+                    self._in_flight.pop(norm, None)
+                    self._counters[outcome] += 1
+                event.set()
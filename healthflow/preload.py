@@ -0,0 +1,44 @@
+# preload.py
+# Background warm-up of heavy imports after a (re)start
+#
+# Pages import only what their first render needs; the SDKs they use later (google-genai
+# when an analysis runs, pandas/plotly on the dashboards) are imported here on a daemon
+# thread as soon as the first session opens the app, so neither the first page visit nor
+# the first analysis after a deploy pays for them. Disable with HEALTHFLOW_PRELOAD=0.
+
+import importlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+# Heavy modules per page, in the order they are usually needed
+PAGE_MODULES: Dict[str, List[str]] = {
+    "pages/general.py": ["healthflow.pipeline", "healthflow.export", "pydantic", "google.genai"],
+    "pages/dashboard.py": ["pandas", "plotly.io", "healthflow.snapshots"],
+    "pages/cohort.py": ["plotly.express", "healthflow.cohort"],
+}
+
+PRELOAD_TIMES: Dict[str, float] = {}   # module -> seconds spent importing it here
+_started = threading.Event()
+
+def _run(modules: Iterable[str]) -> None:
+    for name in modules:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception:
+            continue
+        PRELOAD_TIMES[name] = round(time.perf_counter() - t0, 3)
+
+def start(pages: Optional[Iterable[str]] = None) -> Optional[threading.Thread]:
+    """Preload the modules of `pages` (default: all) once per process."""
+    if os.getenv("HEALTHFLOW_PRELOAD", "1") == "0" or _started.is_set():
+        return None
+    _started.set()
+    modules: List[str] = []
+    for page in pages or PAGE_MODULES:
+        modules += [m for m in PAGE_MODULES.get(page, []) if m not in modules]
+    thread = threading.Thread(target=_run, args=(modules,), name="preload", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,225 @@
+# profiler.py
+# Per-section rerun profiler for the Streamlit pages
+#
+#   with profiler.section("cartões"):
+#       ...render...
+#
+# The router starts one profile per script run and finishes it after the page ran.
+# Sections nest (a flame graph per rerun) and are timed only while a profile is active on
+# the current thread; otherwise section() hands back one shared no-op context manager,
+# so instrumented code costs a thread-local lookup when profiling is off. Fragment-only
+# reruns (e.g. switching dashboard tabs) do not go through the router and are not profiled.
+#
+# Enable per session with ?profile=1 (shows the overlay) or for every session with
+# HEALTHFLOW_PROFILE=1 (production-like sessions, no overlay). Each profiled run is
+# appended to data/profile.jsonl; aggregate it with
+#
+#   python -m healthflow.profiler report [data/profile.jsonl] [--page general]
+
+import argparse
+import html
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import Deque, Dict, List, Optional
+
+PROFILE_PATH = os.path.join(os.getenv("HEALTHFLOW_DATA", "data"), "profile.jsonl")
+PROFILE_ALL = os.getenv("HEALTHFLOW_PROFILE", "0") == "1"
+
+_NOOP = nullcontext()
+_local = threading.local()
+
+# ----------------- Runs -----------------
+class _Section:
+    __slots__ = ("run", "name", "depth", "t0")
+
+    def __init__(self, run: "Run", name: str):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        self.depth = self.run.depth
+        self.run.depth += 1
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        self.run.depth -= 1
+        self.run.sections.append({
+            "name": self.name, "depth": self.depth,
+            "start_ms": round((self.t0 - self.run.t0) * 1000, 2), "ms": round((t1 - self.t0) * 1000, 2),
+        })
+        return False
+
+class Run:
+    """The sections of one script run."""
+
+    def __init__(self, page: str, session: str, kind: str = "", overlay: bool = False):
+        self.page = page
+        self.session = session
+        self.kind = kind
+        self.overlay = overlay
+        self.t0 = time.perf_counter()
+        self.started_at = time.time()
+        self.depth = 0
+        self.sections: List[dict] = []
+        self.total_ms: Optional[float] = None
+        self.interrupted = False
+
+    def to_json(self) -> dict:
+        return {
+            "ts": round(self.started_at, 3), "page": self.page, "kind": self.kind,
+            "session": self.session[:8], "total_ms": self.total_ms, "interrupted": self.interrupted,
+            "sections": sorted(self.sections, key=lambda s: (s["start_ms"], s["depth"])),
+        }
+
+def section(name: str):
+    """Time the enclosed block under `name` (no-op unless this run is being profiled)."""
+    run = getattr(_local, "run", None)
+    return _Section(run, name) if run is not None else _NOOP
+
+def active() -> Optional[Run]:
+    return getattr(_local, "run", None)
+
+def clear() -> None:
+    """Forget any run left on this thread (an unprofiled run must not time into it)."""
+    _local.run = None
+
+# ----------------- Profiler -----------------
+class Profiler:
+    """Collects finished runs: per-section aggregates in memory, raw runs in a JSONL file."""
+
+    def __init__(self, path: Optional[str] = PROFILE_PATH, window: int = 2000):
+        self.path = path
+        self._runs: Deque[dict] = deque(maxlen=window)
+        self._pending: Dict[str, Run] = {}    # session -> run that has not finished (yet)
+        self._lock = threading.Lock()
+
+    def start(self, page: str, session: str, kind: str = "", overlay: bool = False) -> Run:
+        """Profile the current script run; a previous run of the same session that never
+        finished (st.rerun, st.stop, an exception) is recorded as interrupted."""
+        run = _local.run = Run(page, session, kind, overlay)
+        with self._lock:
+            previous = self._pending.pop(session, None)
+            self._pending[session] = run
+        if previous is not None and previous.total_ms is None:
+            previous.interrupted = True
+            self._record(previous, max((s["start_ms"] + s["ms"] for s in previous.sections), default=0.0))
+        return run
+
+    def finish(self) -> Optional[Run]:
+        run = getattr(_local, "run", None)
+        if run is None:
+            return None
+        _local.run = None
+        with self._lock:
+            if self._pending.get(run.session) is run:
+                del self._pending[run.session]
+        self._record(run, (time.perf_counter() - run.t0) * 1000)
+        return run
+
+    def _record(self, run: Run, total_ms: float) -> None:
+        run.total_ms = round(total_ms, 2)
+        row = run.to_json()
+        with self._lock:
+            self._runs.append(row)
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(row, ensure_ascii=False) + "\n")
+                except OSError:
+                    pass   # profiling never breaks a page
+
+    def snapshot(self, page: Optional[str] = None) -> List[dict]:
+        with self._lock:
+            runs = list(self._runs)
+        return aggregate(runs, page)
+
+PROFILER = Profiler()
+
+def aggregate(runs: List[dict], page: Optional[str] = None) -> List[dict]:
+    """p50/p95 per (page, section) over `runs`, slowest first; "(total)" is the whole run."""
+    groups: Dict[tuple, List[float]] = {}
+    for r in runs:
+        if page and r["page"] != page:
+            continue
+        groups.setdefault((r["page"], "(total)"), []).append(r["total_ms"] or 0.0)
+        for s in r["sections"]:
+            groups.setdefault((r["page"], s["name"]), []).append(s["ms"])
+    out = []
+    for (pg, name), times in groups.items():
+        times.sort()
+        out.append({
+            "página": pg,
+            "secção": name,
+            "runs": len(times),
+            "p50 (ms)": round(times[len(times) // 2], 1),
+            "p95 (ms)": round(times[min(len(times) - 1, int(len(times) * 0.95))], 1),
+            "total (ms)": round(sum(times), 1),
+        })
+    out.sort(key=lambda r: (r["página"], r["secção"] != "(total)", -r["total (ms)"]))
+    return out
+
+# ----------------- Overlay -----------------
+COLORS = ("#2563eb", "#10b981", "#f59e0b", "#8b5cf6", "#ef4444", "#0ea5e9")
+
+def overlay_html(run: Run, row_px: int = 18) -> str:
+    """Flame-style chart of one run, pinned to the bottom right of the page."""
+    total = max(run.total_ms or 0.0, 0.01)
+    depth = max((s["depth"] for s in run.sections), default=0) + 1
+    bars = []
+    for s in run.sections:
+        left, width = 100 * s["start_ms"] / total, max(0.3, 100 * s["ms"] / total)
+        label = html.escape(f"{s['name']} · {s['ms']:.1f} ms")
+        bars.append(
+            f"<div title='{label}' style='position:absolute;left:{left:.2f}%;width:{width:.2f}%;"
+            f"top:{s['depth'] * row_px}px;height:{row_px - 2}px;background:{COLORS[s['depth'] % len(COLORS)]};"
+            f"color:#fff;font-size:10px;line-height:{row_px - 2}px;overflow:hidden;white-space:nowrap;"
+            f"border-radius:3px;padding:0 3px;box-sizing:border-box'>{label}</div>")
+    return (
+        "<div style='position:fixed;right:12px;bottom:52px;width:min(520px,45vw);z-index:10000;"
+        "background:rgba(15,23,42,.92);border-radius:10px;padding:8px 10px;font-family:monospace'>"
+        f"<div style='color:#e2e8f0;font-size:11px;margin-bottom:6px'>⏱ {html.escape(run.page)} · "
+        f"{html.escape(run.kind)} · {total:.1f} ms</div>"
+        f"<div style='position:relative;height:{depth * row_px}px'>{''.join(bars)}</div></div>"
+    )
+
+# ----------------- CLI -----------------
+def read_runs(path: str = PROFILE_PATH) -> List[dict]:
+    runs = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    runs.append(json.loads(line))
+                except ValueError:
+                    continue
+    return runs
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Tempos por secção das execuções das páginas")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("report")
+    r.add_argument("path", nargs="?", default=PROFILE_PATH)
+    r.add_argument("--page", default=None)
+    r.add_argument("--json", action="store_true", help="saída em JSON (para exportar)")
+    args = parser.parse_args(argv)
+
+    runs = read_runs(args.path)
+    rows = aggregate(runs, args.page)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=1))
+        return
+    print(f"{len(runs)} execuções em {args.path}")
+    for row in rows:
+        indent = "" if row["secção"] == "(total)" else "  "
+        print(f"{row['página']:<12} {indent}{row['secção']:<28} n={row['runs']:<5} "
+              f"p50 {row['p50 (ms)']:>8.1f} ms   p95 {row['p95 (ms)']:>8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# render.py
+# Card layout for MedicalCards payloads — HTML fragments shared by pages/general.py and
+# the static exporter (healthflow/export.py), so both render identical cards.
+
+import html
+from typing import List, Mapping, Optional, Sequence
+
+BRAND = "#0295a8"
+
+CARD_CSS = """
+.small-muted { color: #475569; margin-top: -2px; }
+.card {
+  border: 1px solid #e6edf2; border-radius: 14px; background: #fff;
+  box-shadow: 0 2px 10px rgba(2,6,23,0.04); padding: 16px 18px; margin-bottom: 14px;
+}
+.card-head { display:flex; align-items:center; gap:10px; margin-bottom: 8px; }
+.icon {
+  width: 28px; height: 28px; border-radius: 999px; background: rgba(2,149,168,.12); color: var(--brand);
+  display:flex; align-items:center; justify-content:center; font-weight:700;
+}
+.card-title { font-weight: 700; color: #0f172a; font-size: 16px; }
+.kicker { text-align:center; color:#334155; margin: 6px 0 16px 0; }
+.section-title { text-align:center; color: var(--brand); font-size: 22px; font-weight: 800; margin: 6px 0 10px 0; }
+ul.clean { margin: 0.25rem 0 0; padding-left: 1.1rem; }
+ul.clean li { margin: 2px 0; }
+.note {
+  border-radius: 10px; border: 1px dashed #d7e3ea; background: #f7fafb; color: #334155; padding: 10px 14px; font-size: .92rem;
+}
+"""
+
+# (kind, title, field, icon) — two rows of three cards, in reading order
+CARD_ROWS = [
+    [
+        ("para", "Descrição & Mecanismos", "descricao_mecanismos", "ℹ️"),
+        ("list", "Sintomas Comuns", "sintomas_comuns", "💚"),
+        ("list", "Sintomas Incomuns", "sintomas_incomuns", "🧪"),
+    ],
+    [
+        ("list", "Causas & Fatores de Risco", "causas_risco", "🧬"),
+        ("para", "Evolução Natural", "evolucao_natural", "📈"),
+        ("list", "Complicações Possíveis", "complicacoes", "⚠️"),
+    ],
+]
+TREATMENTS_TITLE = "Top 3 Tratamentos Recomendados"
+NOTE_HTML = """
+<div class="note">
+<strong>Nota:</strong> Conteúdos para literacia em saúde; não substituem aconselhamento médico.
+</div>
+"""
+
+# ----------------- Fragments -----------------
+def html_list(items: Sequence[str]) -> str:
+    """Convert list to HTML unordered list."""
+    if not items:
+        return "<em>—</em>"
+    lis = "".join([f"<li>{html.escape(i)}</li>" for i in items])
+    return f'<ul class="clean">{lis}</ul>'
+
+def card_html(title: str, body_html: str, icon: str = "·") -> str:
+    """Generic card that accepts HTML body."""
+    return (
+        '<div class="card">'
+        f'<div class="card-head"><div class="icon">{icon}</div><div class="card-title">{html.escape(title)}</div></div>'
+        f"{body_html}</div>"
+    )
+
+def field_card_html(payload: Mapping, kind: str, title: str, field: str, icon: str) -> str:
+    if kind == "para":
+        return card_html(title, f"<div>{html.escape(payload.get(field, '—'))}</div>", icon)
+    return card_html(title, html_list(payload.get(field, [])), icon)
+
+def recommendations(payload: Mapping) -> List[Mapping]:
+    recs = payload.get("recomendadas")
+    return [r for r in recs[:3] if r] if isinstance(recs, (list, tuple)) else []
+
+def treatment_card_html(rec: Mapping) -> str:
+    body = (
+        f"<p class='small-muted'><strong>Quando/porquê:</strong> {html.escape(rec.get('quando_por_que','—'))}</p>"
+        f"<p><strong>Objetivos</strong></p>{html_list(rec.get('objetivos', []))}"
+        f"<p><strong>Considerações chave</strong></p>{html_list(rec.get('consideracoes_chave', []))}"
+        f"<p><strong>Modalidades típicas</strong></p>{html_list(rec.get('modalidades_tipicas', []))}"
+    )
+    return card_html(rec.get("nome", "Tratamento"), body, icon="💊")
+
+# ----------------- Standalone page -----------------
+PAGE_CSS = """
+:root { --brand: %s; }
+body { margin: 0 auto; max-width: 1200px; padding: 16px 20px 40px; background: #fff;
+       font-family: system-ui, -apple-system, "Segoe UI", Roboto, sans-serif; }
+p, li { line-height: 1.6; color: #0f172a; }
+.grid { display: grid; grid-template-columns: repeat(3, minmax(0, 1fr)); gap: 16px; }
+@media (max-width: 900px) { .grid { grid-template-columns: 1fr; } }
+.brand-title { text-align: center; font-size: 28px; font-weight: 800; color: var(--brand); margin: 10px 0 4px; }
+a { color: var(--brand); }
+""" % BRAND
+
+def page_html(title: str, body_html: str, lang: str = "pt-PT", head_extra: str = "") -> str:
+    return (
+        f'<!doctype html>\n<html lang="{html.escape(lang)}"><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        f"<title>{html.escape(title)} — Healthflow Médica AI</title>"
+        f"<style>{PAGE_CSS}{CARD_CSS}</style>{head_extra}</head><body>"
+        f'<div class="brand-title">Healthflow Médica AI</div>{body_html}</body></html>\n'
+    )
+
+def condition_page_html(topic: str, payload: Mapping, lang: str = "pt-PT",
+                        live_url: Optional[str] = None, index_url: str = "index.html") -> str:
+    """Full static page for one analysis, same cards and order as the live app."""
+    rows = "".join(
+        '<div class="grid">' + "".join(field_card_html(payload, *spec) for spec in row) + "</div>"
+        for row in CARD_ROWS
+    )
+    recs = "".join(treatment_card_html(r) for r in recommendations(payload))
+    links = f'<a href="{html.escape(index_url)}">← Todas as condições</a>'
+    if live_url:
+        links += f' · <a href="{html.escape(live_url)}">Abrir na aplicação</a>'
+    body = (
+        f"<p class='kicker'>{links}</p>"
+        f"<p class='kicker'>Análise: <strong style='color:{BRAND}'>{html.escape(topic.title())}</strong></p>"
+        f"{rows}<div class='section-title'>{TREATMENTS_TITLE}</div><div class='grid'>{recs}</div>{NOTE_HTML}"
+    )
+    return page_html(topic, body, lang)
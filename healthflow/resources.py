@@ -0,0 +1,156 @@
+# resources.py
+# Per-process shared resources, owned by the router (app.py) and injected into the pages
+#
+# The router installs one Resources per process and pages take what they need from
+# resources.current() instead of building their own pipeline, stores or clients, so a page
+# switch never rebuilds anything. Resources are created lazily on first use (imports
+# included, to keep the landing page light) and can be warmed on a background thread.
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+
+# ----------------- Factories -----------------
+# Imports stay inside the factories: the landing page must not pay for pandas/pydantic.
+def _pipeline(res: "Resources"):
+    from healthflow.pipeline import AnalysisPipeline
+    return AnalysisPipeline.create()
+
+def _session_tracker(res: "Resources"):
+    from healthflow.results import SessionTracker
+    return SessionTracker(res.get("pipeline").results, idle_seconds=15 * 60)
+
+def _jobs(res: "Resources"):
+    from healthflow.jobs import JobRunner
+    return JobRunner.create(res.get("pipeline"))
+
+def _materializer(res: "Resources"):
+    from healthflow.snapshots import SnapshotMaterializer
+    return SnapshotMaterializer()
+
+def _cohort(res: "Resources"):
+    from healthflow.cohort import build_demo_aggregates
+    return build_demo_aggregates(50_000)
+
+# In warm-up order: the Gemini client/pipeline first, the dashboards' stores after
+FACTORIES: Dict[str, Callable[["Resources"], Any]] = {
+    "pipeline": _pipeline,             # Gemini client, router, caches, catalog, prefetcher
+    "session_tracker": _session_tracker,
+    "jobs": _jobs,                     # background analysis workers
+    "materializer": _materializer,     # patient snapshots (dashboard)
+    "cohort": _cohort,                 # cohort aggregates
+}
+
+class Resources:
+    """Lazily built, thread-safe singletons by name; each is built at most once."""
+
+    def __init__(self, factories: Optional[Dict[str, Callable[["Resources"], Any]]] = None):
+        self.factories = dict(FACTORIES if factories is None else factories)
+        self._objects: Dict[str, Any] = {}
+        self._locks = {name: threading.Lock() for name in self.factories}
+        self.build_times: Dict[str, float] = {}
+
+    def get(self, name: str) -> Any:
+        obj = self._objects.get(name)
+        if obj is not None:
+            return obj
+        if name not in self.factories:
+            raise KeyError(f"Recurso desconhecido: {name}")
+        with self._locks[name]:   # concurrent callers wait for the first build
+            if name not in self._objects:
+                t0 = time.perf_counter()
+                self._objects[name] = self.factories[name](self)
+                self.build_times[name] = round(time.perf_counter() - t0, 3)
+        return self._objects[name]
+
+    @property
+    def pipeline(self):
+        return self.get("pipeline")
+
+    @property
+    def session_tracker(self):
+        return self.get("session_tracker")
+
+    @property
+    def jobs(self):
+        return self.get("jobs")
+
+    @property
+    def materializer(self):
+        return self.get("materializer")
+
+    @property
+    def cohort(self):
+        return self.get("cohort")
+
+    def built(self) -> List[str]:
+        return [name for name in self.factories if name in self._objects]
+
+    def warm(self, names: Optional[Iterable[str]] = None) -> Optional[threading.Thread]:
+        """Build `names` (default: all) on a daemon thread; HEALTHFLOW_PRELOAD=0 disables."""
+        if os.getenv("HEALTHFLOW_PRELOAD", "1") == "0":
+            return None
+
+        def run():
+            for name in names or self.factories:
+                try:
+                    self.get(name)
+                except Exception:
+                    continue   # the page that needs it will surface the error
+
+        thread = threading.Thread(target=run, name="warm-resources", daemon=True)
+        thread.start()
+        return thread
+
+_current: Optional[Resources] = None
+_install_lock = threading.Lock()
+
+def install(res: Resources) -> Resources:
+    """Make `res` the process-wide instance handed to the pages (called by the router)."""
+    global _current
+    _current = res
+    return res
+
+def current() -> Resources:
+    """The installed instance; a page run on its own gets a default one."""
+    global _current
+    if _current is None:
+        with _install_lock:
+            if _current is None:
+                _current = Resources()
+    return _current
+
+# ----------------- Page-switch latency -----------------
+class PageTimings:
+    """Server-side render time of each page run, split into first visits, switches and reruns."""
+
+    def __init__(self, window: int = 500):
+        self._rows: Deque[dict] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, page: str, seconds: float, kind: str) -> None:
+        """`kind`: "entrada" (first page of a session), "troca" (page switch) or "rerun"."""
+        with self._lock:
+            self._rows.append({"page": page, "kind": kind, "s": seconds})
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            rows = list(self._rows)
+        groups: Dict[tuple, List[float]] = {}
+        for r in rows:
+            groups.setdefault((r["page"], r["kind"]), []).append(r["s"])
+        out = []
+        for (page, kind), times in sorted(groups.items()):
+            times.sort()
+            out.append({
+                "página": page,
+                "tipo": kind,
+                "n": len(times),
+                "p50 (ms)": round(times[len(times) // 2] * 1000),
+                "p95 (ms)": round(times[min(len(times) - 1, int(0.95 * len(times)))] * 1000),
+            })
+        return out
+
+PAGE_TIMINGS = PageTimings()
@@ -0,0 +1,360 @@
+# results.py
+# Shared analysis results + per-session memory bookkeeping
+#
+# Sessions keep only a key into ResultStore; identical analyses are stored once per
+# process as frozen (read-only) structures. TopicCache maps a condition to its stored
+# analysis, in a pluggable (optionally cross-replica) backend. SessionTracker releases
+# large per-session buffers after inactivity and reports what each session is holding.
+
+import hashlib
+import json
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+from healthflow.cache import Backend, LRUBackend, dumps, loads
+from healthflow.catalog import normalize
+
+# ----------------- Helpers -----------------
+def freeze(obj: Any) -> Any:
+    """Recursively turn dicts into read-only mappings and lists into tuples."""
+    if isinstance(obj, dict):
+        return MappingProxyType({k: freeze(v) for k, v in obj.items()})
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    return obj
+
+def thaw(obj: Any) -> Any:
+    """Inverse of freeze(): plain dicts/lists again (e.g. for JSON serialization)."""
+    if isinstance(obj, (dict, MappingProxyType)):
+        return {k: thaw(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [thaw(v) for v in obj]
+    return obj
+
+def deep_sizeof(obj: Any, _seen: Optional[set] = None) -> int:
+    """Approximate retained size in bytes (containers + contents, shared objects counted once)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (dict, MappingProxyType)):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(v, seen) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+def content_key(payload: dict) -> str:
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+# ----------------- Shared store -----------------
+class ResultStore:
+    """Process-wide, content-addressed store of immutable analysis payloads.
+
+    Entries referenced by a live session are pinned; unpinned entries are kept in LRU
+    order up to `max_unpinned` and evicted beyond that.
+    """
+
+    def __init__(self, max_unpinned: int = 256):
+        self.max_unpinned = max_unpinned
+        self._items: "OrderedDict[str, Mapping]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._pins: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def put(self, payload: dict) -> str:
+        key = content_key(payload)
+        with self._lock:
+            if key not in self._items:
+                frozen = freeze(payload)
+                self._items[key] = frozen
+                self._sizes[key] = deep_sizeof(frozen)
+            self._items.move_to_end(key)
+            self._evict()
+        return key
+
+    def get(self, key: Optional[str]) -> Optional[Mapping]:
+        if not key:
+            return None
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            n = self._pins.get(key, 0) - 1
+            if n > 0:
+                self._pins[key] = n
+            else:
+                self._pins.pop(key, None)
+            self._evict()
+
+    def size_of(self, key: Optional[str]) -> int:
+        return self._sizes.get(key or "", 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "pinned": len(self._pins),
+                "bytes": sum(self._sizes.values()),
+            }
+
+    def _evict(self) -> None:
+        unpinned = [k for k in self._items if k not in self._pins]
+        for k in unpinned[: max(0, len(unpinned) - self.max_unpinned)]:
+            del self._items[k]
+            self._sizes.pop(k, None)
+
+class TopicCache:
+    """Condition -> ResultStore key, so repeated or prefetched topics skip the API call.
+
+    Entries expire after `ttl_seconds`; a key whose payload was evicted from the store
+    counts as a miss. Hits are counted per source ("interactive", "prefetch", "refresh")
+    and per topic (popularity). Each entry carries the content version it was generated
+    with; one that differs from `version` is stale but still served until it is refreshed.
+
+    Entries live in a healthflow.cache backend (in-process LRU by default), and so do
+    compressed copies of their payloads: a payload evicted from the ResultStore is pulled
+    back on next use, and with a shared backend a topic generated by one replica is a hit
+    on every other.
+
+    Expired entries are kept `grace_seconds` longer: they are never served as hits, but
+    last_good() hands them out while the model API is down (see routing.CircuitBreaker).
+    """
+
+    def __init__(self, store: ResultStore, ttl_seconds: float = 24 * 3600, version: str = "",
+                 backend: Optional[Backend] = None, grace_seconds: float = 7 * 24 * 3600):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.grace_seconds = grace_seconds
+        self.version = version
+        self.backend = backend or LRUBackend()
+        self._hits: Dict[str, int] = {}
+        self._popularity: Counter = Counter()   # normalized topic -> hits (this process)
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    # Entries: "t:<normalized topic>" -> [key, source, stored_at, version, label]
+    #          "r:<key>"              -> payload, kept as long as its entry (TTL + grace)
+    def _entry(self, norm: str) -> Optional[list]:
+        raw = self.backend.get("t:" + norm)
+        return loads(raw) if raw else None
+
+    def _fresh(self, entry: list) -> bool:
+        return time.time() - entry[2] < self.ttl_seconds
+
+    def _available(self, entry: Optional[list], expired: bool = False) -> bool:
+        if not entry or not (expired or self._fresh(entry)):
+            return False
+        if self.store.get(entry[0]) is not None:
+            return True
+        raw = self.backend.get("r:" + entry[0])
+        return raw is not None and self.store.put(loads(raw)) == entry[0]
+
+    def get(self, topic: str) -> Optional[str]:
+        norm = normalize(topic)
+        entry = self._entry(norm)
+        if self._available(entry):
+            with self._lock:
+                self._hits[entry[1]] = self._hits.get(entry[1], 0) + 1
+                self._popularity[norm] += 1
+            return entry[0]
+        if entry and not self._available(entry, expired=True):
+            self.backend.delete("t:" + norm)   # payload gone: useless even as a fallback
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def last_good(self, topic: str) -> Optional[Tuple[str, float]]:
+        """(key, age in seconds) of the entry for `topic`, even if expired (within the grace
+        period) — for serving something while the model cannot be reached."""
+        entry = self._entry(normalize(topic))
+        if not self._available(entry, expired=True):
+            return None
+        return entry[0], time.time() - entry[2]
+
+    def peek(self, topic: str) -> Optional[Tuple[str, str]]:
+        """(key, content version) of the unexpired entry for `topic`, without counting a hit."""
+        entry = self._entry(normalize(topic))
+        return (entry[0], entry[3]) if self._available(entry) else None
+
+    def contains(self, topic: str) -> bool:
+        """Like get() but without touching hit/miss counters."""
+        return self._available(self._entry(normalize(topic)))
+
+    def put(self, topic: str, key: str, source: str = "interactive", version: Optional[str] = None) -> None:
+        """`version` defaults to the current one (e.g. prefetches on the current prompt)."""
+        payload = self.store.get(key)
+        if payload is not None:
+            self.backend.set("r:" + key, dumps(thaw(payload)), self.ttl_seconds + self.grace_seconds)
+        entry = [key, source, time.time(), version or self.version, topic]
+        self.backend.set("t:" + normalize(topic), dumps(entry), self.ttl_seconds + self.grace_seconds)
+
+    def _entries(self) -> List[Tuple[str, list]]:
+        """Unexpired entries (those in their grace period only serve as fallbacks)."""
+        entries = ((k[2:], loads(v)) for k, v in self.backend.scan("t:"))
+        return [(n, e) for n, e in entries if self._fresh(e)]
+
+    def _is_stale(self, entry: list) -> bool:
+        # Translations are keyed by their source content, so they follow it automatically
+        return entry[1] != "translation" and entry[3] != self.version
+
+    def is_stale(self, topic: str) -> bool:
+        entry = self._entry(normalize(topic))
+        return bool(entry) and self._is_stale(entry)
+
+    def stale(self, limit: int = 10, exclude: Optional[set] = None) -> List[str]:
+        """Labels of stale topics, most popular first."""
+        with self._lock:
+            popularity = dict(self._popularity)
+        rows = [(popularity.get(n, 0), e[4]) for n, e in self._entries()
+                if self._is_stale(e) and n not in (exclude or ())]
+        rows.sort(key=lambda r: r[0], reverse=True)
+        return [label for _, label in rows[:limit]]
+
+    def rollout(self) -> dict:
+        """How far the current version has spread: by entries and by popularity-weighted traffic."""
+        entries = [(n, e) for n, e in self._entries() if e[1] != "translation"]
+        with self._lock:
+            popularity = dict(self._popularity)
+        versions = Counter(e[3] for _, e in entries)
+        current = versions.get(self.version, 0)
+        traffic = sum(popularity.get(n, 0) for n, _ in entries)
+        fresh_traffic = sum(popularity.get(n, 0) for n, e in entries if e[3] == self.version)
+        return {
+            "versão": self.version,
+            "entradas": len(entries),
+            "atualizadas": current,
+            "desatualizadas": len(entries) - current,
+            "progresso (%)": round(100 * current / len(entries), 1) if entries else 100.0,
+            "progresso ponderado por tráfego (%)": round(100 * fresh_traffic / traffic, 1) if traffic else 100.0,
+            "por versão": dict(versions),
+        }
+
+    def stats(self) -> dict:
+        entries = len(self._entries())
+        with self._lock:
+            return {"entries": entries, "misses": self._misses, **{f"hits_{k}": v for k, v in self._hits.items()}}
+
+# ----------------- Per-session tracking -----------------
+class _SessionEntry:
+    __slots__ = ("last_seen", "result_key", "state_bytes", "buffers", "idle")
+
+    def __init__(self):
+        self.last_seen = time.time()
+        self.result_key: Optional[str] = None
+        self.state_bytes = 0
+        self.buffers: Optional[weakref.ref] = None
+        self.idle = False
+
+class SessionTracker:
+    """Tracks each Streamlit session's shared-result reference and private buffers.
+
+    `sweep()` releases buffers (and the result pin) of sessions idle longer than
+    `idle_seconds`; `report()` gives per-session accounting for capacity planning.
+    """
+
+    def __init__(self, store: ResultStore, idle_seconds: float = 15 * 60,
+                 release: Callable[[Any], None] = lambda obj: obj.release_buffers(),
+                 measure: Callable[[Any], int] = lambda obj: obj.buffer_bytes()):
+        self.store = store
+        self.idle_seconds = idle_seconds
+        self.release = release
+        self.measure = measure
+        self._sessions: Dict[str, _SessionEntry] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+
+    def touch(self, session_id: str, state: Optional[dict] = None, buffers: Any = None) -> None:
+        """Mark activity; call once per rerun with the session's state and buffer owner."""
+        with self._lock:
+            e = self._sessions.get(session_id)
+            if e is None:
+                e = self._sessions[session_id] = _SessionEntry()
+            was_idle, e.idle = e.idle, False
+            e.last_seen = time.time()
+            if buffers is not None:
+                e.buffers = weakref.ref(buffers)
+            if state is not None:
+                e.state_bytes = deep_sizeof(state)
+            if was_idle and e.result_key:
+                # Re-pin what the session still points at, if it survived eviction
+                if self.store.get(e.result_key) is not None:
+                    self.store.pin(e.result_key)
+                else:
+                    e.result_key = None
+        self.sweep()
+
+    def set_result(self, session_id: str, key: Optional[str]) -> None:
+        """Point the session at `key` (pinned); an idle session becomes active again, so the
+        next touch() does not pin it a second time."""
+        with self._lock:
+            e = self._sessions.setdefault(session_id, _SessionEntry())
+            old, e.result_key = e.result_key, key
+            old_pinned = not e.idle
+            e.idle, e.last_seen = False, time.time()
+        if old == key and old_pinned:
+            return
+        if key:
+            self.store.pin(key)
+        if old and old_pinned:
+            self.store.unpin(old)
+
+    def sweep(self, force: bool = False) -> int:
+        """Release idle sessions' buffers; runs at most every 30 s unless forced."""
+        now = time.time()
+        if not force and now - self._last_sweep < 30:
+            return 0
+        self._last_sweep = now
+        released = 0
+        with self._lock:
+            for sid, e in list(self._sessions.items()):
+                owner = e.buffers() if e.buffers else None
+                if owner is None and e.buffers is not None:
+                    # Session object is gone entirely (idle or not) — forget it
+                    del self._sessions[sid]
+                    if e.result_key and not e.idle:
+                        self.store.unpin(e.result_key)
+                    released += 1
+                    continue
+                if e.idle or now - e.last_seen < self.idle_seconds:
+                    continue
+                if owner is not None:
+                    self.release(owner)
+                e.idle = True
+                if e.result_key:
+                    self.store.unpin(e.result_key)
+                released += 1
+        return released
+
+    def report(self) -> List[dict]:
+        """One row per session: private bytes, shared-result bytes, idle time."""
+        now = time.time()
+        rows = []
+        with self._lock:
+            for sid, e in self._sessions.items():
+                owner = e.buffers() if e.buffers else None
+                rows.append({
+                    "sessão": sid[:8],
+                    "inativa (s)": int(now - e.last_seen),
+                    "estado (KB)": round(e.state_bytes / 1024, 1),
+                    "buffers (KB)": round(self.measure(owner) / 1024, 1) if owner is not None else 0.0,
+                    "resultado partilhado (KB)": round(self.store.size_of(e.result_key) / 1024, 1),
+                    "libertada": e.idle,
+                })
+        return rows
@@ -0,0 +1,86 @@
+# revalidate.py
+# Stale-while-revalidate for cached analyses after a prompt or model change
+#
+# TopicCache entries are tagged with the content version they were generated with
+# (analysis.content_version: prompt hash + model id). When the current version changes,
+# old entries keep being served — marked "stale" — while this single background worker
+# regenerates them, most popular first, within its own hourly budget and only when no
+# interactive analysis is running. Nothing is flushed, so a rollout never stampedes the API.
+# Progress: TopicCache.rollout() plus Revalidator.stats().
+
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Tuple
+
+from healthflow.catalog import normalize
+from healthflow.prefetch import SpendBudget
+from healthflow.results import ResultStore, TopicCache
+
+class Revalidator:
+    """Regenerates stale topics in the background.
+
+    `analyze(topic) -> (payload, version)` performs one generation; pass None to disable
+    (e.g. no API key). `wait_idle` blocks while interactive traffic is running.
+    A topic whose refresh failed, or came back on another version (e.g. answered by the
+    fallback model), is retried only after `retry_after_s`.
+    """
+
+    def __init__(self, analyze: Optional[Callable[[str], Tuple[dict, str]]], store: ResultStore,
+                 cache: TopicCache, budget: Optional[SpendBudget] = None,
+                 wait_idle: Optional[Callable[[], None]] = None, retry_after_s: float = 3600):
+        self.analyze = analyze
+        self.store = store
+        self.cache = cache
+        self.budget = budget or SpendBudget(max_calls=60)
+        self.wait_idle = wait_idle
+        self.retry_after_s = retry_after_s
+        self._attempted: Dict[str, float] = {}   # normalized topic -> last attempt
+        self._wake = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._counters: Counter = Counter()
+        self.current: Optional[str] = None
+
+    def notify(self) -> None:
+        """A stale entry was served: make sure the worker is running and awake."""
+        if self.analyze is None:
+            return
+        with self._wake:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="revalidate", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def stats(self) -> dict:
+        return {**self._counters, "em curso": self.current, "orçamento restante": self.budget.remaining()}
+
+    # ----------------- worker -----------------
+    def _next(self) -> Optional[str]:
+        now = time.time()
+        recent = {n for n, t in self._attempted.items() if now - t < self.retry_after_s}
+        stale = self.cache.stale(limit=1, exclude=recent)
+        return stale[0] if stale else None
+
+    def _run(self) -> None:
+        while True:
+            topic = self._next()
+            if topic is None:
+                with self._wake:
+                    self._wake.wait(60)
+                continue
+            if self.wait_idle:
+                self.wait_idle()
+            if not self.budget.try_spend():
+                self._counters["adiados (orçamento)"] += 1
+                time.sleep(self.budget.per_seconds / max(1, self.budget.max_calls))
+                continue
+            self._attempted[normalize(topic)] = time.time()
+            self.current = topic
+            try:
+                payload, version = self.analyze(topic)
+                self.cache.put(topic, self.store.put(payload), source="refresh", version=version)
+                self._counters["atualizados" if version == self.cache.version else "noutra versão"] += 1
+            except Exception:
+                self._counters["erros"] += 1
+            finally:
+                self.current = None
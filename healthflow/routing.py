@@ -0,0 +1,466 @@
+# routing.py
+# Tiered model routing with hedged requests
+#
+# - Requests go to the fast tier first.
+# - If no answer arrives within that model's tracked p95 latency, a duplicate (hedge)
+#   is sent and whichever valid result arrives first wins.
+# - Repeated validation failures move traffic to the next tier for a cool-off period.
+# Every call is recorded in ROUTE_STATS (per model: latency percentiles, hedges, wins,
+# fallbacks, failures) so the effect on p99 and cost is visible.
+# Calls are streamed so time-to-first-token is measured; the chunks are collapsed into
+# one Completion before parsing. A CancelToken installed with cancellable() (background
+# jobs) is checked while waiting and between chunks: cancelling or passing its deadline
+# stops the stream, so the connection and the worker are released promptly.
+# Each model also has a process-wide CircuitBreaker (BREAKERS): when its recent calls fail
+# or crawl, traffic skips it (next tier) and, with every tier open, generate() fails fast
+# with CircuitOpen so the pipeline can serve cached content; recovery is probed with one
+# half-open request at a time.
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+class InvalidResponse(Exception):
+    """The model answered, but the answer failed parsing/validation."""
+    def __init__(self, message: str, text: str = "", truncated: bool = False, model: str = ""):
+        super().__init__(message)
+        self.text = text
+        self.truncated = truncated
+        self.model = model   # the model that produced it (for truncation retries)
+
+class Cancelled(Exception):
+    """The generation was cancelled by the user or ran past its deadline."""
+    def __init__(self, reason: str = "cancelled"):
+        super().__init__("Análise cancelada." if reason == "cancelled" else "Tempo limite da análise excedido.")
+        self.reason = reason
+
+# ----------------- Cancellation -----------------
+class CancelToken:
+    """Cancellation flag plus an optional deadline (time.monotonic())."""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("timeout")
+        return self._event.is_set()
+
+    def check(self) -> None:
+        if self.cancelled:
+            raise Cancelled(self.reason or "cancelled")
+
+_local = threading.local()
+
+def current_token() -> Optional[CancelToken]:
+    return getattr(_local, "token", None)
+
+@contextmanager
+def cancellable(token: Optional[CancelToken]):
+    """Make `token` govern the generations started by this thread."""
+    previous = current_token()
+    _local.token = token
+    try:
+        yield token
+    finally:
+        _local.token = previous
+
+def _wait(fs, timeout: Optional[float], token: Optional[CancelToken], return_when: str = "ALL_COMPLETED"):
+    """concurrent.futures.wait that wakes up to honour `token`."""
+    if token is None:
+        return wait(fs, timeout=timeout, return_when=return_when)
+    end = None if timeout is None else time.monotonic() + timeout
+    while True:
+        token.check()
+        step = 0.2 if end is None else max(0.0, min(0.2, end - time.monotonic()))
+        done, pending = wait(fs, timeout=step, return_when=return_when)
+        if done or (end is not None and time.monotonic() >= end):
+            return done, pending
+
+@dataclass
+class Completion:
+    """A streamed generation collapsed into a single response."""
+    model: str
+    text: str
+    usage_metadata: Any = None
+    finish_reason: Optional[str] = None
+    ttft_s: Optional[float] = None
+    latency_s: float = 0.0
+
+# ----------------- Latency & stats -----------------
+class LatencyTracker:
+    """Sliding window of recent latencies for one model."""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, default: float) -> float:
+        with self._lock:
+            if len(self._samples) < 20:
+                return default
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+class RouteStats:
+    """Process-wide counters per model, shared by every session."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[str, LatencyTracker] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+
+    def tracker(self, model: str) -> LatencyTracker:
+        with self._lock:
+            return self.latency.setdefault(model, LatencyTracker())
+
+    def incr(self, model: str, name: str, n: int = 1) -> None:
+        with self._lock:
+            c = self.counters.setdefault(model, {})
+            c[name] = c.get(name, 0) + n
+
+    def snapshot(self) -> List[dict]:
+        rows = []
+        for model in sorted(set(self.latency) | set(self.counters)):
+            t = self.tracker(model)
+            c = dict(self.counters.get(model, {}))
+            rows.append({
+                "modelo": model,
+                "pedidos": c.get("requests", 0),
+                "hedges": c.get("hedges", 0),
+                "hedge ganhou": c.get("hedge_wins", 0),
+                "fallbacks": c.get("fallbacks", 0),
+                "inválidas": c.get("invalid", 0),
+                "erros": c.get("errors", 0),
+                "p50 (s)": round(t.percentile(50, 0.0), 2),
+                "p95 (s)": round(t.percentile(95, 0.0), 2),
+                "p99 (s)": round(t.percentile(99, 0.0), 2),
+            })
+        return rows
+
+ROUTE_STATS = RouteStats()
+
+# ----------------- Circuit breaker -----------------
+class CircuitOpen(Exception):
+    """Every tier's circuit is open: fail fast instead of waiting on a failing API."""
+    def __init__(self, retry_after: float):
+        super().__init__(f"Serviço de IA temporariamente indisponível. Tente novamente dentro de {int(retry_after) + 1} s.")
+        self.retry_after = retry_after
+
+class CircuitBreaker:
+    """closed -> open when, over the last `window_s`, at least `min_calls` calls were made
+    and `failure_rate` of them failed (API error, or slower than `slow_s`).
+    open -> half-open after `open_s`; half-open lets one probe through at a time, spaced by
+    `probe_interval_s`; `successes` good probes close it, a bad one reopens it for twice as
+    long (up to `max_open_s`)."""
+
+    def __init__(self, window_s: float = 60, min_calls: int = 6, failure_rate: float = 0.5,
+                 slow_s: float = 30.0, open_s: float = 15.0, max_open_s: float = 240.0,
+                 probe_interval_s: float = 2.0, successes: int = 2):
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_s = slow_s
+        self.base_open_s = open_s
+        self.max_open_s = max_open_s
+        self.probe_interval_s = probe_interval_s
+        self.successes = successes
+        self.state = "closed"
+        self._calls: Deque[Tuple[float, bool]] = deque()   # (time, ok)
+        self._open_s = open_s
+        self._opened_at = 0.0
+        self._probing = False
+        self._last_probe = 0.0
+        self._good_probes = 0
+        self._trips = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self, now: float) -> None:
+        if self.state == "open" and now - self._opened_at >= self._open_s:
+            self.state, self._good_probes = "half-open", 0
+
+    def is_open(self) -> bool:
+        """Open and not yet due for a probe (no side effects)."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.state == "open"
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self._open_s - (time.monotonic() - self._opened_at)) if self.state == "open" else 0.0
+
+    def allow(self) -> bool:
+        """May a call go out now? In half-open state this claims the single probe slot."""
+        now = time.monotonic()
+        with self._lock:
+            self._refresh(now)
+            if self.state == "closed":
+                return True
+            if self.state == "half-open" and not self._probing and now - self._last_probe >= self.probe_interval_s:
+                self._probing, self._last_probe = True, now
+                return True
+            self._rejected += 1
+            return False
+
+    def record(self, ok: bool, latency_s: float = 0.0) -> None:
+        ok = ok and latency_s < self.slow_s
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "half-open" and self._probing:
+                self._probing = False
+                if not ok:
+                    self._trip(now, backoff=True)
+                else:
+                    self._good_probes += 1
+                    if self._good_probes >= self.successes:
+                        self.state, self._open_s = "closed", self.base_open_s
+                        self._calls.clear()
+                return
+            if self.state != "closed":
+                return   # a call that started before the trip
+            self._calls.append((now, ok))
+            while self._calls and now - self._calls[0][0] > self.window_s:
+                self._calls.popleft()
+            failures = sum(not c for _, c in self._calls)
+            if len(self._calls) >= self.min_calls and failures >= self.failure_rate * len(self._calls):
+                self._trip(now)
+
+    def release(self) -> None:
+        """A call that ended without a verdict (cancelled): free the probe slot."""
+        with self._lock:
+            self._probing = False
+
+    def _trip(self, now: float, backoff: bool = False) -> None:
+        self._open_s = min(self.max_open_s, self._open_s * 2) if backoff else self.base_open_s
+        self.state, self._opened_at, self._probing = "open", now, False
+        self._trips += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            self._refresh(time.monotonic())
+            failures = sum(not c for _, c in self._calls)
+            return {"estado": self.state, "chamadas": len(self._calls), "falhas": failures,
+                    "aberturas": self._trips, "rejeitadas": self._rejected,
+                    "reabre em (s)": round(max(0.0, self._open_s - (time.monotonic() - self._opened_at)), 1)
+                    if self.state == "open" else 0.0}
+
+class Breakers:
+    """One CircuitBreaker per model, shared by every router in the process."""
+
+    def __init__(self, **settings):
+        self.settings = settings
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(**self.settings)
+            return self._breakers[model]
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            items = sorted(self._breakers.items())
+        return [{"modelo": m, **b.snapshot()} for m, b in items]
+
+BREAKERS = Breakers()
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="gemini")
+
+# ----------------- Router -----------------
+class ModelRouter:
+    """Sends a generation to the right tier, hedging slow calls.
+
+    `parse(completion)` turns a Completion into the final object and raises
+    InvalidResponse when the answer is unusable; the router treats that as a failed
+    candidate and keeps waiting for the other one. `config` may be a callable taking the
+    model id, for settings that differ per tier (cached context, output ceiling).
+    """
+
+    def __init__(self, client: Any, tiers: List[str], *, hedge_default_s: float = 6.0,
+                 hedge_min_s: float = 1.0, max_hedge_ratio: float = 0.15,
+                 invalid_threshold: int = 3, cooloff_s: float = 120.0,
+                 stats: RouteStats = ROUTE_STATS, breakers: Breakers = BREAKERS):
+        self.client = client
+        self.tiers = tiers
+        self.hedge_default_s = hedge_default_s
+        self.hedge_min_s = hedge_min_s
+        self.max_hedge_ratio = max_hedge_ratio
+        self.invalid_threshold = invalid_threshold
+        self.cooloff_s = cooloff_s
+        self.stats = stats
+        self.breakers = breakers
+        self._consecutive_invalid: Dict[str, int] = {}
+        self._demoted_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    # ----------------- tier selection -----------------
+    def pick(self, attempt: int = 0) -> str:
+        """Fast tier unless it is cooling off; each retry after a bad answer moves down a tier.
+        Tiers whose circuit is open are skipped; raises CircuitOpen when none is left."""
+        start = 0
+        now = time.time()
+        while start < len(self.tiers) - 1 and self._demoted_until.get(self.tiers[start], 0) > now:
+            start += 1
+        first = min(start + attempt, len(self.tiers) - 1)
+        for model in self.tiers[first:] + self.tiers[:first]:
+            if self.breakers.get(model).allow():
+                break
+        else:
+            raise CircuitOpen(min(self.breakers.get(m).retry_after() for m in self.tiers))
+        if model != self.tiers[0]:
+            self.stats.incr(model, "fallbacks")
+        return model
+
+    def circuit_open(self) -> bool:
+        """True while every tier's circuit is open (a call would fail fast)."""
+        return all(self.breakers.get(m).is_open() for m in self.tiers)
+
+    def retry_after(self) -> float:
+        return min(self.breakers.get(m).retry_after() for m in self.tiers)
+
+    def _record_invalid(self, model: str) -> None:
+        with self._lock:
+            n = self._consecutive_invalid.get(model, 0) + 1
+            self._consecutive_invalid[model] = n
+            if n >= self.invalid_threshold:
+                self._demoted_until[model] = time.time() + self.cooloff_s
+                self._consecutive_invalid[model] = 0
+
+    def _record_valid(self, model: str) -> None:
+        with self._lock:
+            self._consecutive_invalid[model] = 0
+
+    def _hedge_allowed(self, model: str) -> bool:
+        c = self.stats.counters.get(model, {})
+        return c.get("hedges", 0) < self.max_hedge_ratio * max(1, c.get("requests", 0))
+
+    # ----------------- calls -----------------
+    def _call(self, model: str, contents: Any, config: Any,
+              token: Optional[CancelToken] = None) -> Tuple[Completion, float]:
+        t0 = time.perf_counter()
+        out = Completion(model=model, text="")
+        parts: List[str] = []
+        breaker = self.breakers.get(model)
+        try:
+            cfg = config(model) if callable(config) else config
+        except BaseException:
+            breaker.release()   # nothing went out: no verdict on the model
+            raise
+        try:
+            stream = self.client.models.generate_content_stream(model=model, contents=contents, config=cfg)
+            for chunk in stream:
+                if token is not None and token.cancelled:
+                    getattr(stream, "close", lambda: None)()   # drop the connection
+                    raise Cancelled(token.reason or "cancelled")
+                if out.ttft_s is None:
+                    out.ttft_s = round(time.perf_counter() - t0, 3)
+                parts.append(getattr(chunk, "text", None) or "")
+                if getattr(chunk, "usage_metadata", None) is not None:
+                    out.usage_metadata = chunk.usage_metadata
+                candidates = getattr(chunk, "candidates", None)
+                reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+                if reason is not None:
+                    out.finish_reason = getattr(reason, "name", str(reason))
+        except Cancelled:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(False)
+            raise
+        out.text = "".join(parts)
+        out.latency_s = time.perf_counter() - t0
+        breaker.record(True, out.latency_s)
+        return out, out.latency_s
+
+    def generate(self, contents: Any, config: Any, parse: Callable[[Any], Any],
+                 attempt: int = 0) -> Tuple[Any, dict]:
+        """Return (parsed result, route info). Raises InvalidResponse or the last API error."""
+        model = self.pick(attempt)
+        breaker = self.breakers.get(model)
+        probe = breaker.state == "half-open"   # pick() claimed the probe slot for this call
+        primary: Optional[Future] = None
+        try:
+            tracker = self.stats.tracker(model)
+            self.stats.incr(model, "requests")
+            hedge_after = max(self.hedge_min_s, tracker.percentile(95, self.hedge_default_s))
+            t0 = time.perf_counter()
+            token = current_token()
+            if token is not None:
+                token.check()
+
+            primary = _EXECUTOR.submit(self._call, model, contents, config, token)
+            futures: Dict[Future, str] = {primary: "primary"}
+            try:
+                done, _ = _wait(futures, hedge_after, token)
+                if (not done and self._hedge_allowed(model) and not (token and token.cancelled)
+                        and breaker.state == "closed"):
+                    self.stats.incr(model, "hedges")
+                    futures[_EXECUTOR.submit(self._call, model, contents, config, token)] = "hedge"
+                return self._collect(futures, model, tracker, parse, t0, token)
+            except Cancelled:
+                self.stats.incr(model, "cancelled")
+                for fut in futures:
+                    fut.cancel()
+                raise
+        finally:
+            # _call frees the probe slot itself; if it never ran (cancelled before it was
+            # submitted or started), the slot would stay claimed and the tier stuck half-open
+            if probe and (primary is None or primary.cancelled()):
+                breaker.release()
+
+    def _collect(self, futures: Dict[Future, str], model: str, tracker: LatencyTracker,
+                 parse: Callable[[Any], Any], t0: float, token: Optional[CancelToken]) -> Tuple[Any, dict]:
+        """First valid result among the primary/hedge calls."""
+        pending = set(futures)
+        last_error: Optional[Exception] = None
+        while pending:
+            done, pending = _wait(pending, None, token, return_when=FIRST_COMPLETED)
+            for fut in done:
+                role = futures[fut]
+                try:
+                    resp, latency = fut.result()
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    self.stats.incr(model, "errors")
+                    last_error = e
+                    continue
+                tracker.add(latency)
+                try:
+                    result = parse(resp)
+                except InvalidResponse as e:
+                    self.stats.incr(model, "invalid")
+                    if not e.truncated:  # a too-low ceiling is not the model's fault
+                        self._record_invalid(model)
+                    last_error = e
+                    continue
+                self._record_valid(model)
+                if role == "hedge":
+                    self.stats.incr(model, "hedge_wins")
+                for other in pending:
+                    other.cancel()  # only effective if it has not started yet
+                return result, {
+                    "model": model,
+                    "winner": role,
+                    "hedged": len(futures) > 1,
+                    "latency_s": round(time.perf_counter() - t0, 3),
+                    "ttft_s": resp.ttft_s,
+                }
+        raise last_error or RuntimeError("Sem resposta do modelo")
@@ -0,0 +1,499 @@
+# snapshots.py
+# Materialized per-patient dashboard snapshots — everything pages/dashboard.py shows,
+# derived once per data change (tables as records, Plotly figures as JSON, card text)
+# by a background thread. The page only loads and renders the snapshot.
+
+import json
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, date
+from pathlib import Path
+from typing import Dict, Optional
+
+from healthflow.alerts import AlertEngine, demo_events
+from healthflow.fhir import has_patient, load_patient
+from healthflow.labs import LabStore, TEST_LABELS, _bucket, demo_labs, downsample, latest_grades
+
+# Bump when the snapshot layout or derivation changes, so old snapshots get rebuilt
+BUILDER_VERSION = 2
+
+PATIENT_STORE = os.getenv("HEALTHFLOW_PATIENT_STORE", "data/fhir")
+LAB_STORE = os.getenv("HEALTHFLOW_LAB_STORE", "data/labs")
+SNAPSHOT_DIR = os.getenv("HEALTHFLOW_SNAPSHOT_DIR", "data/snapshots")
+
+# Patient ids double as snapshot file names
+PATIENT_ID_RE = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+# -----------------------#
+#   PLACEHOLDER DATA     #
+# -----------------------#
+DEMO_PATIENT = {
+    "id": "P-001",
+    "name": "Ana Martins",
+    "dob": "1977-05-04",
+    "diagnosis": "Carcinoma da mama (RH+, HER2-), Estádio II (T2N1M0)",
+    "comorbidities": ["Hipertensão arterial", "Dislipidemia"],
+    "allergies": ["Penicilina"],
+    "genomics": {"BRCA1": "Negativo", "BRCA2": "Negativo", "PIK3CA": "Mutação"},
+    "baseline": {"PS": "ECOG 1", "weight_kg": 64.0, "height_cm": 168},
+}
+
+SIDE_EFFECTS = [
+    {"Efeito secundário": "Náuseas e vómitos", "Grau (CTCAE)": "1–2", "Prevenção/gestão": "Antieméticos programados; hidratação; dividir refeições."},
+    {"Efeito secundário": "Alopecia", "Grau (CTCAE)": "2", "Prevenção/gestão": "Touca de arrefecimento (se disponível); aconselhamento; próteses capilares."},
+    {"Efeito secundário": "Neutropenia", "Grau (CTCAE)": "1", "Prevenção/gestão": "Profilaxia com G-CSF; vigilância de febre; medidas de higiene."},
+    {"Efeito secundário": "Neuropatia periférica", "Grau (CTCAE)": "0–1", "Prevenção/gestão": "Monitorização semanal; ajuste de dose se sintomas progredirem."},
+]
+
+DEMO_CONSULTS = [
+    {
+        "Data": "2025-08-02",
+        "Tipo": "Oncologia Médica",
+        "Sumário detalhado": (
+            "Consulta de confirmação diagnóstica com revisão de biópsia (RH+, HER2-), estadiamento clínico T2N1. "
+            "Discussão de objetivos: redução tumoral pré-cirúrgica e preservação de qualidade de vida. "
+            "Apresentado esquema neoadjuvante AC seguido de taxano; consentimento informado obtido."
+        ),
+        "Documento": "Acesso interno: Consulta_Oncologia_2025-08-02",
+    },
+    {
+        "Data": "2025-08-20",
+        "Tipo": "Enfermagem",
+        "Sumário detalhado": (
+            "Sessão de educação terapêutica: preparação para quimioterapia, profilaxia de náuseas, cuidados com cateter, "
+            "lista de sinais de alarme (febre ≥ 38°C; hemorragia; dispneia; dor não controlada) e plano SOS."
+        ),
+        "Documento": "Acesso interno: Consulta_Enfermagem_2025-08-20",
+    },
+    {
+        "Data": "2025-09-10",
+        "Tipo": "Oncologia Médica",
+        "Sumário detalhado": (
+            "Reavaliação após 2 ciclos AC: tolerância globalmente boa (náuseas G1, neutropenia G1). "
+            "Manter antiemese programada; considerar touca de arrefecimento; planear transição para paclitaxel semanal "
+            "após ciclo 4, com vigilância de neuropatia periférica."
+        ),
+        "Documento": "Acesso interno: Consulta_Oncologia_2025-09-10",
+    },
+]
+
+DOCTOR_NOTES = [
+    "Manter hidratação ≥ 2L/dia nos 3 dias pós-infusão; utilizar esquema antiemético conforme instruções impressas.",
+    "Em caso de febre ≥ 38°C, NÃO aguardar: contactar linha direta do serviço e dirigir-se ao SU indicado.",
+    "Evitar aglomerações e contacto com doentes infecciosos durante períodos de neutropenia prevista (Dias +7 a +14).",
+    "Para punhos/solas dormentes (sinais de neuropatia), registar início/gravidade; comunicar se interferir com ADLs.",
+    "Verificar tensão arterial 2–3x/semana devido a hipertensão prévia; levar registo à próxima consulta.",
+]
+
+CARDS = {
+    "disease": """
+**Carcinoma da mama (RH+, HER2-)** caracteriza-se por células tumorais com recetores hormonais positivos e ausência de sobre-expressão HER2.  
+Este subtipo tende a responder a **terapêutica hormonal** e a beneficiar de **quimioterapia** em contextos de maior risco (p.ex., N1).  
+O objetivo clínico engloba **redução tumoral pré-cirúrgica**, **controlo locorregional** e **diminuição do risco de recorrência sistémica**, 
+preservando **qualidade de vida** e função em atividades diárias.
+            """,
+    "mechanisms": """
+A proliferação neoplásica resulta de **desregulação de vias hormonais (ER/PR)** e alterações de sinalização (p.ex., **PI3K/AKT**).  
+A presença de mutação **PIK3CA** pode influenciar sensibilidade a determinadas terapias e requer **monitorização metabólica/neurológica**.  
+A disseminação linfática (N1) justifica uma abordagem **sistémica** precoce para reduzir carga tumoral antes da cirurgia.
+            """,
+    "goals": """
+- **Resposta tumoral objetiva** por critérios **RECIST** até à 1.ª reavaliação  
+- **Toxicidade controlada (≤ Grau 2 CTCAE)** com medidas de suporte adequadas  
+- **Qualidade de vida estável/melhorada** (p.ex., EORTC QLQ-C30)  
+- **Preparação cirúrgica** com potencial para cirurgia conservadora consoante resposta
+            """,
+    "medication": """
+**Esquema atual:** **ddAC → Paclitaxel semanal**  
+**Prescrições ativas (exemplo):**  
+- **Doxorrubicina** — 60 mg/m² IV — q14d (ciclos 1–4, dose-dense)  
+- **Ciclofosfamida** — 600 mg/m² IV — q14d (ciclos 1–4, dose-dense)  
+- **Paclitaxel** — 80 mg/m² IV — semanal (12 semanas)  
+
+**SOS (utilização conforme sintomas):**  
+- **Ondansetrona 8 mg (oral)** — náuseas/vómitos  
+- **Loperamida 2 mg (oral)** — diarreia  
+
+> **Atenção:** Em **febre ≥ 38°C**, **hemorragia ativa** ou **dor não controlada**, contactar imediatamente a equipa.
+        """,
+    "therapy": """
+O regime **dose-dense AC** seguido de **paclitaxel semanal** combina **antraciclinas** e **alquilantes** numa fase inicial,
+maximizando **citotoxicidade** e redução tumoral rápida, e transita para **taxano** para consolidar resposta antes da cirurgia.  
+A estratégia sequencial pretende **aumentar probabilidade de resposta patológica** e facilitar **cirurgia conservadora**.
+        """,
+    "rationale": """
+O perfil **RH+/HER2-** com **N1** beneficia de abordagem **neoadjuvante**.  
+A mutação **PIK3CA** reforça vigilância de **toxicidade metabólica/neurológica**;  
+com **hipertensão** e **dislipidemia**, reforça-se:  
+- Monitorização de **tensão arterial** e **risco cardiovascular** (especial atenção às antraciclinas)  
+- Otimização de **antiemese** e educação para **sinais de alarme**  
+- Apoio nutricional e **atividade física leve** para manter o estado geral
+        """,
+    "notes": """
+- **Hidratação e nutrição:** manter **≥ 2L/dia** nos 3 dias pós-quimioterapia; escolher refeições pequenas e frequentes.  
+- **Antieméticos:** tomar conforme **plano programado** mesmo que as náuseas sejam leves; isto previne agravamento.  
+- **Sinais de alarme:** febre **≥ 38°C**, arrepios, hemorragia, falta de ar, dor torácica ou **dor não controlada** → **contactar de imediato**.  
+- **Atividade física leve:** caminhar 15–20 minutos/dia pode reduzir **fadiga** e melhorar humor/sono.  
+- **Higiene oral:** escova macia, colutório sem álcool; reportar **úlceras** ou dor oral.  
+- **Neuropatia:** se notar formigueiro/dormência que interfira em tarefas (abotoar camisa, segurar objetos), **informar** a equipa.  
+- **Medicação habitual:** trazer lista atualizada e medições de **tensão arterial**; registar valores 2–3x/semana.  
+- **Rede de apoio:** é normal precisar de ajuda; combine tarefas (compras, transportes) com familiares/amigos nos dias pós-infusão.
+        """,
+}
+
+# -----------------------#
+#   DERIVATION           #
+# -----------------------#
+def _timeline_rows(start_date: date) -> list:
+    timeline_rows = []
+
+    # Linha ATUAL (exemplo): ddAC q14d → Paclitaxel semanal
+    # ddAC (Doxorrubicina + Ciclofosfamida) q14d, 4 ciclos
+    for c in range(1, 5):
+        ini = start_date + timedelta(days=14 * (c - 1))
+        fim = ini + timedelta(days=14)
+        timeline_rows.append({
+            "Fase": "Linha atual: ddAC (q14d)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+
+    # Paclitaxel semanal, 12 semanas
+    pac_start = start_date + timedelta(days=14 * 4)  # após 4 ciclos ddAC (8 semanas)
+    for c in range(1, 13):
+        ini = pac_start + timedelta(days=7 * (c - 1))
+        fim = ini + timedelta(days=7)
+        timeline_rows.append({
+            "Fase": "Linha atual: Paclitaxel (semanal)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+
+    # EXEMPLOS ALTERNATIVOS (não aplicados) — mostrados para literacia do doente
+    # Alternativa 1: TC (Docetaxel + Ciclofosfamida) q21d x4
+    for c in range(1, 5):
+        ini = start_date + timedelta(days=21 * (c - 1))
+        fim = ini + timedelta(days=21)
+        timeline_rows.append({
+            "Fase": "Exemplo: TC (q21d)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+
+    # Alternativa 2: EC → D (Epirrubicina + Ciclofosfamida q21d x4 → Docetaxel q21d x4)
+    for c in range(1, 5):
+        ini = start_date + timedelta(days=21 * (c - 1))
+        fim = ini + timedelta(days=21)
+        timeline_rows.append({
+            "Fase": "EC (q21d)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+    ec_end = start_date + timedelta(days=21 * 4)
+    for c in range(1, 5):
+        ini = ec_end + timedelta(days=21 * (c - 1))
+        fim = ini + timedelta(days=21)
+        timeline_rows.append({
+            "Fase": " Docetaxel (q21d)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+
+    # Alternativa 3: AC-T clássico (AC q21d x4 → Paclitaxel semanal x12)
+    for c in range(1, 5):
+        ini = start_date + timedelta(days=21 * (c - 1))
+        fim = ini + timedelta(days=21)
+        timeline_rows.append({
+            "Fase": "AC (q21d)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+    ac_end = start_date + timedelta(days=21 * 4)
+    for c in range(1, 13):
+        ini = ac_end + timedelta(days=7 * (c - 1))
+        fim = ini + timedelta(days=7)
+        timeline_rows.append({
+            "Fase": "Paclitaxel (semanal)",
+            "Ciclo": c,
+            "Início": ini,
+            "Fim": fim
+        })
+    return timeline_rows
+
+_MED_STATUS = {
+    "active": "ativa", "on-hold": "suspensa", "completed": "concluída", "stopped": "interrompida",
+    "cancelled": "cancelada", "draft": "rascunho", "entered-in-error": "registo errado",
+}
+
+def _medication_card(medications: list) -> str:
+    """Prescriptions imported from FHIR MedicationRequest, active ones first."""
+    if not medications:
+        return "Sem prescrições no processo importado (FHIR MedicationRequest)."
+    lines = [
+        f"- **{m['Medicamento'] or '—'}**" + "".join(
+            f" — {v}" for v in (m["Posologia"], _MED_STATUS.get(m["Estado"], m["Estado"])) if v)
+        for m in sorted(medications, key=lambda m: m["Estado"] != "active")
+    ]
+    return (
+        "**Prescrições (processo importado):**  \n" + "  \n".join(lines) + "\n\n"
+        "> **Atenção:** Em **febre ≥ 38°C**, **hemorragia ativa** ou **dor não controlada**, contactar imediatamente a equipa."
+    )
+
+def _history_summary(patient: dict) -> str:
+    return f"""
+**Paciente:** {patient['name']} (ID {patient['id']}), {patient['dob']}.  
+**Diagnóstico:** Carcinoma da mama **RH+ / HER2-**, Estádio **II (T2N1M0)**.  
+**Comorbilidades:** {', '.join(patient['comorbidities'])}. **Alergias:** {', '.join(patient['allergies'])}.  
+**Perfil molecular:** BRCA1/2 negativos; **PIK3CA mutado**.
+
+**Linha terapêutica atual (neoadjuvante):** esquema **dose-dense AC** (q14d, 4 ciclos) seguido de **Paclitaxel semanal** (12 semanas).  
+Até à última reavaliação, a doente completou **3 ciclos ddAC** com **tolerância globalmente boa**: náuseas G1 controladas, **neutropenia G1** sem febre, alopecia esperada; sem neuropatia relevante.  
+**Educação de enfermagem** realizada (cuidados com cateter, plano antiemético, sinais de alarme). **Plano SOS** fornecido.
+
+**Objetivos em curso:** reduzir volume tumoral para otimizar cirurgia conservadora; **limitar toxicidade ≤ G2 (CTCAE)**; manter **qualidade de vida**.  
+**Próximos passos previstos:** completar ddAC, transitar para **Paclitaxel semanal**, re-estadiar por imagem (RECIST) e discutir estratégia cirúrgica; radioterapia e **terapêutica hormonal adjuvante** serão consideradas conforme resposta patológica e risco residual.
+
+**Sinais de segurança reforçados ao doente:** febre **≥ 38°C**, hemorragia, dispneia, dor torácica ou **dor não controlada** → contacto imediato com a equipa.  
+Este resumo agrega decisões clínicas, educação e tolerância terapêutica até à data, servindo de guia para o percurso terapêutico e literacia do doente/família.
+        """
+
+def _figures(timeline_rows: list, labs_ds) -> Dict[str, str]:
+    import pandas as pd
+    import plotly.express as px
+
+    tl_df = pd.DataFrame(timeline_rows)
+    tl_df["Início"] = pd.to_datetime(tl_df["Início"])
+    tl_df["Fim"] = pd.to_datetime(tl_df["Fim"])
+    fig = px.timeline(
+        tl_df,
+        x_start="Início",
+        x_end="Fim",
+        y="Fase",
+        color="Fase",
+        hover_data=["Ciclo"],
+        title="Timeline da terapêutica — linha atual e exemplos (quimioterapia)"
+    )
+    fig.update_yaxes(autorange="reversed")
+    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=420)
+
+    lab_fig = px.line(
+        labs_ds.assign(Análise=labs_ds["test"].map(TEST_LABELS)),
+        x="ts", y="value", facet_row="Análise", color="Análise",
+        labels={"ts": "Data", "value": ""},
+        title="Evolução analítica — hemograma",
+    )
+    lab_fig.update_yaxes(matches=None)
+    lab_fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+    lab_fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=620, showlegend=False)
+    return {"timeline": fig.to_json(), "labs": lab_fig.to_json()}
+
+def build_snapshot(patient_id: str) -> dict:
+    """Derive the full render-ready dashboard state for one patient."""
+    patient = json.loads(json.dumps(DEMO_PATIENT))
+    imported = load_patient(PATIENT_STORE, patient_id) if os.path.isdir(PATIENT_STORE) else None
+    if imported:
+        patient.update({k: imported[k] for k in ("id", "name", "dob", "diagnosis", "comorbidities", "allergies")})
+
+    # Fixed therapy schedule (no inputs)
+    start_date = (datetime.today() - timedelta(days=28)).date()
+    timeline_rows = _timeline_rows(start_date)
+
+    # Análises (hemograma): arquivo colunar se existir, senão série ilustrativa
+    labs = LabStore(LAB_STORE).read_patient(patient["id"])
+    if labs.empty:
+        labs = demo_labs(patient["id"], datetime.combine(start_date, datetime.min.time()) - timedelta(days=872))
+    labs_ds, lab_grades = downsample(labs, 400), latest_grades(labs)
+
+    side_effects = [dict(r) for r in SIDE_EFFECTS]
+    for r in side_effects:
+        if r["Efeito secundário"] == "Neutropenia":
+            r["Grau (CTCAE)"] = str(int(lab_grades.get("neutrofilos", 0)))
+
+    consults = imported["consults"] if imported and imported["consults"] else sorted(
+        DEMO_CONSULTS, key=lambda r: r["Data"], reverse=True
+    )
+
+    # Alertas de toxicidade (motor de regras sobre eventos de sinais vitais/análises/sintomas)
+    last_infusion = datetime.combine(start_date + timedelta(days=14), datetime.min.time())
+    alerts = [
+        {"ts": f"{a.ts:%Y-%m-%d %H:%M}", "severity": a.severity, "message": a.message}
+        for a in AlertEngine().run(demo_events(patient["id"], last_infusion))
+    ]
+
+    cards = dict(CARDS)
+    cards["history"] = _history_summary(patient)
+    if imported:   # the ddAC prescriptions are the demo patient's
+        cards["medication"] = _medication_card(imported["medications"])
+    return {
+        "patient_id": patient_id,
+        "version": source_version(patient_id),
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+        "patient": patient,
+        "metrics": {
+            "Esquema": "ddAC → Paclitaxel",
+            "Ciclos previstos": "4 ddAC + 12 T",
+            "Próxima janela terapêutica": (datetime.today() + timedelta(days=6)).date().isoformat(),
+            "Alergias": ", ".join(patient["allergies"]),
+        },
+        "cards": cards,
+        "tables": {"side_effects": side_effects, "consults": consults},
+        "figures": _figures(timeline_rows, labs_ds),
+        "alerts": alerts,
+    }
+
+def _mtime(path: Path) -> float:
+    """Newest mtime of a directory and its direct children (new parts bump it)."""
+    if not path.exists():
+        return 0.0
+    return max([path.stat().st_mtime] + [p.stat().st_mtime for p in path.iterdir()])
+
+def source_version(patient_id: str) -> str:
+    """Changes whenever any input the snapshot is derived from changes."""
+    parts = [
+        str(BUILDER_VERSION),
+        date.today().isoformat(),  # timeline and "next window" are relative to today
+        f"{_mtime(Path(LAB_STORE) / f'bucket={_bucket(patient_id):02d}'):.0f}",
+    ]
+    parts += [f"{_mtime(Path(PATIENT_STORE) / t):.0f}" for t in ("Patient", "Condition", "AllergyIntolerance", "Encounter", "MedicationRequest")]
+    return "-".join(parts)
+
+# -----------------------#
+#   MATERIALIZER         #
+# -----------------------#
+def check_patient_id(patient_id: str) -> str:
+    """`patient_id` if it is a well-formed id, else ValueError (it becomes a file name)."""
+    if not isinstance(patient_id, str) or not PATIENT_ID_RE.fullmatch(patient_id):
+        raise ValueError(f"ID de doente inválido: {str(patient_id)[:64]!r}")
+    return patient_id
+
+def known_patient(patient_id: str) -> bool:
+    """The demo patient, or one imported into the FHIR store."""
+    return patient_id == DEMO_PATIENT["id"] or (os.path.isdir(PATIENT_STORE) and has_patient(PATIENT_STORE, patient_id))
+
+class SnapshotMaterializer:
+    """Background builder: keeps one snapshot per known patient, rebuilt when its sources change.
+
+    Snapshots live in memory (the `max_patients` most recently viewed; the watcher only
+    polls those) and as JSON under SNAPSHOT_DIR, so a restarted process serves the last
+    good snapshot immediately while a fresh one is built. A failed rebuild keeps the
+    previous snapshot and its error is available from error().
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, poll_seconds: float = 30.0, max_patients: int = 1000):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.poll_seconds = poll_seconds
+        self.max_patients = max_patients
+        self._snapshots: "OrderedDict[str, dict]" = OrderedDict()
+        self._errors: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._pending: set = set()
+        self.builds = 0
+        threading.Thread(target=self._worker, name="snapshot-builder", daemon=True).start()
+        threading.Thread(target=self._watcher, name="snapshot-watcher", daemon=True).start()
+
+    def get(self, patient_id: str) -> Optional[dict]:
+        """Latest snapshot (possibly a version behind); schedules a rebuild if stale.
+        None for a patient never materialized (get_or_build checks and builds those)."""
+        check_patient_id(patient_id)
+        with self._lock:
+            snap = self._snapshots.get(patient_id)
+            if snap is not None:
+                self._snapshots.move_to_end(patient_id)
+        if snap is None:
+            snap = self._load(patient_id)
+        if snap is not None and snap["version"] != source_version(patient_id):
+            self.request(patient_id)
+        return snap
+
+    def get_or_build(self, patient_id: str) -> dict:
+        """Like get(), but builds inline the very first time a patient is seen.
+        Raises ValueError for a malformed id or a patient that does not exist."""
+        snap = self.get(patient_id)
+        if snap is not None:
+            return snap
+        if not known_patient(patient_id):
+            raise ValueError(f"Doente não encontrado: {patient_id}")
+        return self._build(patient_id)
+
+    def error(self, patient_id: str) -> Optional[str]:
+        """Why the last background rebuild of `patient_id` failed (None if it did not)."""
+        with self._lock:
+            return self._errors.get(patient_id)
+
+    def request(self, patient_id: str) -> None:
+        with self._lock:
+            if patient_id in self._pending:
+                return
+            self._pending.add(patient_id)
+        self._queue.put(patient_id)
+
+    # ----------------- internals -----------------
+    def _path(self, patient_id: str) -> Path:
+        return self.root / f"{check_patient_id(patient_id)}.json"
+
+    def _remember(self, patient_id: str, snap: dict, replace: bool = True) -> dict:
+        """Keep `snap` in memory (most recent last), forgetting the least recently viewed."""
+        with self._lock:
+            if replace or patient_id not in self._snapshots:
+                self._snapshots[patient_id] = snap
+            self._snapshots.move_to_end(patient_id)
+            while len(self._snapshots) > self.max_patients:
+                evicted, _ = self._snapshots.popitem(last=False)
+                self._errors.pop(evicted, None)
+            return self._snapshots[patient_id]
+
+    def _load(self, patient_id: str) -> Optional[dict]:
+        p = self._path(patient_id)
+        if not p.exists():
+            return None
+        snap = json.loads(p.read_text(encoding="utf-8"))
+        return self._remember(patient_id, snap, replace=False)
+
+    def _build(self, patient_id: str) -> dict:
+        snap = build_snapshot(patient_id)
+        path = self._path(patient_id)
+        # One temp file per builder: an inline build can overlap the worker's, or another session's
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_text(json.dumps(snap, ensure_ascii=False, default=str), encoding="utf-8")
+            tmp.replace(path)
+        finally:
+            tmp.unlink(missing_ok=True)
+        with self._lock:
+            self.builds += 1
+            self._errors.pop(patient_id, None)
+        return self._remember(patient_id, snap)
+
+    def _worker(self):
+        while True:
+            pid = self._queue.get()
+            try:
+                self._build(pid)
+            except Exception as e:  # keep serving the previous snapshot
+                with self._lock:
+                    if pid in self._snapshots:
+                        self._errors[pid] = f"Falha ao atualizar o resumo ({time.strftime('%H:%M')}): {e}"
+            finally:
+                with self._lock:
+                    self._pending.discard(pid)
+
+    def _watcher(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            with self._lock:
+                known = list(self._snapshots.items())
+            for pid, snap in known:
+                if snap["version"] != source_version(pid):
+                    self.request(pid)
@@ -0,0 +1,86 @@
+# tokens.py
+# Per-request token accounting and the adaptive output-token ceiling
+#
+# Every generation (valid or not) is recorded in TOKEN_LEDGER: input, cached and output
+# tokens, finish reason and time-to-first-token. The output ceiling for the next request
+# follows the observed p95 output size (thinking tokens included) instead of a fixed 2500.
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+DEFAULT_MAX_OUTPUT_TOKENS = 2500
+MIN_OUTPUT_TOKENS = 1024
+MAX_OUTPUT_TOKENS = 8192
+HEADROOM = 1.3          # ceiling = p95(output) * HEADROOM, rounded up to 64
+MIN_SAMPLES = 20
+
+def _count(usage: Any, name: str) -> int:
+    return int(getattr(usage, name, 0) or 0)
+
+class TokenLedger:
+    """Process-wide usage log, one window of recent requests per model."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._rows: Dict[str, Deque[dict]] = {}
+        self._truncated: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, completion: Any, key: Optional[str] = None) -> dict:
+        """Store usage from a routing.Completion (or any response with usage_metadata).
+
+        `key` separates request kinds with different output sizes (e.g. "model#section");
+        it defaults to the model id.
+        """
+        usage = getattr(completion, "usage_metadata", None)
+        row = {
+            "model": key or getattr(completion, "model", "?"),
+            "input": _count(usage, "prompt_token_count"),
+            "cached": _count(usage, "cached_content_token_count"),
+            "output": _count(usage, "candidates_token_count") + _count(usage, "thoughts_token_count"),
+            "finish_reason": getattr(completion, "finish_reason", None),
+            "ttft_s": getattr(completion, "ttft_s", None),
+        }
+        with self._lock:
+            self._rows.setdefault(row["model"], deque(maxlen=self.window)).append(row)
+            if row["finish_reason"] == "MAX_TOKENS":
+                self._truncated[row["model"]] = self._truncated.get(row["model"], 0) + 1
+        return row
+
+    def max_output_tokens(self, model: str) -> int:
+        """Ceiling for the next request to `model` (or ledger key), from observed output sizes."""
+        with self._lock:
+            sizes = sorted(r["output"] for r in self._rows.get(model, ()) if r["finish_reason"] != "MAX_TOKENS")
+        if len(sizes) < MIN_SAMPLES:
+            return DEFAULT_MAX_OUTPUT_TOKENS
+        p95 = sizes[min(len(sizes) - 1, int(0.95 * len(sizes)))]
+        ceiling = -(-int(p95 * HEADROOM) // 64) * 64
+        return max(MIN_OUTPUT_TOKENS, min(MAX_OUTPUT_TOKENS, ceiling))
+
+    def snapshot(self) -> List[dict]:
+        out = []
+        with self._lock:
+            models = {m: list(rows) for m, rows in self._rows.items()}
+            truncated = dict(self._truncated)
+        for model, rows in sorted(models.items()):
+            ttfts = sorted(r["ttft_s"] for r in rows if r["ttft_s"] is not None)
+            n = len(rows)
+            out.append({
+                "modelo": model,
+                "pedidos": n,
+                "entrada (média)": round(sum(r["input"] for r in rows) / n),
+                "em cache (média)": round(sum(r["cached"] for r in rows) / n),
+                "saída (média)": round(sum(r["output"] for r in rows) / n),
+                "truncadas": truncated.get(model, 0),
+                "teto saída": self.max_output_tokens(model),
+                "TTFT p50 (s)": round(ttfts[len(ttfts) // 2], 2) if ttfts else None,
+            })
+        return out
+
+    def last(self, model: str) -> Optional[dict]:
+        with self._lock:
+            rows = self._rows.get(model)
+            return dict(rows[-1]) if rows else None
+
+TOKEN_LEDGER = TokenLedger()
@@ -0,0 +1,151 @@
+# translation.py
+# Multilingual analyses by translating the canonical pt-PT MedicalCards, field by field
+#
+# Analyses are generated once, in pt-PT. Other languages are produced by translating each
+# text field; translations are cached by (language, hash of the source text), so when a
+# source analysis is refreshed only the fields whose text changed go back to the model.
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from healthflow.routing import InvalidResponse, ModelRouter
+from healthflow.tokens import TOKEN_LEDGER
+
+SOURCE_LANG = "pt-PT"
+LANGUAGES = {
+    "pt-PT": "Português (Portugal)",
+    "pt-BR": "Português (Brasil)",
+    "en": "English",
+    "es": "Español",
+}
+
+TRANSLATE_INSTRUCTION = """
+You translate patient-facing medical content written in European Portuguese (pt-PT).
+Input: a target language and a JSON object mapping ids to texts.
+Output ONLY a JSON object with exactly the same ids, each value translated into the target
+language. Keep clinical accuracy and the standard terminology of that locale; do not add,
+drop or merge content; no markdown.
+"""
+
+# ----------------- Flatten / rebuild -----------------
+Path = Tuple[Any, ...]
+
+def flatten(obj: Any, path: Path = ()) -> Dict[Path, str]:
+    """Every non-empty string in a nested payload, keyed by its path."""
+    out: Dict[Path, str] = {}
+    if isinstance(obj, Mapping):
+        for k, v in obj.items():
+            out.update(flatten(v, path + (k,)))
+    elif isinstance(obj, (list, tuple)):
+        for i, v in enumerate(obj):
+            out.update(flatten(v, path + (i,)))
+    elif isinstance(obj, str) and obj.strip():
+        out[path] = obj
+    return out
+
+def rebuild(obj: Any, replace: Dict[Path, str], path: Path = ()) -> Any:
+    """Plain (mutable) copy of `obj` with the strings at the given paths replaced."""
+    if isinstance(obj, Mapping):
+        return {k: rebuild(v, replace, path + (k,)) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [rebuild(v, replace, path + (i,)) for i, v in enumerate(obj)]
+    return replace.get(path, obj)
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+# ----------------- Translator -----------------
+class Translator:
+    """Translates MedicalCards payloads through the model router, caching every field."""
+
+    def __init__(self, router: ModelRouter, max_fields: int = 50_000, batch_size: int = 60):
+        self.router = router
+        self.max_fields = max_fields
+        self.batch_size = batch_size
+        self._fields: "OrderedDict[Tuple[str, str], str]" = OrderedDict()   # (lang, sha1) -> text
+        self._lock = threading.Lock()
+        self.translated_fields = 0
+        self.reused_fields = 0
+        self._local = threading.local()   # tokens spent by the current thread's last translate()
+
+    def translate(self, payload: Mapping, lang: str) -> dict:
+        """`payload` in `lang`; raises if the model cannot produce a complete translation."""
+        if lang == SOURCE_LANG:
+            return rebuild(payload, {})
+        if lang not in LANGUAGES:
+            raise Exception(f"Idioma não suportado: {lang}")
+
+        self._local.tokens = 0
+        fields = flatten(payload)
+        done: Dict[Path, str] = {}
+        missing: Dict[str, str] = {}   # sha1 -> source text (identical texts translated once)
+        with self._lock:
+            for path, text in fields.items():
+                hit = self._fields.get((lang, _digest(text)))
+                if hit is not None:
+                    self._fields.move_to_end((lang, _digest(text)))
+                    done[path] = hit
+                else:
+                    missing[_digest(text)] = text
+        self.reused_fields += len(done)
+
+        items = list(missing.items())
+        for start in range(0, len(items), self.batch_size):
+            self._translate_batch(items[start:start + self.batch_size], lang)
+
+        with self._lock:
+            for path, text in fields.items():
+                if path not in done:
+                    done[path] = self._fields[(lang, _digest(text))]
+        return rebuild(payload, done)
+
+    def _translate_batch(self, batch: List[Tuple[str, str]], lang: str) -> None:
+        ids = {str(i): text for i, (_, text) in enumerate(batch)}
+        contents = f"Target language: {LANGUAGES[lang]} ({lang})\n" + json.dumps(ids, ensure_ascii=False)
+        from google.genai import types  # lazy: keeps the SDK out of page imports
+        cfg = types.GenerateContentConfig(
+            system_instruction=TRANSLATE_INSTRUCTION,
+            temperature=0.0,
+            max_output_tokens=min(8192, 256 + 2 * sum(len(t) for t in ids.values()) // 3),
+            response_mime_type="application/json",
+        )
+
+        def parse(resp) -> Dict[str, str]:
+            usage = TOKEN_LEDGER.record(resp, key=f"{resp.model}#translate")
+            self._local.tokens = getattr(self._local, "tokens", 0) + usage["input"] + usage["output"]
+            try:
+                out = json.loads(resp.text)
+            except ValueError as e:
+                raise InvalidResponse(str(e), resp.text)
+            if not isinstance(out, dict) or set(out) != set(ids) or not all(isinstance(v, str) and v.strip() for v in out.values()):
+                raise InvalidResponse("tradução incompleta", resp.text)
+            return out
+
+        last: Optional[Exception] = None
+        for attempt in range(2):
+            try:
+                out, _ = self.router.generate(contents, cfg, parse=parse, attempt=attempt)
+                break
+            except InvalidResponse as e:
+                last = e
+        else:
+            raise Exception(f"Erro na tradução: {last}")
+
+        with self._lock:
+            for i, (digest, _) in enumerate(batch):
+                self._fields[(lang, digest)] = out[str(i)]
+            while len(self._fields) > self.max_fields:
+                self._fields.popitem(last=False)
+        self.translated_fields += len(batch)
+
+    def last_tokens(self) -> int:
+        """Tokens spent by the last translate() on this thread (for budget accounting)."""
+        return getattr(self._local, "tokens", 0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"campos em cache": len(self._fields), "traduzidos": self.translated_fields,
+                    "reutilizados": self.reused_fields}
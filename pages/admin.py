@@ -0,0 +1,54 @@
+# admin.py
+# Budget administration — who is consuming model generations, per session/user/tenant
+# Registered by the router only when HEALTHFLOW_ADMIN_TOKEN is set; asks for that token.
+
+import hmac
+import json
+import os
+
+import streamlit as st
+
+from healthflow import resources
+from healthflow.governor import SCOPE_LABELS, SCOPES
+
+ADMIN_TOKEN = os.getenv("HEALTHFLOW_ADMIN_TOKEN", "")
+
+st.title("Orçamentos de utilização")
+
+# ----------------- Access -----------------
+if not st.session_state.get("_admin_ok"):
+    token = st.text_input("Token de administração", type="password")
+    if token and ADMIN_TOKEN and hmac.compare_digest(token, ADMIN_TOKEN):
+        st.session_state["_admin_ok"] = True
+        st.rerun()
+    if token:
+        st.error("Token inválido.")
+    st.stop()
+
+governor = resources.current().pipeline.governor
+if governor is None:
+    st.info("O controlo de orçamentos não está ativo neste processo.")
+    st.stop()
+
+# ----------------- Consumption -----------------
+scope = st.radio("Âmbito", ("todos",) + SCOPES, horizontal=True,
+                 format_func=lambda s: SCOPE_LABELS.get(s, "Todos"))
+rows = governor.report(None if scope == "todos" else scope)
+st.caption(f"Janela deslizante de {int(governor.window_s // 60)} min · {len(rows)} identificadores com consumo")
+if rows:
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
+    # Reset one identifier (e.g. after a legitimate burst)
+    labels = {f"{r['âmbito']} · {r['id']}": r for r in rows}
+    picked = st.selectbox("Repor consumo de", list(labels))
+    if st.button("Repor"):
+        row = labels[picked]
+        governor.reset(next(s for s, label in SCOPE_LABELS.items() if label == row["âmbito"]), row["id"])
+        st.toast(f"Consumo reposto: {picked}")
+        st.rerun()
+else:
+    st.info("Sem consumo na janela atual.")
+
+with st.expander("Limites configurados", expanded=False):
+    st.caption("Substitua com um ficheiro JSON em HEALTHFLOW_BUDGETS.")
+    st.code(json.dumps(governor.limits, indent=2, ensure_ascii=False), language="json")
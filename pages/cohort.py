@@ -0,0 +1,84 @@
+# cohort.py
+# Oncology Cohort Overview — reads pre-aggregated summary tables only
+# Raw records are folded into the aggregates on ingest; reruns just slice the summaries.
+
+import streamlit as st
+import plotly.express as px
+from datetime import datetime
+
+from healthflow import resources
+
+
+# -----------------------#
+#   CONFIG & THEME       #
+# -----------------------#
+# Page config, logo and base theme come from the router (app.py)
+
+st.markdown("""
+<style>
+:root { --ink: #0f172a; --muted:#475569; }
+.kpi {
+  border-radius:16px; padding:14px; background:linear-gradient(180deg,#f8fafc, #ffffff);
+  border:1px solid rgba(2,6,23,0.06);
+}
+hr.div { border:none; height:1px; background:linear-gradient(90deg, rgba(2,6,23,0.08), rgba(2,6,23,0)); margin:8px 0 16px; }
+</style>
+""", unsafe_allow_html=True)
+
+# -----------------------#
+#   AGGREGATES (shared)  #
+# -----------------------#
+# One aggregate store per process (built in the background by the router); ingest jobs
+# update it in place
+with st.spinner("A carregar agregados da coorte…"):
+    agg = resources.current().cohort
+
+# -----------------------#
+#        SIDEBAR         #
+# -----------------------#
+st.sidebar.title("Visão da Coorte")
+horizon = st.sidebar.slider("Horizonte de infusões (dias)", 7, 21, 14)
+overdue_limit = st.sidebar.selectbox("Revisões em atraso a listar", [50, 200, 1000], index=1)
+st.sidebar.caption(f"Agregados v{agg.version} • dados ilustrativos")
+
+# -----------------------#
+#        HEADER          #
+# -----------------------#
+today = datetime.today().date()
+st.markdown("## Coorte de Oncologia")
+k1, k2, k3 = st.columns(3)
+with k1:
+    st.metric("Doentes", f"{agg.n_patients:,}".replace(",", " "))
+with k2:
+    upcoming = agg.upcoming_infusions(today, days=7)
+    st.metric("Infusões (próx. 7 dias)", int(upcoming["Infusões"].sum()))
+with k3:
+    st.metric("Revisões em atraso", agg.overdue_count(today))
+
+st.markdown('<hr class="div" />', unsafe_allow_html=True)
+
+# -----------------------#
+#        CHARTS          #
+# -----------------------#
+c1, c2 = st.columns(2)
+with c1:
+    fig = px.bar(agg.phase_table(), x="Fase", y="Doentes", color="Fase",
+                 title="Doentes por fase do esquema")
+    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=380, showlegend=False)
+    st.plotly_chart(fig, use_container_width=True)
+with c2:
+    fig = px.bar(agg.upcoming_infusions(today, days=horizon), x="Dia", y="Infusões",
+                 title=f"Infusões previstas por dia (próx. {horizon} dias)")
+    fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=380)
+    st.plotly_chart(fig, use_container_width=True)
+
+fig = px.bar(agg.grade_table(), x="Efeito secundário", y="Doentes", color="Grau (CTCAE)",
+             barmode="group", title="Distribuição de graus de efeitos secundários (CTCAE)")
+fig.update_layout(margin=dict(l=0, r=0, t=60, b=0), height=420)
+st.plotly_chart(fig, use_container_width=True)
+
+st.markdown("#### Revisões em atraso")
+st.dataframe(agg.overdue_reviews(today, limit=overdue_limit), use_container_width=True, hide_index=True)
+
+st.markdown('<hr class="div" />', unsafe_allow_html=True)
+st.caption("© 2025 HealthFlow (under myLuz)— Visão de coorte ilustrativa. Dados fictícios.")
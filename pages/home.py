@@ -1,36 +1,13 @@
-# app.py
+# home.py
 # Healthflow Landing Page - Beautiful entry point with mission statement
+# Page config, fonts and theme variables come from the router (app.py).
 
 import streamlit as st
 from datetime import datetime
 
-BRAND = "#0295a8"
-ACCENT = "#10b981"
-
-st.set_page_config(
-    page_title="Healthflow | Informação Médica Clara",
-    page_icon="🩺",
-    layout="wide",
-    initial_sidebar_state="collapsed"
-)
-
 # Custom CSS for beautiful landing page
 st.markdown(f"""
 <style>
-@import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600;700;800&display=swap');
-
-:root {{
-  --brand: {BRAND};
-  --accent: {ACCENT};
-  --ink: #0f172a;
-  --muted: #64748b;
-  --bg-soft: #f8fafc;
-}}
-
-* {{
-  font-family: 'Inter', -apple-system, BlinkMacSystemFont, sans-serif;
-}}
-
 html, body, [data-testid="stAppViewContainer"] {{
   background: linear-gradient(135deg, #ffffff 0%, #f1f5f9 100%);
 }}
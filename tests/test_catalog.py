@@ -0,0 +1,34 @@
+import pytest
+
+from healthflow.catalog import load_catalog
+
+CATALOG = load_catalog()
+
+
+@pytest.mark.parametrize("query", [
+    "asma no tempo frio",
+    "hipertensão e viagem de avião",
+    "dor no joelho depois do jogo",
+    "enxaqueca e musica alta",
+    "diabetes em restaurante",
+    "tempo de coagulação prolongado",
+])
+def test_mixed_clinical_queries_reach_the_model(query):
+    ok, reason = CATALOG.classify(query)
+    assert ok, reason
+
+
+@pytest.mark.parametrize("query", [
+    "resultado do jogo do benfica",
+    "previsão do tempo para amanhã",
+    "receita de bacalhau",
+    "https://example.com",
+])
+def test_off_topic_queries_are_rejected(query):
+    ok, _ = CATALOG.classify(query)
+    assert not ok
+
+
+def test_unknown_words_fall_through():
+    assert CATALOG.classify("fibrodisplasia ossificante progressiva")[0]
+    assert CATALOG.classify("xyzzy")[1] == "desconhecido"
@@ -0,0 +1,46 @@
+import gc
+
+from healthflow.results import ResultStore, SessionTracker
+
+
+class _Buffers:
+    def __init__(self):
+        self.released = False
+
+    def release_buffers(self):
+        self.released = True
+
+    def buffer_bytes(self):
+        return 0
+
+
+def test_sweep_forgets_idle_session_whose_owner_is_gone():
+    store = ResultStore()
+    tracker = SessionTracker(store, idle_seconds=0)
+    owner = _Buffers()
+    tracker.touch("s1", buffers=owner)
+    tracker.set_result("s1", store.put({"condition": "asma"}))
+
+    tracker.sweep(force=True)
+    assert owner.released
+    assert len(tracker.report()) == 1   # idle, still tracked
+
+    del owner
+    gc.collect()
+    tracker.sweep(force=True)
+    assert tracker.report() == []
+
+
+def test_sweep_forgets_active_session_whose_owner_is_gone():
+    store = ResultStore()
+    tracker = SessionTracker(store, idle_seconds=3600)
+    owner = _Buffers()
+    key = store.put({"condition": "asma"})
+    tracker.touch("s1", buffers=owner)
+    tracker.set_result("s1", key)
+
+    del owner
+    gc.collect()
+    tracker.sweep(force=True)
+    assert tracker.report() == []
+    assert store.stats()["pinned"] == 0